@@ -0,0 +1,164 @@
+#!/usr/bin/python
+
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""Microbenchmark for the DVD command decoder and compiler.
+
+Runs a command block looping over general purpose registers, in the
+style of the pre-commands found in many menu program chains, both
+through the `CommandDecoder` and through the `CommandCompiler`, and
+prints the resulting command rates. Compiled commands are run both
+through the scheduler (generator mode) and synchronously (sync
+mode).
+
+Run it from the top source directory, after building the dvdread
+module::
+
+    python bench/cmdbench.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import itersched
+from itersched import Call, NoOp, restartPoint
+
+from machine import machine, decode, compiler
+
+
+# Loop count used inside the command block.
+LOOP_COUNT = 100
+
+class CommandList(object):
+    """A stand-in for `dvdread.CommandSet`."""
+
+    __slots__ = ('commands',)
+
+    def __init__(self, commands):
+        self.commands = commands
+
+    count = property(lambda self: len(self.commands))
+
+    def get(self, commandNr):
+        if not 1 <= commandNr <= len(self.commands):
+            raise IndexError, "command number out of range"
+
+        return self.commands[commandNr - 1]
+
+loopBlock = CommandList((
+    (0x71, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00), # Mov GPRM0, 0
+    (0x71, 0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00), # Mov GPRM1, 0
+    (0x73, 0x00, 0x00, 0x01, 0x00, 0x01, 0x00, 0x00), # Add GPRM1, 1
+    (0x63, 0x00, 0x00, 0x00, 0x00, 0x01, 0x00, 0x00), # Add GPRM0, GPRM1
+    (0x00, 0xf1, 0x00, 0x01,
+     LOOP_COUNT >> 8, LOOP_COUNT & 0xff, 0x00, 0x03), # if GPRM1 < n goto 3
+    (0x79, 0x00, 0x00, 0x03, 0x00, 0xff, 0x00, 0x00), # And GPRM3, 0xff
+    ))
+
+# Number of commands executed by a single run of the block.
+BLOCK_LENGTH = 3 + 3 * LOOP_COUNT
+
+
+class DecodingBlockPlayer(object):
+    """A command block player using the command decoder.
+
+    This is the command block player as it was before the compiler
+    was introduced."""
+
+    __slots__ = ('decoder',
+                 'commands',
+                 'commandNr')
+
+    def __init__(self, machine):
+        self.decoder = decode.CommandDecoder(machine)
+
+        self.commands = None
+        self.commandNr = 0
+
+    @restartPoint
+    def playBlock(self, commands, commandNr=1):
+        self.commands = commands
+        yield itersched.Chain(self.goto(commandNr))
+
+    @restartPoint
+    def goto(self, commandNr):
+        self.commandNr = commandNr
+
+        while self.commandNr <= self.commands.count:
+            yield Call(self.decoder.performCommand( \
+                self.commands.get(self.commandNr)))
+
+            self.commandNr += 1
+
+    @restartPoint
+    def brk(self):
+        yield NoOp
+
+
+class BenchInfo(object):
+    """A stand-in for `dvdread.DVDInfo`."""
+
+    videoManager = None
+
+
+def runBlock(player, commands):
+    for cmd in itersched.Scheduler(player.playBlock(commands)):
+        pass
+
+def bench(name, player, iterations):
+    start = time.time()
+    for i in xrange(iterations):
+        runBlock(player, loopBlock)
+    elapsed = time.time() - start
+
+    rate = iterations * BLOCK_LENGTH / elapsed
+    print '%-10s %8.3f s %12.0f commands/s' % (name, elapsed, rate)
+    return rate
+
+def main(args):
+    if len(args) > 1:
+        iterations = int(args[1])
+    else:
+        iterations = 200
+
+    vm = machine.VirtualMachine(BenchInfo())
+
+    decoded = bench('decoder', DecodingBlockPlayer(vm), iterations)
+    result = [r.getValue() for r in vm.generalRegisters[:4]]
+
+    vm.compiler = compiler.CommandCompiler(vm, sync=False)
+    generator = bench('generator', machine.CommandBlockPlayer(vm),
+                      iterations)
+    assert [r.getValue() for r in vm.generalRegisters[:4]] == result, \
+           'Compiled block produced different register values'
+
+    vm.compiler = compiler.CommandCompiler(vm)
+    sync = bench('sync', machine.CommandBlockPlayer(vm), iterations)
+    assert [r.getValue() for r in vm.generalRegisters[:4]] == result, \
+           'Synchronous block produced different register values'
+
+    print 'speedup (generator): %.2fx' % (generator / decoded)
+    print 'speedup (sync): %.2fx' % (sync / decoded)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""Stress test for the blocking operations in the dvdread module.
+
+Worker threads open the disc and parse its information files over and
+over again, and read blocks from its VOB files through a single shared
+`BlockReader`, so that its lock is exercised as well. In the
+meantime, the main thread plays the role of the user interface: it
+wakes up periodically, does a small amount of work, and measures how
+late every wake up was. Since the dvdread module releases the
+global interpreter lock while blocking on the drive, stalls should
+stay close to the idle baseline, which is measured first.
+
+For meaningful results use a real drive, and flush the system's
+caches (or eject and reinsert the disc) before running::
+
+    python bench/ifostress.py [options] DEVICE
+"""
+
+import os
+import sys
+import time
+import threading
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import dvdread
+
+
+# Interval between user interface wake ups, in seconds.
+TICK = 0.01
+
+# Number of blocks read from every title set VOB file.
+BLOCK_COUNT = 64
+
+# Number of worker threads.
+WORKER_COUNT = 2
+
+
+def uiLoop(duration, stop=None):
+    """Simulate the user interface thread for 'duration' seconds, or
+    until the event 'stop' is set, and return a list with the delay
+    of every wake up, in seconds."""
+    delays = []
+    end = time.time() + duration
+    expected = time.time() + TICK
+    while time.time() < end and (stop == None or not stop.isSet()):
+        time.sleep(max(expected - time.time(), 0))
+        now = time.time()
+        delays.append(now - expected)
+
+        # Some work, as done when redrawing or handling an event.
+        sum(range(1000))
+
+        expected = now + TICK
+
+    return delays
+
+def worker(location, reader, rounds, stats):
+    """Parse the information files of the disc at 'location' and read
+    blocks from its VOB files, using the `BlockReader` 'reader',
+    'rounds' times."""
+    for i in range(rounds):
+        start = time.time()
+        info = dvdread.DVDInfo(location, prefetch=False)
+        vmg = info.videoManager
+        for titleSetNr in range(1, vmg.videoTitleSetCount + 1):
+            vmg.getVideoTitleSet(titleSetNr)
+        stats['parse'] += time.time() - start
+
+        start = time.time()
+        for titleSetNr in range(1, vmg.videoTitleSetCount + 1):
+            try:
+                for sectorNr in range(BLOCK_COUNT):
+                    reader.read(dvdread.DOMAIN_TITLE, titleSetNr,
+                                sectorNr)
+            except (IOError, dvdread.DVDReadError):
+                # Title sets without title VOBs exist.
+                pass
+        stats['read'] += time.time() - start
+        stats['rounds'] += 1
+
+def runWorkers(location, rounds, stats, stop):
+    """Run WORKER_COUNT worker threads sharing a single `BlockReader`,
+    and set the event 'stop' when all of them are done. Statistics
+    for every worker are appended to the list 'stats'."""
+    try:
+        reader = dvdread.BlockReader(location)
+        threads = []
+        for i in range(WORKER_COUNT):
+            workerStats = {'rounds': 0, 'parse': 0.0, 'read': 0.0}
+            stats.append(workerStats)
+            thread = threading.Thread(None, worker, 'Worker %d' % i,
+                                      (location, reader, rounds,
+                                       workerStats))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
+
+def report(name, delays):
+    delays = sorted(delays)
+    if delays == []:
+        print '%-10s %6d' % (name, 0)
+        return
+    print '%-10s %6d %10.3f %10.3f %10.3f' % \
+          (name, len(delays),
+           sum(delays) / len(delays) * 1000,
+           delays[int(len(delays) * 0.99)] * 1000,
+           delays[-1] * 1000)
+
+def main(args):
+    optParser = OptionParser()
+    optParser.set_usage('Usage: %prog [options] DEVICE')
+    optParser.add_option("--rounds", dest="rounds", type="int",
+                         help="number of times the disc is parsed",
+                         default=10)
+    optParser.add_option("--baseline", dest="baseline", type="float",
+                         help="seconds to measure the idle baseline",
+                         default=2.0)
+    (options, args) = optParser.parse_args(args[1:])
+    if len(args) != 1:
+        optParser.error("no DVD device specified")
+
+    print '%-10s %6s %10s %10s %10s' % \
+          ('phase', 'ticks', 'avg ms', '99% ms', 'max ms')
+
+    report('idle', uiLoop(options.baseline))
+
+    stats = []
+    stop = threading.Event()
+    thread = threading.Thread(None, runWorkers, 'Workers',
+                              (args[0], options.rounds, stats, stop))
+    thread.start()
+    report('stress', uiLoop(sys.maxint, stop))
+    thread.join()
+
+    print
+    for workerStats in stats:
+        print '%d rounds, %.3f s parsing, %.3f s reading' % \
+              (workerStats['rounds'], workerStats['parse'],
+               workerStats['read'])
+
+if __name__ == '__main__':
+    main(sys.argv)
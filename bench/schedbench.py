@@ -0,0 +1,181 @@
+#!/usr/bin/python
+
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""Microbenchmark for the restart support in the iterator scheduler.
+
+Stacks player objects shaped like the ones in the virtual machine
+(classes with a few dozen methods) and measures:
+
+call
+    Calling a restart point method and returning from it, the hot
+    path during playback.
+restart
+    Restarting a method of an instance below a stack of players.
+lookup
+    Finding the instance providing a method below a stack of
+    players, as done when retrieving machine state.
+mixed
+    Calls, lookups and restarts in the proportions seen while playing
+    a disc.
+
+Run it from the top source directory::
+
+    python bench/schedbench.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import itersched
+from itersched import Call, Restart, NoOp, restartPoint
+
+
+# Number of players stacked above the restart target or state
+# provider.
+STACK_DEPTH = 6
+
+# Number of plain methods in every player class.
+METHOD_COUNT = 30
+
+# Calls performed for every lookup and restart in the mixed run.
+CALLS_PER_RESTART = 50
+
+
+def addMethods(cls):
+    """Add METHOD_COUNT plain methods to class 'cls'."""
+    for i in range(METHOD_COUNT):
+        setattr(cls, 'method%d' % i, lambda self: None)
+    return cls
+
+
+class Player(object):
+    """A player stacked above the target."""
+
+    __slots__ = ()
+
+    @restartPoint
+    def run(self, body):
+        for op in body:
+            yield op
+
+    @restartPoint
+    def leaf(self):
+        yield NoOp
+
+    @restartPoint
+    def stack(self, depth, body):
+        if depth > 0:
+            yield Call(Player().stack(depth - 1, body))
+        else:
+            yield Call(self.run(body))
+
+addMethods(Player)
+
+
+class TargetPlayer(Player):
+    """A player providing state and a restart target."""
+
+    __slots__ = ()
+
+    @restartPoint
+    def restartTarget(self):
+        yield NoOp
+
+    def provider(self):
+        return None
+
+addMethods(TargetPlayer)
+
+
+def runTimed(name, count, makeBody):
+    """Run the iterator returned by 'makeBody' in a new scheduler,
+    and print the rate of operations, given that 'count' operations
+    are performed.
+
+    'makeBody' is called with the scheduler as parameter."""
+    target = TargetPlayer()
+    holder = []
+    def root():
+        for op in makeBody(holder[0]):
+            yield op
+
+    sched = itersched.Scheduler(target.stack(STACK_DEPTH, root()))
+    holder.append(sched)
+
+    start = time.time()
+    for value in sched:
+        pass
+    elapsed = time.time() - start
+
+    print '%-10s %8.3f s %12.0f ops/s' % (name, elapsed, count / elapsed)
+    return elapsed
+
+def callBody(count):
+    def body(sched):
+        player = Player()
+        for i in xrange(count):
+            yield Call(player.leaf())
+    return body
+
+def restartBody(count):
+    def body(sched):
+        for i in xrange(count):
+            yield Call(TargetPlayer().
+                       stack(STACK_DEPTH, iter((Restart.restartTarget(),))))
+    return body
+
+def lookupBody(count):
+    def body(sched):
+        for i in xrange(count):
+            sched.findRestartable('provider')
+            yield NoOp
+    return body
+
+def mixedBody(count):
+    def body(sched):
+        player = Player()
+        for i in xrange(count / CALLS_PER_RESTART):
+            for j in xrange(CALLS_PER_RESTART):
+                yield Call(player.leaf())
+            sched.findRestartable('provider')
+            yield Call(TargetPlayer().
+                       stack(STACK_DEPTH, iter((Restart.restartTarget(),))))
+    return body
+
+def main(args):
+    if len(args) > 1:
+        iterations = int(args[1])
+    else:
+        iterations = 100000
+
+    total = 0.0
+    total += runTimed('call', iterations, callBody(iterations))
+    total += runTimed('restart', iterations / 10,
+                      restartBody(iterations / 10))
+    total += runTimed('lookup', iterations, lookupBody(iterations))
+    total += runTimed('mixed', iterations, mixedBody(iterations))
+    print '%-10s %8.3f s' % ('total', total)
+
+if __name__ == '__main__':
+    main(sys.argv)
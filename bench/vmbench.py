@@ -0,0 +1,217 @@
+#!/usr/bin/python
+
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""Disc navigation benchmark for the DVD virtual machine.
+
+Runs the virtual machine through the headless driver (no GStreamer
+needed) in a number of navigation scenarios, and prints the machine
+commands processed per second, the scheduler stack depth and the
+machine time per VOBU for each of them. The scenarios are:
+
+firstplay
+    Play from the first play program chain until a title is playing,
+    activating the selected button in every menu on the way.
+chapters
+    Skip forward through the chapters of the title.
+menus
+    Call the root menu, select every button in it and resume the
+    title.
+
+Navigation packets are read from the disc, or from a trace file
+recorded with the --record option. Trace files contain the disc's
+information files as well, so that no disc is needed to replay them.
+With the --profile option, the time spent in every generator run by
+the machine's scheduler is reported as well. Run it from the top
+source directory, after building the dvdread module::
+
+    python bench/vmbench.py [options] DEVICE
+    python bench/vmbench.py [options] --trace FILE
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import dvdread
+import itersched
+from itersched import Call
+
+from machine import machine, headless
+
+
+# Maximum number of menus to go through before reaching a title.
+MAX_MENUS = 20
+
+# Number of VOBUs to play after every navigation step.
+STEP_VOBUS = 10
+
+# Number of functions listed in the profile report.
+PROFILE_LIMIT = 25
+
+
+def inTitle(vm):
+    return vm.currentTitle() != None and not vm.inMenu()
+
+def confirm(vm):
+    """Activate the currently selected button."""
+    btnObj = vm.getButtonObj()
+    if btnObj == None:
+        return
+
+    yield Call(vm.buttonCommand(btnObj.command))
+
+def nextProgram(vm):
+    """Skip to the next program (chapter)."""
+    cell = vm.currentCell()
+    if cell == None:
+        return
+
+    newProgram = cell.programNr + 1
+    if newProgram > cell.programChain.programCount:
+        yield Call(vm.linkTailProgramChain())
+    else:
+        yield Call(vm.linkProgram(newProgram))
+
+
+def firstPlay(driver, options):
+    vm = driver.machine
+    for i in range(MAX_MENUS):
+        if not driver.run(condition=lambda: inTitle(vm)):
+            return
+        if inTitle(vm):
+            break
+
+        # Waiting in a menu.
+        driver.runInteractive(confirm(vm))
+
+    driver.run(maxVobus=STEP_VOBUS)
+
+def chapters(driver, options):
+    vm = driver.machine
+    for i in range(options.steps):
+        if not inTitle(vm):
+            break
+        driver.runInteractive(nextProgram(vm))
+        driver.run(maxVobus=STEP_VOBUS)
+
+def menus(driver, options):
+    vm = driver.machine
+    if not inTitle(vm):
+        return
+
+    driver.runInteractive(vm.callMenu(dvdread.MENU_TYPE_ROOT, 0))
+    driver.run(maxVobus=STEP_VOBUS)
+
+    if vm.buttonNav != None:
+        for buttonNr in range(1, vm.buttonNav.buttonCount + 1):
+            driver.runInteractive(vm.selectButton(buttonNr))
+            driver.run(maxVobus=1)
+
+    driver.runInteractive(vm.resume())
+    driver.run(maxVobus=STEP_VOBUS)
+
+scenarios = (('firstplay', firstPlay),
+             ('chapters', chapters),
+             ('menus', menus))
+
+
+def run(info, navSource, options):
+    vm = machine.VirtualMachine(info)
+    vm.setRegion(options.region)
+    driver = headless.HeadlessDriver(vm, navSource)
+    if options.profile != None:
+        vm.sched.profile = itersched.SchedulerProfile()
+
+    print '%-10s %8s %6s %12s %6s %6s %12s' % \
+          ('scenario', 'commands', 'vobus', 'commands/s', 'depth',
+           'max', 'ms/vobu')
+    for (name, scenario) in scenarios:
+        driver.resetStats()
+        scenario(driver, options)
+
+        stats = driver.getStats()
+        print '%-10s %8d %6d %12.0f %6.2f %6d %12.3f' % \
+              (name, stats['commands'], stats['vobus'],
+               stats['opsPerSecond'], stats['avgDepth'],
+               stats['maxDepth'], stats['timePerVobu'] * 1000)
+
+    if options.record != None:
+        navSource.save(options.record)
+
+    if options.profile != None:
+        print
+        vm.sched.profile.report(limit=PROFILE_LIMIT)
+        vm.sched.profile.dumpStats(options.profile)
+
+def main(args):
+    optParser = OptionParser()
+    optParser.set_usage('Usage: %prog [options] DEVICE\n'
+                        '       %prog [options] --trace FILE')
+    optParser.add_option("--trace", dest="trace",
+                         metavar="FILE",
+                         help="read navigation packets from trace FILE")
+    optParser.add_option("--record", dest="record",
+                         metavar="FILE",
+                         help="record navigation packets in trace FILE")
+    optParser.add_option("--steps", dest="steps", type="int",
+                         help="number of chapter skips", default=10)
+    optParser.add_option("--region", dest="region", type="int",
+                         help="player region", default=0)
+    optParser.add_option("--profile", dest="profile",
+                         metavar="FILE",
+                         help="profile the machine scheduler and write "
+                         "pstats data to FILE")
+    (options, args) = optParser.parse_args(args[1:])
+    if options.trace != None:
+        if len(args) != 0:
+            optParser.error("no DVD device allowed when using a trace")
+    elif len(args) != 1:
+        optParser.error("no DVD device specified")
+
+    infoDir = None
+    try:
+        if options.trace != None:
+            navSource = headless.TraceNavSource(options.trace)
+            infoFiles = navSource.infoFiles
+
+            # Open the information files from the trace.
+            infoDir = tempfile.mkdtemp(prefix='vmbench')
+            headless.writeInfoFiles(infoFiles, infoDir)
+            info = dvdread.DVDInfo(infoDir)
+        else:
+            navSource = headless.DiscNavSource(args[0])
+            info = dvdread.DVDInfo(args[0])
+            if options.record != None:
+                infoFiles = headless.readInfoFiles(args[0], info)
+        if options.record != None:
+            navSource = headless.RecordingNavSource(navSource, infoFiles)
+
+        run(info, navSource, options)
+    finally:
+        if infoDir != None:
+            shutil.rmtree(infoDir, True)
+
+if __name__ == '__main__':
+    main(sys.argv)
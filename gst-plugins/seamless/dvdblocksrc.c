@@ -33,7 +33,74 @@ GST_DEBUG_CATEGORY_STATIC (dvdblocksrc_debug);
 #define DVDBLOCKSRC_BLOCK_SIZE 2048
 
 /* Number of 2048 byte blocks in the read buffer. */
-#define DVDBLOCKSRC_MAX_BUF_SIZE 1
+#define DVDBLOCKSRC_MAX_BUF_SIZE 16
+
+/* Maximum number of buffers kept for reuse. */
+#define DVDBLOCKSRC_POOL_SIZE 32
+
+/* Maximum number of VOBUs that can be read in advance. */
+#define DVDBLOCKSRC_MAX_READ_AHEAD 16
+
+/* Default number of VOBUs read in advance. */
+#define DVDBLOCKSRC_DEFAULT_READ_AHEAD 2
+
+/* Default maximum size of the VOBU cache in bytes. */
+#define DVDBLOCKSRC_DEFAULT_CACHE_SIZE (16 * 1024 * 1024)
+
+/* Number of blocks read at once by the read-ahead thread. */
+#define DVDBLOCKSRC_READ_AHEAD_CHUNK 32
+
+/* Offsets of the VOBU start and end presentation times and the
+   highlight status in a VOBU header block (in the PCI packet). */
+#define DVDBLOCKSRC_VOBU_S_PTM_OFFSET 0x39
+#define DVDBLOCKSRC_VOBU_E_PTM_OFFSET 0x3d
+#define DVDBLOCKSRC_HLI_SS_OFFSET 0x8e
+
+/* Offsets of the VOBU end address, the next video VOBU and next VOBU
+   pointers, and the first audio packet offsets in a VOBU header block
+   (in the DSI packet). */
+#define DVDBLOCKSRC_VOBU_EA_OFFSET 0x40f
+#define DVDBLOCKSRC_NEXT_VIDEO_OFFSET 0x4f1
+#define DVDBLOCKSRC_NEXT_VOBU_OFFSET 0x541
+#define DVDBLOCKSRC_A_SYNCA_OFFSET 0x599
+
+
+/* A VOBU read in advance. */
+typedef struct _DVDBlockSrcVobu DVDBlockSrcVobu;
+
+struct _DVDBlockSrcVobu {
+  int title_num;
+  dvd_read_domain_t domain;
+  int vobu_start;
+  GstBuffer *buf;	/* Contents of the whole VOBU, header included. */
+};
+
+
+/* A buffer whose memory goes back to the pool of its source element
+   when released. */
+#define DVDBLOCKSRC_TYPE_BUFFER (dvdblocksrc_buffer_get_type())
+
+typedef struct _DVDBlockSrcBuffer DVDBlockSrcBuffer;
+
+struct _DVDBlockSrcBuffer {
+  GstBuffer buffer;
+
+  DVDBlockSrc *src;	/* Element owning the buffer. */
+};
+
+static GstMiniObjectClass *dvdblocksrc_buffer_parent_class = NULL;
+
+
+/* A VOBU in the cache. */
+typedef struct _DVDBlockSrcCacheEntry DVDBlockSrcCacheEntry;
+
+struct _DVDBlockSrcCacheEntry {
+  int title_num;
+  dvd_read_domain_t domain;
+  int vobu_start;
+  GstBuffer *buf;	/* Contents of the whole VOBU, header included. */
+  GList *link;		/* Link in the LRU list. */
+};
 
 
 /* ElementFactory information. */
@@ -48,6 +115,7 @@ static GstElementDetails dvdblocksrc_details = GST_ELEMENT_DETAILS (
 enum {
   VOBU_READ_SIGNAL,
   VOBU_HEADER_SIGNAL,
+  FOLLOW_END_SIGNAL,
   EVENT_SIGNAL,
   DO_SEEK_SIGNAL,
   LAST_SIGNAL,
@@ -60,6 +128,19 @@ enum {
   PROP_DOMAIN,
   PROP_VOBU_START,
   PROP_CANCEL_VOBU,
+  PROP_READ_AHEAD,
+  PROP_CACHE_SIZE,
+  PROP_CACHE_USED,
+  PROP_CACHE_HITS,
+  PROP_CACHE_MISSES,
+  PROP_BUFFERS_ALLOCATED,
+  PROP_BUFFERS_RECYCLED,
+  PROP_FOLLOW_END,
+  PROP_SEGMENT_START,
+  PROP_SEGMENT_STOP,
+  PROP_AUDIO_STREAM,
+  PROP_VOBU_OFFSET,
+  PROP_LAST_HEADER,
 };
 
 
@@ -90,6 +171,8 @@ dvdblocksrc_class_init (DVDBlockSrcClass *klass);
 static void
 dvdblocksrc_finalize (GObject *object);
 
+static gboolean
+dvdblocksrc_start (GstBaseSrc * bsrc);
 static gboolean
 dvdblocksrc_stop (GstBaseSrc * bsrc);
 
@@ -117,7 +200,60 @@ dvdblocksrc_close_root (DVDBlockSrc *src);
 static void
 dvdblocksrc_open_file (DVDBlockSrc *src);
 static void
-dvdblocksrc_close_file (DVDBlockSrc *src);
+dvdblocksrc_close_files (DVDBlockSrc *src);
+
+static gboolean
+dvdblocksrc_is_vobu_header (guchar *data);
+static int
+dvdblocksrc_get_next_vobu (guchar *data, int vobu_start);
+
+static gpointer
+dvdblocksrc_read_ahead_loop (gpointer data);
+static DVDBlockSrcVobu *
+dvdblocksrc_read_ahead_take (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start);
+static void
+dvdblocksrc_read_ahead_restart (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int next);
+static void
+dvdblocksrc_read_ahead_reset (DVDBlockSrc *src);
+static void
+dvdblocksrc_clear_vobu_buf (DVDBlockSrc *src);
+static void
+dvdblocksrc_load_vobu (DVDBlockSrc *src);
+
+static guint
+dvdblocksrc_cache_hash (gconstpointer key);
+static gboolean
+dvdblocksrc_cache_equal (gconstpointer a, gconstpointer b);
+static GstBuffer *
+dvdblocksrc_cache_lookup (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start);
+static GstBuffer *
+dvdblocksrc_cache_lookup_full (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start, gboolean count);
+static void
+dvdblocksrc_cache_insert (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start, GstBuffer *buf);
+static void
+dvdblocksrc_cache_shrink (DVDBlockSrc *src, int max_size);
+
+static GType
+dvdblocksrc_buffer_get_type (void);
+static GstBuffer *
+dvdblocksrc_buffer_get (DVDBlockSrc *src);
+static void
+dvdblocksrc_pool_clear (DVDBlockSrc *src);
+
+static void
+dvdblocksrc_set_last_header (DVDBlockSrc *src, GstBuffer *header,
+    int offset);
+static int
+dvdblocksrc_follow_next (DVDBlockSrc *src);
+static void
+dvdblocksrc_follow_stop (DVDBlockSrc *src);
+static void
+dvdblocksrc_follow_events (DVDBlockSrc *src, guchar *data);
 
 static gboolean
 dvdblocksrc_is_seekable (GstBaseSrc *src);
@@ -172,6 +308,15 @@ dvdblocksrc_class_init (DVDBlockSrcClass *klass)
         gst_marshal_VOID__BOXED,
         G_TYPE_NONE,
         1, GST_TYPE_BUFFER);
+  dvdblocksrc_signals[FOLLOW_END_SIGNAL] =
+    g_signal_new ("follow-end",
+        G_TYPE_FROM_CLASS (klass),
+        G_SIGNAL_RUN_LAST,
+        G_STRUCT_OFFSET (DVDBlockSrcClass, follow_end),
+        NULL, NULL,
+        gst_marshal_VOID__BOXED,
+        G_TYPE_NONE,
+        1, GST_TYPE_BUFFER);
   dvdblocksrc_signals[EVENT_SIGNAL] =
     g_signal_new ("event",
         G_TYPE_FROM_CLASS (klass),
@@ -217,7 +362,70 @@ dvdblocksrc_class_init (DVDBlockSrcClass *klass)
       g_param_spec_boolean ("cancel-vobu", "cancel-vobu",
           "When set to true, cancel playback of the current VOBU",
           FALSE, G_PARAM_READWRITE));
-
+  g_object_class_install_property (gobject_class, PROP_READ_AHEAD,
+      g_param_spec_int ("read-ahead", "read-ahead",
+          "Maximum number of VOBUs read in advance, following the "
+          "next VOBU pointers in the VOBU headers (0 disables "
+          "read-ahead)",
+          0, DVDBLOCKSRC_MAX_READ_AHEAD, DVDBLOCKSRC_DEFAULT_READ_AHEAD,
+          G_PARAM_READWRITE));
+  g_object_class_install_property (gobject_class, PROP_CACHE_SIZE,
+      g_param_spec_int ("cache-size", "cache-size",
+          "Maximum size in bytes of the cache of recently read VOBUs "
+          "(0 disables the cache)",
+          0, G_MAXINT, DVDBLOCKSRC_DEFAULT_CACHE_SIZE, G_PARAM_READWRITE));
+  g_object_class_install_property (gobject_class, PROP_CACHE_USED,
+      g_param_spec_int ("cache-used", "cache-used",
+          "Current size in bytes of the VOBU cache",
+          0, G_MAXINT, 0, G_PARAM_READABLE));
+  g_object_class_install_property (gobject_class, PROP_CACHE_HITS,
+      g_param_spec_uint ("cache-hits", "cache-hits",
+          "Number of VOBUs found in the cache",
+          0, G_MAXUINT, 0, G_PARAM_READABLE));
+  g_object_class_install_property (gobject_class, PROP_CACHE_MISSES,
+      g_param_spec_uint ("cache-misses", "cache-misses",
+          "Number of VOBUs not found in the cache",
+          0, G_MAXUINT, 0, G_PARAM_READABLE));
+  g_object_class_install_property (gobject_class, PROP_BUFFERS_ALLOCATED,
+      g_param_spec_uint ("buffers-allocated", "buffers-allocated",
+          "Number of read buffers allocated",
+          0, G_MAXUINT, 0, G_PARAM_READABLE));
+  g_object_class_install_property (gobject_class, PROP_BUFFERS_RECYCLED,
+      g_param_spec_uint ("buffers-recycled", "buffers-recycled",
+          "Number of read buffers reused instead of allocated",
+          0, G_MAXUINT, 0, G_PARAM_READABLE));
+  g_object_class_install_property (gobject_class, PROP_FOLLOW_END,
+      g_param_spec_int ("follow-end", "follow-end",
+          "When not -1, keep playing VOBUs after the current one by "
+          "following the next VOBU pointers, as long as they start at "
+          "or before this offset and have no highlight information",
+          -1, G_MAXINT, -1, G_PARAM_READWRITE));
+  g_object_class_install_property (gobject_class, PROP_SEGMENT_START,
+      g_param_spec_uint64 ("segment-start", "segment-start",
+          "Start time of the current segment, maintained while "
+          "following VOBUs",
+          0, G_MAXUINT64, GST_CLOCK_TIME_NONE, G_PARAM_READWRITE));
+  g_object_class_install_property (gobject_class, PROP_SEGMENT_STOP,
+      g_param_spec_uint64 ("segment-stop", "segment-stop",
+          "Stop time of the current segment, maintained while "
+          "following VOBUs",
+          0, G_MAXUINT64, GST_CLOCK_TIME_NONE, G_PARAM_READWRITE));
+  g_object_class_install_property (gobject_class, PROP_AUDIO_STREAM,
+      g_param_spec_int ("audio-stream", "audio-stream",
+          "Physical audio stream, used to detect audio gaps while "
+          "following VOBUs (-1 for none)",
+          -1, 7, -1, G_PARAM_READWRITE));
+  g_object_class_install_property (gobject_class, PROP_VOBU_OFFSET,
+      g_param_spec_int ("vobu-offset", "vobu-offset",
+          "Offset in 2048 byte blocks from begin of DVD file to start "
+          "of the last VOBU read",
+          -1, G_MAXINT, -1, G_PARAM_READABLE));
+  g_object_class_install_property (gobject_class, PROP_LAST_HEADER,
+      gst_param_spec_mini_object ("last-header", "last-header",
+          "Header of the last VOBU read",
+          GST_TYPE_BUFFER, G_PARAM_READABLE));
+
+  gstbasesrc_class->start = dvdblocksrc_start;
   gstbasesrc_class->stop = dvdblocksrc_stop;
   gstbasesrc_class->event = dvdblocksrc_event;
   gstbasesrc_class->is_seekable = dvdblocksrc_is_seekable;
@@ -230,6 +438,8 @@ dvdblocksrc_class_init (DVDBlockSrcClass *klass)
 static void 
 dvdblocksrc_init (DVDBlockSrc * src, DVDBlockSrcClass * klass)
 {
+  int i;
+
   src->location = g_strdup ("/dev/dvd");
   src->title_num = 0;
   src->domain = DVD_READ_TITLE_VOBS;
@@ -245,8 +455,56 @@ dvdblocksrc_init (DVDBlockSrc * src, DVDBlockSrcClass * klass)
   src->reader = NULL;
   src->file = NULL;
 
+  for (i = 0; i < DVDBLOCKSRC_FILE_POOL_SIZE; i++) {
+    src->files[i].title_num = -1;
+    src->files[i].domain = -1;
+    src->files[i].file = NULL;
+    src->files[i].last_used = 0;
+  }
+  src->file_use_count = 0;
+
   src->cancel_lock = g_mutex_new ();
 
+  src->last_header = NULL;
+  src->last_header_offset = -1;
+
+  src->follow_end = -1;
+  src->segment_start = GST_CLOCK_TIME_NONE;
+  src->segment_stop = GST_CLOCK_TIME_NONE;
+  src->audio_stream = -1;
+
+  src->io_lock = g_mutex_new ();
+
+  src->vobu_buf = NULL;
+  src->vobu_buf_start = 0;
+
+  src->read_ahead_depth = DVDBLOCKSRC_DEFAULT_READ_AHEAD;
+  src->read_ahead_thread = NULL;
+  src->read_ahead_lock = g_mutex_new ();
+  src->read_ahead_cond = g_cond_new ();
+  src->read_ahead_queue = g_queue_new ();
+  src->read_ahead_title_num = -1;
+  src->read_ahead_domain = -1;
+  src->read_ahead_next = -1;
+  src->read_ahead_busy = -1;
+  src->read_ahead_generation = 0;
+  src->read_ahead_quit = FALSE;
+
+  src->cache_lock = g_mutex_new ();
+  src->cache_table = g_hash_table_new (dvdblocksrc_cache_hash,
+      dvdblocksrc_cache_equal);
+  src->cache_lru = g_queue_new ();
+  src->cache_max_size = DVDBLOCKSRC_DEFAULT_CACHE_SIZE;
+  src->cache_used = 0;
+  src->cache_hits = 0;
+  src->cache_misses = 0;
+
+  src->pool_lock = g_mutex_new ();
+  src->pool = g_queue_new ();
+  src->pool_active = FALSE;
+  src->buffers_allocated = 0;
+  src->buffers_recycled = 0;
+
   gst_base_src_set_format (GST_BASE_SRC (src), GST_FORMAT_TIME);
 }
 
@@ -260,6 +518,45 @@ dvdblocksrc_finalize (GObject *object)
   if (src->open_location != NULL) {
     g_free (src->open_location);
   }
+
+  g_mutex_free (src->io_lock);
+  g_mutex_free (src->read_ahead_lock);
+  g_cond_free (src->read_ahead_cond);
+  g_queue_free (src->read_ahead_queue);
+
+  dvdblocksrc_cache_shrink (src, 0);
+  g_mutex_free (src->cache_lock);
+  g_hash_table_destroy (src->cache_table);
+  g_queue_free (src->cache_lru);
+
+  dvdblocksrc_pool_clear (src);
+  g_mutex_free (src->pool_lock);
+  g_queue_free (src->pool);
+}
+
+
+static gboolean
+dvdblocksrc_start (GstBaseSrc * bsrc)
+{
+  DVDBlockSrc *src = DVDBLOCKSRC (bsrc);
+  GError *error = NULL;
+
+  g_mutex_lock (src->pool_lock);
+  src->pool_active = TRUE;
+  g_mutex_unlock (src->pool_lock);
+
+  src->read_ahead_quit = FALSE;
+  src->read_ahead_thread =
+    g_thread_create (dvdblocksrc_read_ahead_loop, src, TRUE, &error);
+  if (src->read_ahead_thread == NULL) {
+    GST_ELEMENT_ERROR (src, RESOURCE, FAILED,
+        ("Couldn't create read-ahead thread: %s", error->message),
+        NULL);
+    g_error_free (error);
+    return FALSE;
+  }
+
+  return TRUE;
 }
 
 
@@ -268,7 +565,30 @@ dvdblocksrc_stop (GstBaseSrc * bsrc)
 {
   DVDBlockSrc *src = DVDBLOCKSRC (bsrc);
 
-  dvdblocksrc_close_file (src);
+  if (src->read_ahead_thread != NULL) {
+    g_mutex_lock (src->read_ahead_lock);
+    src->read_ahead_quit = TRUE;
+    g_cond_broadcast (src->read_ahead_cond);
+    g_mutex_unlock (src->read_ahead_lock);
+
+    g_thread_join (src->read_ahead_thread);
+    src->read_ahead_thread = NULL;
+  }
+
+  dvdblocksrc_read_ahead_reset (src);
+  dvdblocksrc_clear_vobu_buf (src);
+  dvdblocksrc_set_last_header (src, NULL, -1);
+  src->follow_end = -1;
+
+  /* The disc may be changed before starting again. */
+  dvdblocksrc_cache_shrink (src, 0);
+
+  /* Don't keep idle memory around while stopped. Buffers still in
+     use downstream free their memory when released, instead of
+     putting it back into the pool. */
+  dvdblocksrc_pool_clear (src);
+
+  dvdblocksrc_close_files (src);
   dvdblocksrc_close_root (src);
 
   return TRUE;
@@ -294,6 +614,9 @@ dvdblocksrc_set_property (GObject *object, guint prop_id,
       } else {
         src->location = g_strdup (g_value_get_string (value));
       }
+
+      /* Cached VOBUs belong to the previous location. */
+      dvdblocksrc_cache_shrink (src, 0);
       break;
     case PROP_TITLE:
       src->title_num = g_value_get_int (value);
@@ -303,6 +626,9 @@ dvdblocksrc_set_property (GObject *object, guint prop_id,
       break;
     case PROP_VOBU_START:
       src->vobu_start = g_value_get_int (value);
+
+      /* Explicitly requested VOBUs end following. */
+      src->follow_end = -1;
       break;
     case PROP_CANCEL_VOBU:
       /* The cancel operation cannot be executed while 'create' is
@@ -312,10 +638,38 @@ dvdblocksrc_set_property (GObject *object, guint prop_id,
       if (g_value_get_boolean (value)) {
 	src->vobu_start = -1;
 	src->block_count = 0;
+        src->follow_end = -1;
+
+        /* Whatever comes next, it isn't what we predicted. */
+        dvdblocksrc_read_ahead_reset (src);
       }
 
       g_mutex_unlock (src->cancel_lock);
       break;
+    case PROP_READ_AHEAD:
+      g_mutex_lock (src->read_ahead_lock);
+      src->read_ahead_depth = g_value_get_int (value);
+      g_cond_broadcast (src->read_ahead_cond);
+      g_mutex_unlock (src->read_ahead_lock);
+      break;
+    case PROP_CACHE_SIZE:
+      g_mutex_lock (src->cache_lock);
+      src->cache_max_size = g_value_get_int (value);
+      g_mutex_unlock (src->cache_lock);
+      dvdblocksrc_cache_shrink (src, src->cache_max_size);
+      break;
+    case PROP_FOLLOW_END:
+      src->follow_end = g_value_get_int (value);
+      break;
+    case PROP_SEGMENT_START:
+      src->segment_start = g_value_get_uint64 (value);
+      break;
+    case PROP_SEGMENT_STOP:
+      src->segment_stop = g_value_get_uint64 (value);
+      break;
+    case PROP_AUDIO_STREAM:
+      src->audio_stream = g_value_get_int (value);
+      break;
     default:
       G_OBJECT_WARN_INVALID_PROPERTY_ID (object, prop_id, pspec);
       break;
@@ -349,6 +703,49 @@ dvdblocksrc_get_property (GObject *object, guint prop_id,
     case PROP_CANCEL_VOBU:
       g_value_set_boolean (value, FALSE);
       break;
+    case PROP_READ_AHEAD:
+      g_value_set_int (value, src->read_ahead_depth);
+      break;
+    case PROP_CACHE_SIZE:
+      g_value_set_int (value, src->cache_max_size);
+      break;
+    case PROP_CACHE_USED:
+      g_value_set_int (value, src->cache_used);
+      break;
+    case PROP_CACHE_HITS:
+      g_value_set_uint (value, src->cache_hits);
+      break;
+    case PROP_CACHE_MISSES:
+      g_value_set_uint (value, src->cache_misses);
+      break;
+    case PROP_BUFFERS_ALLOCATED:
+      g_value_set_uint (value, src->buffers_allocated);
+      break;
+    case PROP_BUFFERS_RECYCLED:
+      g_value_set_uint (value, src->buffers_recycled);
+      break;
+    case PROP_FOLLOW_END:
+      g_value_set_int (value, src->follow_end);
+      break;
+    case PROP_SEGMENT_START:
+      g_value_set_uint64 (value, src->segment_start);
+      break;
+    case PROP_SEGMENT_STOP:
+      g_value_set_uint64 (value, src->segment_stop);
+      break;
+    case PROP_AUDIO_STREAM:
+      g_value_set_int (value, src->audio_stream);
+      break;
+    case PROP_VOBU_OFFSET:
+      GST_OBJECT_LOCK (src);
+      g_value_set_int (value, src->last_header_offset);
+      GST_OBJECT_UNLOCK (src);
+      break;
+    case PROP_LAST_HEADER:
+      GST_OBJECT_LOCK (src);
+      gst_value_set_mini_object (value, GST_MINI_OBJECT (src->last_header));
+      GST_OBJECT_UNLOCK (src);
+      break;
     default:
       G_OBJECT_WARN_INVALID_PROPERTY_ID (object, prop_id, pspec);
       break;
@@ -369,21 +766,59 @@ dvdblocksrc_event (GstBaseSrc * src, GstEvent * event)
 }
 
 
+/* Read 'block_count' blocks at 'offset' in the current file into
+   'data'. Return the number of blocks read, or -1 on error. */
+static int
+dvdblocksrc_read_file_blocks (DVDBlockSrc * src, int offset,
+    int block_count, guchar *data)
+{
+  int blocks_read;
+
+  g_mutex_lock (src->io_lock);
+  dvdblocksrc_open_file (src);
+  if (src->file == NULL) {
+    blocks_read = -1;
+  } else {
+    blocks_read = DVDReadBlocks (src->file, offset, block_count, data);
+  }
+  g_mutex_unlock (src->io_lock);
+
+  return blocks_read;
+}
+
+
 /* Try to read block_count blocks from the current file, in a newly
    allocated buffer. It could potentally read less blocks than
    requested. The size of the resulting buffer will always be set
-   accordingly. */
+   accordingly. Blocks available in the current VOBU buffer are not
+   read again, but returned as a subbuffer. */
 static GstBuffer *
 dvdblocksrc_read (DVDBlockSrc * src, int block_count)
 {
   GstBuffer *buf;
   int blocks_read;
+  int offset;
 
-  buf = gst_buffer_new_and_alloc (block_count * DVDBLOCKSRC_BLOCK_SIZE);
+  if (src->vobu_buf != NULL) {
+    offset = src->block_offset - src->vobu_buf_start;
+    if (offset >= 0 && (offset + block_count) * DVDBLOCKSRC_BLOCK_SIZE <=
+        GST_BUFFER_SIZE (src->vobu_buf)) {
+      buf = gst_buffer_create_sub (src->vobu_buf,
+          offset * DVDBLOCKSRC_BLOCK_SIZE,
+          block_count * DVDBLOCKSRC_BLOCK_SIZE);
 
-  dvdblocksrc_open_file (src);
-  blocks_read = DVDReadBlocks (src->file, src->block_offset, block_count,
-      GST_BUFFER_DATA (buf));
+      src->block_count -= block_count;
+      src->block_offset += block_count;
+
+      return buf;
+    }
+  }
+
+  g_return_val_if_fail (block_count <= DVDBLOCKSRC_MAX_BUF_SIZE, NULL);
+  buf = dvdblocksrc_buffer_get (src);
+
+  blocks_read = dvdblocksrc_read_file_blocks (src, src->block_offset,
+      block_count, GST_BUFFER_DATA (buf));
   if (blocks_read == -1) {
     GST_ELEMENT_ERROR (src, RESOURCE, READ,
         ("Cannot read blocks, title %d, domain %d"
@@ -408,20 +843,39 @@ dvdblocksrc_create (GstPushSrc * psrc, GstBuffer ** outbuf)
   DVDBlockSrc *src = DVDBLOCKSRC (psrc);
   GstBuffer *buf = NULL;
   int block_count;
+  gboolean following = FALSE;
   GstFlowReturn res = GST_FLOW_OK;
 
   GST_LOG_OBJECT (src, "entering create");
 
   g_mutex_lock (src->cancel_lock);
 
+ again:
   if (src->block_count == 0 && src->vobu_start == -1) {
     /* No more work to do. */
 
+    if (src->follow_end != -1) {
+      /* Try to go on by ourselves. */
+      src->vobu_start = dvdblocksrc_follow_next (src);
+      if (src->vobu_start != -1) {
+        following = TRUE;
+      } else {
+        dvdblocksrc_follow_stop (src);
+      }
+    }
+  }
+
+  if (src->block_count == 0 && src->vobu_start == -1) {
     /* Fire the vobu_read signal to give the application a chance
        to give us more work. */
     g_signal_emit (G_OBJECT (src),
         dvdblocksrc_signals[VOBU_READ_SIGNAL], 0);
 
+    if (src->vobu_start == -1 && src->follow_end != -1) {
+      /* The application asked us to follow VOBUs by ourselves. */
+      goto again;
+    }
+
     if (src->vobu_start == -1) {
       /* We didn't get any more work, tell the base class to send an
 	 EOS. */
@@ -433,44 +887,115 @@ dvdblocksrc_create (GstPushSrc * psrc, GstBuffer ** outbuf)
   }
 
   if (src->vobu_start != -1) {
-    static guchar pci_header[] = {0x00, 0x00, 0x01, 0xbf, 0x03, 0xd4, 0x00};
+    DVDBlockSrcVobu *vobu;
 
     /* Start reading a new VOBU. */
     src->block_offset = src->vobu_start;
     src->vobu_start = -1;
 
+    /* Check if the VOBU was already read in advance. */
+    dvdblocksrc_clear_vobu_buf (src);
+    vobu = dvdblocksrc_read_ahead_take (src, src->title_num, src->domain,
+        src->block_offset);
+    if (vobu != NULL) {
+      GST_LOG_OBJECT (src, "VOBU at offset %d was read in advance",
+          src->block_offset);
+      src->vobu_buf = vobu->buf;
+      src->vobu_buf_start = vobu->vobu_start;
+      g_free (vobu);
+
+      dvdblocksrc_cache_insert (src, src->title_num, src->domain,
+          src->vobu_buf_start, src->vobu_buf);
+    } else {
+      src->vobu_buf = dvdblocksrc_cache_lookup (src, src->title_num,
+          src->domain, src->block_offset);
+      if (src->vobu_buf != NULL) {
+        GST_LOG_OBJECT (src, "VOBU at offset %d found in cache",
+            src->block_offset);
+        src->vobu_buf_start = src->block_offset;
+      } else if (src->cache_max_size > 0) {
+        /* Read the whole VOBU at once, to be able to cache it. */
+        dvdblocksrc_load_vobu (src);
+      }
+    }
+
     /* Read the VOBU header. */
     buf = dvdblocksrc_read (src, 1);
+    if (buf == NULL) {
+      res = GST_FLOW_ERROR;
+      goto done;
+    }
 
     /* Make sure we have a VOBU header. */
-    if (memcmp (pci_header, GST_BUFFER_DATA (buf) + 0x26, sizeof pci_header)
-        != 0) {
+    if (!dvdblocksrc_is_vobu_header (GST_BUFFER_DATA (buf))) {
       GST_ELEMENT_ERROR (src, STREAM, FORMAT,
           ("Block, title %d, domain %d, offset %d is not a VOBU header",
            src->title_num, src->domain, src->block_offset - 1),
           NULL);
+      gst_buffer_unref (buf);
       res = GST_FLOW_ERROR;
       goto done;
     }
 
+    if (following &&
+        (GST_BUFFER_DATA (buf)[DVDBLOCKSRC_HLI_SS_OFFSET] & 0x3) != 0) {
+      /* The VOBU has highlight information, and the application must
+         see it. Stop following and let the application request it
+         again. */
+      GST_DEBUG_OBJECT (src, "VOBU at offset %d has highlights, "
+          "stop following", src->block_offset - 1);
+      gst_buffer_unref (buf);
+      buf = NULL;
+      following = FALSE;
+      dvdblocksrc_follow_stop (src);
+
+      /* Reading the header left the block count at -1. Forget about
+         this VOBU completely. */
+      src->block_count = 0;
+      dvdblocksrc_clear_vobu_buf (src);
+      goto again;
+    }
+
+    if (vobu == NULL) {
+      /* Our predictions were wrong, or there were none. Start over
+         from this VOBU. */
+      dvdblocksrc_read_ahead_restart (src, src->title_num, src->domain,
+          dvdblocksrc_get_next_vobu (GST_BUFFER_DATA (buf),
+              src->block_offset - 1));
+    }
+
     /* Set the number of blocks to read. */
     src->block_count =
-      GUINT32_FROM_BE (*((guint32 *) (GST_BUFFER_DATA (buf) + 0x40f)));
+      GUINT32_FROM_BE (*((guint32 *) (GST_BUFFER_DATA (buf) +
+                                      DVDBLOCKSRC_VOBU_EA_OFFSET)));
     GST_DEBUG_OBJECT (src, "reading new VOBU, size %d blocks",
         src->block_count + 1);
 
-    /* Pass the header to the application. */
-    g_signal_emit (G_OBJECT (src),
-        dvdblocksrc_signals[VOBU_HEADER_SIGNAL], 0, buf);
-  } else {
-    /* Determine the size of the new buffer. */
-    if (src->block_count > DVDBLOCKSRC_MAX_BUF_SIZE) {
-      block_count = DVDBLOCKSRC_MAX_BUF_SIZE;
+    dvdblocksrc_set_last_header (src, buf, src->block_offset - 1);
+
+    if (following) {
+      /* Do what the application would do with the header. */
+      dvdblocksrc_follow_events (src, GST_BUFFER_DATA (buf));
     } else {
-      block_count = src->block_count;
+      /* Pass the header to the application. */
+      g_signal_emit (G_OBJECT (src),
+          dvdblocksrc_signals[VOBU_HEADER_SIGNAL], 0, buf);
     }
+  } else {
+    int chunk_count;
+
+    /* Determine the size of the new buffer. The rest of the VOBU is
+       split in chunks of similar size, instead of leaving a small
+       chunk at the end. */
+    chunk_count = (src->block_count + DVDBLOCKSRC_MAX_BUF_SIZE - 1) /
+      DVDBLOCKSRC_MAX_BUF_SIZE;
+    block_count = (src->block_count + chunk_count - 1) / chunk_count;
 
     buf = dvdblocksrc_read (src, block_count);
+    if (buf == NULL) {
+      res = GST_FLOW_ERROR;
+      goto done;
+    }
   }
 
   *outbuf = buf;
@@ -484,6 +1009,695 @@ dvdblocksrc_create (GstPushSrc * psrc, GstBuffer ** outbuf)
 }
 
 
+static void
+dvdblocksrc_set_last_header (DVDBlockSrc *src, GstBuffer *header,
+    int offset)
+{
+  GstBuffer *old;
+
+  if (header != NULL) {
+    gst_buffer_ref (header);
+  }
+
+  GST_OBJECT_LOCK (src);
+  old = src->last_header;
+  src->last_header = header;
+  src->last_header_offset = offset;
+  GST_OBJECT_UNLOCK (src);
+
+  if (old != NULL) {
+    gst_buffer_unref (old);
+  }
+}
+
+
+/* Return the start offset of the VOBU following the last one read,
+   or -1 if it cannot be played without asking the application. */
+static int
+dvdblocksrc_follow_next (DVDBlockSrc *src)
+{
+  int next;
+
+  if (src->last_header == NULL) {
+    return -1;
+  }
+
+  next = dvdblocksrc_get_next_vobu (GST_BUFFER_DATA (src->last_header),
+      src->last_header_offset);
+  if (next == -1 || next > src->follow_end) {
+    return -1;
+  }
+
+  return next;
+}
+
+
+/* Stop following next VOBU pointers, and tell the application which
+   VOBU was played last. */
+static void
+dvdblocksrc_follow_stop (DVDBlockSrc *src)
+{
+  GST_DEBUG_OBJECT (src, "stop following at offset %d",
+      src->last_header_offset);
+
+  src->follow_end = -1;
+
+  if (src->last_header != NULL) {
+    g_signal_emit (G_OBJECT (src),
+        dvdblocksrc_signals[FOLLOW_END_SIGNAL], 0, src->last_header);
+  }
+}
+
+
+static GstEvent *
+dvdblocksrc_new_dvd_event (const gchar *event_name, GstClockTime start,
+    GstClockTime stop)
+{
+  GstStructure *structure;
+
+  structure = gst_structure_new ("application/x-gst-dvd",
+      "event", G_TYPE_STRING, event_name,
+      "start", G_TYPE_UINT64, start,
+      "stop", G_TYPE_UINT64, stop,
+      NULL);
+
+  return gst_event_new_custom (GST_EVENT_CUSTOM_DOWNSTREAM, structure);
+}
+
+
+/* Send the events the application would send for a VOBU with header
+   'data': a new segment, and, if necessary, audio gap filling and
+   still frame events. */
+static void
+dvdblocksrc_follow_events (DVDBlockSrc *src, guchar *data)
+{
+  GstPad *pad = GST_BASE_SRC_PAD (src);
+  GstClockTime start, stop;
+  gboolean update;
+  guint16 audio_offset = 0;
+  guint32 next_vobu, next_video;
+
+  start = gst_util_uint64_scale (GUINT32_FROM_BE (*((guint32 *)
+          (data + DVDBLOCKSRC_VOBU_S_PTM_OFFSET))), GST_MSECOND, 90);
+  stop = gst_util_uint64_scale (GUINT32_FROM_BE (*((guint32 *)
+          (data + DVDBLOCKSRC_VOBU_E_PTM_OFFSET))), GST_MSECOND, 90);
+
+  if (src->segment_stop != start) {
+    /* We have a new segment. */
+    src->segment_start = start;
+    src->segment_stop = stop;
+    update = FALSE;
+  } else {
+    src->segment_stop = stop;
+    update = TRUE;
+  }
+  gst_pad_push_event (pad,
+      gst_event_new_new_segment (update, 1.0, GST_FORMAT_TIME,
+          src->segment_start, src->segment_stop, src->segment_start));
+
+  if (src->audio_stream != -1) {
+    audio_offset = GUINT16_FROM_BE (*((guint16 *)
+        (data + DVDBLOCKSRC_A_SYNCA_OFFSET + 2 * src->audio_stream)));
+  }
+  if (src->audio_stream == -1 ||
+      audio_offset == 0x0000 || audio_offset == 0x3fff) {
+    /* This VOBU has no audio. Fill with silence. */
+    gst_pad_push_event (pad,
+        dvdblocksrc_new_dvd_event ("dvd-audio-fill-gap", start, stop));
+  }
+
+  next_vobu = GUINT32_FROM_BE (*((guint32 *)
+      (data + DVDBLOCKSRC_NEXT_VOBU_OFFSET))) & 0x3fffffff;
+  next_video = GUINT32_FROM_BE (*((guint32 *)
+      (data + DVDBLOCKSRC_NEXT_VIDEO_OFFSET))) & 0x3fffffff;
+  if (next_vobu != 0x3fffffff && next_video == 0x3fffffff) {
+    /* This VOBU may contain video only partially or contain no
+       video at all. */
+    gst_pad_push_event (pad,
+        dvdblocksrc_new_dvd_event ("dvd-spu-still-frame", start, stop));
+  }
+}
+
+
+/* Return TRUE if and only if 'data' points to a VOBU header
+   block. */
+static gboolean
+dvdblocksrc_is_vobu_header (guchar *data)
+{
+  static guchar pci_header[] = {0x00, 0x00, 0x01, 0xbf, 0x03, 0xd4, 0x00};
+
+  return memcmp (pci_header, data + 0x26, sizeof pci_header) == 0;
+}
+
+
+/* Return the start offset of the VOBU following the one with header
+   'data', located at offset 'vobu_start', or -1 if the header doesn't
+   point to a next VOBU. */
+static int
+dvdblocksrc_get_next_vobu (guchar *data, int vobu_start)
+{
+  guint32 next;
+
+  next = GUINT32_FROM_BE (*((guint32 *)
+                            (data + DVDBLOCKSRC_NEXT_VOBU_OFFSET)));
+  next &= 0x3fffffff;
+  if (next == 0x3fffffff || next == 0) {
+    return -1;
+  }
+
+  return vobu_start + next;
+}
+
+
+static void
+dvdblocksrc_free_vobu (DVDBlockSrcVobu *vobu)
+{
+  gst_buffer_unref (vobu->buf);
+  g_free (vobu);
+}
+
+
+/* Read 'block_count' blocks at 'offset' into 'data', but only if the
+   currently open file corresponds to 'title_num' and 'domain'. Return
+   TRUE if and only if all blocks were read. */
+static gboolean
+dvdblocksrc_read_open_blocks (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int offset, int block_count, guchar *data)
+{
+  gboolean result = FALSE;
+
+  g_mutex_lock (src->io_lock);
+  if (src->file != NULL &&
+      src->open_title_num == title_num &&
+      src->open_domain == domain) {
+    result = DVDReadBlocks (src->file, offset, block_count, data) ==
+      block_count;
+  }
+  g_mutex_unlock (src->io_lock);
+
+  return result;
+}
+
+
+/* Read a whole VOBU in the read-ahead thread. Return NULL if reading
+   fails, or if predictions are discarded ('generation' changes)
+   while reading. */
+static DVDBlockSrcVobu *
+dvdblocksrc_read_ahead_vobu (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start, guint generation)
+{
+  guchar header[DVDBLOCKSRC_BLOCK_SIZE];
+  GstBuffer *buf;
+  DVDBlockSrcVobu *vobu;
+  int size, offset, count;
+
+  buf = dvdblocksrc_cache_lookup_full (src, title_num, domain,
+      vobu_start, FALSE);
+  if (buf != NULL) {
+    goto done;
+  }
+
+  if (!dvdblocksrc_read_open_blocks (src, title_num, domain, vobu_start,
+          1, header) ||
+      !dvdblocksrc_is_vobu_header (header)) {
+    return NULL;
+  }
+
+  size = GUINT32_FROM_BE (*((guint32 *)
+                            (header + DVDBLOCKSRC_VOBU_EA_OFFSET))) + 1;
+  buf = gst_buffer_new_and_alloc (size * DVDBLOCKSRC_BLOCK_SIZE);
+  memcpy (GST_BUFFER_DATA (buf), header, DVDBLOCKSRC_BLOCK_SIZE);
+
+  /* Read in chunks, to avoid keeping the streaming thread waiting for
+     too long. */
+  for (offset = 1; offset < size; offset += count) {
+    /* An unlocked check is enough here. At worst, we read one chunk
+       too many. */
+    if (src->read_ahead_generation != generation) {
+      gst_buffer_unref (buf);
+      return NULL;
+    }
+
+    count = MIN (size - offset, DVDBLOCKSRC_READ_AHEAD_CHUNK);
+    if (!dvdblocksrc_read_open_blocks (src, title_num, domain,
+            vobu_start + offset, count,
+            GST_BUFFER_DATA (buf) + offset * DVDBLOCKSRC_BLOCK_SIZE)) {
+      gst_buffer_unref (buf);
+      return NULL;
+    }
+  }
+
+  dvdblocksrc_cache_insert (src, title_num, domain, vobu_start, buf);
+
+ done:
+  vobu = g_new (DVDBlockSrcVobu, 1);
+  vobu->title_num = title_num;
+  vobu->domain = domain;
+  vobu->vobu_start = vobu_start;
+  vobu->buf = buf;
+
+  return vobu;
+}
+
+
+/* Main loop of the read-ahead thread. */
+static gpointer
+dvdblocksrc_read_ahead_loop (gpointer data)
+{
+  DVDBlockSrc *src = DVDBLOCKSRC (data);
+  DVDBlockSrcVobu *vobu;
+  int title_num, vobu_start;
+  dvd_read_domain_t domain;
+  guint generation;
+
+  g_mutex_lock (src->read_ahead_lock);
+
+  while (!src->read_ahead_quit) {
+    if (src->read_ahead_next == -1 ||
+        g_queue_get_length (src->read_ahead_queue) >=
+        src->read_ahead_depth) {
+      g_cond_wait (src->read_ahead_cond, src->read_ahead_lock);
+      continue;
+    }
+
+    title_num = src->read_ahead_title_num;
+    domain = src->read_ahead_domain;
+    vobu_start = src->read_ahead_next;
+    generation = src->read_ahead_generation;
+    src->read_ahead_busy = vobu_start;
+
+    g_mutex_unlock (src->read_ahead_lock);
+    vobu = dvdblocksrc_read_ahead_vobu (src, title_num, domain,
+        vobu_start, generation);
+    g_mutex_lock (src->read_ahead_lock);
+
+    src->read_ahead_busy = -1;
+
+    if (generation != src->read_ahead_generation) {
+      /* Predictions were discarded while reading. */
+      if (vobu != NULL) {
+        dvdblocksrc_free_vobu (vobu);
+      }
+    } else if (vobu == NULL) {
+      /* Reading failed. Stop predicting until the streaming thread
+         reads a new VOBU itself. */
+      src->read_ahead_next = -1;
+    } else {
+      g_queue_push_tail (src->read_ahead_queue, vobu);
+      src->read_ahead_next =
+        dvdblocksrc_get_next_vobu (GST_BUFFER_DATA (vobu->buf),
+            vobu_start);
+    }
+
+    g_cond_broadcast (src->read_ahead_cond);
+  }
+
+  g_mutex_unlock (src->read_ahead_lock);
+
+  return NULL;
+}
+
+
+/* Return the VOBU at 'vobu_start' in 'title_num' and 'domain' if it
+   is the next one read in advance, or NULL otherwise. If the VOBU is
+   being read at the moment, wait for it. */
+static DVDBlockSrcVobu *
+dvdblocksrc_read_ahead_take (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start)
+{
+  DVDBlockSrcVobu *vobu;
+
+  g_mutex_lock (src->read_ahead_lock);
+
+  while (g_queue_is_empty (src->read_ahead_queue) &&
+         src->read_ahead_busy == vobu_start &&
+         src->read_ahead_title_num == title_num &&
+         src->read_ahead_domain == domain) {
+    g_cond_wait (src->read_ahead_cond, src->read_ahead_lock);
+  }
+
+  vobu = g_queue_peek_head (src->read_ahead_queue);
+  if (vobu != NULL &&
+      vobu->title_num == title_num &&
+      vobu->domain == domain &&
+      vobu->vobu_start == vobu_start) {
+    g_queue_pop_head (src->read_ahead_queue);
+
+    /* There's space for one more VOBU now. */
+    g_cond_broadcast (src->read_ahead_cond);
+  } else {
+    vobu = NULL;
+  }
+
+  g_mutex_unlock (src->read_ahead_lock);
+
+  return vobu;
+}
+
+
+/* Discard all VOBUs read in advance, and all pending
+   predictions. Must be called with 'read_ahead_lock' held. */
+static void
+dvdblocksrc_read_ahead_discard (DVDBlockSrc *src)
+{
+  DVDBlockSrcVobu *vobu;
+
+  while ((vobu = g_queue_pop_head (src->read_ahead_queue)) != NULL) {
+    dvdblocksrc_free_vobu (vobu);
+  }
+
+  src->read_ahead_next = -1;
+  src->read_ahead_generation++;
+}
+
+
+/* Discard all predictions and start reading in advance from offset
+   'next' in 'title_num' and 'domain' (if 'next' isn't -1). */
+static void
+dvdblocksrc_read_ahead_restart (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int next)
+{
+  g_mutex_lock (src->read_ahead_lock);
+
+  dvdblocksrc_read_ahead_discard (src);
+  src->read_ahead_title_num = title_num;
+  src->read_ahead_domain = domain;
+  src->read_ahead_next = next;
+
+  g_cond_broadcast (src->read_ahead_cond);
+  g_mutex_unlock (src->read_ahead_lock);
+}
+
+
+/* Discard all predictions. */
+static void
+dvdblocksrc_read_ahead_reset (DVDBlockSrc *src)
+{
+  g_mutex_lock (src->read_ahead_lock);
+  dvdblocksrc_read_ahead_discard (src);
+  g_cond_broadcast (src->read_ahead_cond);
+  g_mutex_unlock (src->read_ahead_lock);
+}
+
+
+static void
+dvdblocksrc_clear_vobu_buf (DVDBlockSrc *src)
+{
+  if (src->vobu_buf != NULL) {
+    gst_buffer_unref (src->vobu_buf);
+    src->vobu_buf = NULL;
+  }
+}
+
+
+/* Read the whole VOBU starting at the current offset into the VOBU
+   buffer, and put it in the cache. On failure, the VOBU buffer stays
+   empty, and the VOBU is read in the normal way. */
+static void
+dvdblocksrc_load_vobu (DVDBlockSrc *src)
+{
+  guchar header[DVDBLOCKSRC_BLOCK_SIZE];
+  GstBuffer *buf;
+  int size;
+
+  if (dvdblocksrc_read_file_blocks (src, src->block_offset, 1,
+          header) != 1 ||
+      !dvdblocksrc_is_vobu_header (header)) {
+    return;
+  }
+
+  size = GUINT32_FROM_BE (*((guint32 *)
+                            (header + DVDBLOCKSRC_VOBU_EA_OFFSET))) + 1;
+  if (size * DVDBLOCKSRC_BLOCK_SIZE > src->cache_max_size) {
+    /* Wouldn't fit in the cache anyway. */
+    return;
+  }
+
+  buf = gst_buffer_new_and_alloc (size * DVDBLOCKSRC_BLOCK_SIZE);
+  memcpy (GST_BUFFER_DATA (buf), header, DVDBLOCKSRC_BLOCK_SIZE);
+  if (size > 1 &&
+      dvdblocksrc_read_file_blocks (src, src->block_offset + 1, size - 1,
+          GST_BUFFER_DATA (buf) + DVDBLOCKSRC_BLOCK_SIZE) != size - 1) {
+    gst_buffer_unref (buf);
+    return;
+  }
+
+  src->vobu_buf = buf;
+  src->vobu_buf_start = src->block_offset;
+
+  dvdblocksrc_cache_insert (src, src->title_num, src->domain,
+      src->vobu_buf_start, src->vobu_buf);
+}
+
+
+static guint
+dvdblocksrc_cache_hash (gconstpointer key)
+{
+  const DVDBlockSrcCacheEntry *entry = key;
+
+  return (entry->title_num << 24) ^ (entry->domain << 20) ^
+    entry->vobu_start;
+}
+
+
+static gboolean
+dvdblocksrc_cache_equal (gconstpointer a, gconstpointer b)
+{
+  const DVDBlockSrcCacheEntry *entry1 = a;
+  const DVDBlockSrcCacheEntry *entry2 = b;
+
+  return entry1->title_num == entry2->title_num &&
+    entry1->domain == entry2->domain &&
+    entry1->vobu_start == entry2->vobu_start;
+}
+
+
+/* Look for the VOBU at 'vobu_start' in 'title_num' and 'domain' in
+   the cache, and return a new reference to its buffer, or NULL if
+   it isn't cached. The lookup counts as a cache hit or miss. */
+static GstBuffer *
+dvdblocksrc_cache_lookup (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start)
+{
+  return dvdblocksrc_cache_lookup_full (src, title_num, domain,
+      vobu_start, TRUE);
+}
+
+
+/* Like dvdblocksrc_cache_lookup, but only update the cache-hits and
+   cache-misses counters if 'count' is TRUE. Lookups done on behalf
+   of the read-ahead thread must not be counted, since they don't
+   correspond to VOBUs actually played. */
+static GstBuffer *
+dvdblocksrc_cache_lookup_full (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start, gboolean count)
+{
+  DVDBlockSrcCacheEntry key;
+  DVDBlockSrcCacheEntry *entry;
+  GstBuffer *buf = NULL;
+
+  key.title_num = title_num;
+  key.domain = domain;
+  key.vobu_start = vobu_start;
+
+  g_mutex_lock (src->cache_lock);
+
+  entry = g_hash_table_lookup (src->cache_table, &key);
+  if (entry != NULL) {
+    /* Move the entry to the front of the LRU list. */
+    g_queue_unlink (src->cache_lru, entry->link);
+    g_queue_push_head_link (src->cache_lru, entry->link);
+
+    buf = gst_buffer_ref (entry->buf);
+    if (count) {
+      src->cache_hits++;
+    }
+  } else if (count && src->cache_max_size > 0) {
+    src->cache_misses++;
+  }
+
+  g_mutex_unlock (src->cache_lock);
+
+  return buf;
+}
+
+
+/* Put the VOBU at 'vobu_start' in 'title_num' and 'domain', with
+   contents 'buf', in the cache. Least recently used VOBUs are
+   evicted as necessary to stay within the maximum cache size. */
+static void
+dvdblocksrc_cache_insert (DVDBlockSrc *src, int title_num,
+    dvd_read_domain_t domain, int vobu_start, GstBuffer *buf)
+{
+  DVDBlockSrcCacheEntry *entry;
+
+  if (GST_BUFFER_SIZE (buf) > src->cache_max_size) {
+    return;
+  }
+
+  entry = g_new (DVDBlockSrcCacheEntry, 1);
+  entry->title_num = title_num;
+  entry->domain = domain;
+  entry->vobu_start = vobu_start;
+
+  g_mutex_lock (src->cache_lock);
+
+  if (g_hash_table_lookup (src->cache_table, entry) != NULL) {
+    /* Already there. */
+    g_mutex_unlock (src->cache_lock);
+    g_free (entry);
+    return;
+  }
+
+  entry->buf = gst_buffer_ref (buf);
+  g_queue_push_head (src->cache_lru, entry);
+  entry->link = g_queue_peek_head_link (src->cache_lru);
+  g_hash_table_insert (src->cache_table, entry, entry);
+  src->cache_used += GST_BUFFER_SIZE (buf);
+
+  g_mutex_unlock (src->cache_lock);
+
+  dvdblocksrc_cache_shrink (src, src->cache_max_size);
+}
+
+
+/* Evict least recently used VOBUs from the cache until its size is
+   not larger than 'max_size'. */
+static void
+dvdblocksrc_cache_shrink (DVDBlockSrc *src, int max_size)
+{
+  DVDBlockSrcCacheEntry *entry;
+
+  g_mutex_lock (src->cache_lock);
+
+  while (src->cache_used > max_size) {
+    entry = g_queue_pop_tail (src->cache_lru);
+    g_hash_table_remove (src->cache_table, entry);
+    src->cache_used -= GST_BUFFER_SIZE (entry->buf);
+
+    gst_buffer_unref (entry->buf);
+    g_free (entry);
+  }
+
+  g_mutex_unlock (src->cache_lock);
+}
+
+
+static void
+dvdblocksrc_buffer_finalize (DVDBlockSrcBuffer *buf)
+{
+  DVDBlockSrc *src = buf->src;
+  GstBuffer *buffer = GST_BUFFER (buf);
+
+  /* Take the memory away from the buffer and put it back into the
+     pool. The buffer object itself is always freed: resurrecting a
+     mini object from its finalize method is not supported by all
+     GStreamer versions. */
+  g_mutex_lock (src->pool_lock);
+  if (src->pool_active && GST_BUFFER_MALLOCDATA (buffer) != NULL &&
+      g_queue_get_length (src->pool) < DVDBLOCKSRC_POOL_SIZE) {
+    g_queue_push_tail (src->pool, GST_BUFFER_MALLOCDATA (buffer));
+    GST_BUFFER_MALLOCDATA (buffer) = NULL;
+    GST_BUFFER_DATA (buffer) = NULL;
+  }
+  g_mutex_unlock (src->pool_lock);
+
+  gst_object_unref (src);
+
+  dvdblocksrc_buffer_parent_class->finalize (GST_MINI_OBJECT (buf));
+}
+
+
+static void
+dvdblocksrc_buffer_class_init (gpointer g_class, gpointer class_data)
+{
+  GstMiniObjectClass *mini_object_class = GST_MINI_OBJECT_CLASS (g_class);
+
+  dvdblocksrc_buffer_parent_class = g_type_class_peek_parent (g_class);
+
+  mini_object_class->finalize =
+    (GstMiniObjectFinalizeFunction) dvdblocksrc_buffer_finalize;
+}
+
+
+static GType
+dvdblocksrc_buffer_get_type (void)
+{
+  static GType buffer_type = 0;
+
+  if (G_UNLIKELY (buffer_type == 0)) {
+    static const GTypeInfo buffer_info = {
+      sizeof (GstBufferClass),
+      NULL,
+      NULL,
+      dvdblocksrc_buffer_class_init,
+      NULL,
+      NULL,
+      sizeof (DVDBlockSrcBuffer),
+      0,
+      NULL,
+      NULL
+    };
+
+    buffer_type = g_type_register_static (GST_TYPE_BUFFER,
+        "DVDBlockSrcBuffer", &buffer_info, 0);
+  }
+
+  return buffer_type;
+}
+
+
+/* Return a buffer of DVDBLOCKSRC_MAX_BUF_SIZE blocks, with memory
+   taken from the pool if possible. */
+static GstBuffer *
+dvdblocksrc_buffer_get (DVDBlockSrc *src)
+{
+  GstBuffer *buf;
+  DVDBlockSrcBuffer *dvdbuf;
+  guint8 *data;
+
+  g_mutex_lock (src->pool_lock);
+  data = g_queue_pop_head (src->pool);
+  if (data != NULL) {
+    src->buffers_recycled++;
+  } else {
+    src->buffers_allocated++;
+  }
+  g_mutex_unlock (src->pool_lock);
+
+  if (data == NULL) {
+    data = g_malloc (DVDBLOCKSRC_MAX_BUF_SIZE * DVDBLOCKSRC_BLOCK_SIZE);
+  }
+
+  dvdbuf = (DVDBlockSrcBuffer *)
+    gst_mini_object_new (DVDBLOCKSRC_TYPE_BUFFER);
+  dvdbuf->src = gst_object_ref (src);
+
+  buf = GST_BUFFER (dvdbuf);
+  GST_BUFFER_MALLOCDATA (buf) = data;
+  GST_BUFFER_DATA (buf) = data;
+  GST_BUFFER_SIZE (buf) = DVDBLOCKSRC_MAX_BUF_SIZE * DVDBLOCKSRC_BLOCK_SIZE;
+
+  return buf;
+}
+
+
+/* Free all memory in the pool. Buffers released later free their
+   memory directly, until the pool is activated again. */
+static void
+dvdblocksrc_pool_clear (DVDBlockSrc *src)
+{
+  guint8 *data;
+
+  g_mutex_lock (src->pool_lock);
+  src->pool_active = FALSE;
+  while ((data = g_queue_pop_head (src->pool)) != NULL) {
+    g_free (data);
+  }
+  g_mutex_unlock (src->pool_lock);
+}
+
+
 static void
 dvdblocksrc_open_root (DVDBlockSrc *src)
 {
@@ -516,6 +1730,9 @@ dvdblocksrc_close_root (DVDBlockSrc *src)
     return;
   }
 
+  /* Files belong to the reader. */
+  dvdblocksrc_close_files (src);
+
   DVDClose (src->reader);
 
   src->reader = NULL;
@@ -527,22 +1744,60 @@ dvdblocksrc_close_root (DVDBlockSrc *src)
 static void
 dvdblocksrc_open_file (DVDBlockSrc *src)
 {
+  DVDBlockSrcFile *entry;
+  DVDBlockSrcFile *victim = NULL;
+  int i;
+
   dvdblocksrc_open_root (src);
 
   g_return_if_fail (src->reader != NULL);
 
-  if (src->title_num == src->open_title_num &&
+  if (src->file != NULL &&
+      src->title_num == src->open_title_num &&
       src->domain == src->open_domain) {
     /* File is not changed.  Do nothing. */
     return;
   }
 
-  if (src->file != NULL) {
-    dvdblocksrc_close_file (src);
+  /* Look for the file among the open ones. On the way, choose a
+     free entry, or else the least recently used one, to replace if
+     the file isn't found. */
+  for (i = 0; i < DVDBLOCKSRC_FILE_POOL_SIZE; i++) {
+    entry = &src->files[i];
+
+    if (entry->file != NULL &&
+        entry->title_num == src->title_num &&
+        entry->domain == src->domain) {
+      GST_DEBUG_OBJECT (src, "reusing open file, title %d, domain %d",
+          src->title_num, src->domain);
+
+      entry->last_used = ++src->file_use_count;
+      src->file = entry->file;
+      src->open_title_num = src->title_num;
+      src->open_domain = src->domain;
+      return;
+    }
+
+    if (victim == NULL ||
+        (victim->file != NULL &&
+         (entry->file == NULL || entry->last_used < victim->last_used))) {
+      victim = entry;
+    }
+  }
+
+  if (victim->file != NULL) {
+    GST_DEBUG_OBJECT (src, "closing file, title %d, domain %d",
+        victim->title_num, victim->domain);
+    DVDCloseFile (victim->file);
+    victim->file = NULL;
   }
 
-  src->file = DVDOpenFile (src->reader, src->title_num, src->domain);
-  if (src->file == NULL) {
+  src->file = NULL;
+  src->open_title_num = -1;
+  src->open_domain = -1;
+
+  victim->file = DVDOpenFile (src->reader, src->title_num, src->domain);
+  if (victim->file == NULL) {
     GST_ELEMENT_ERROR (src, RESOURCE, READ,
         ("Couldn't open title %d, domain %d\n",
             src->title_num, src->domain),
@@ -550,19 +1805,27 @@ dvdblocksrc_open_file (DVDBlockSrc *src)
     return;
   }
 
+  victim->title_num = src->title_num;
+  victim->domain = src->domain;
+  victim->last_used = ++src->file_use_count;
+
+  src->file = victim->file;
   src->open_title_num = src->title_num;
   src->open_domain = src->domain;
 }
 
 
 static void
-dvdblocksrc_close_file (DVDBlockSrc *src)
+dvdblocksrc_close_files (DVDBlockSrc *src)
 {
-  if (src->file == NULL) {
-    return;
-  }
+  int i;
 
-  DVDCloseFile (src->file);
+  for (i = 0; i < DVDBLOCKSRC_FILE_POOL_SIZE; i++) {
+    if (src->files[i].file != NULL) {
+      DVDCloseFile (src->files[i].file);
+      src->files[i].file = NULL;
+    }
+  }
 
   src->file = NULL;
   src->open_title_num = -1;
@@ -588,6 +1851,8 @@ dvdblocksrc_do_seek (GstBaseSrc *bsrc, GstSegment *segment)
   g_mutex_lock (src->cancel_lock);
   src->vobu_start = -1;
   src->block_count = 0;
+  src->follow_end = -1;
+  dvdblocksrc_read_ahead_reset (src);
   g_mutex_unlock (src->cancel_lock);
 
   g_signal_emit (G_OBJECT (src),
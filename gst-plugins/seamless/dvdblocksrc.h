@@ -44,6 +44,11 @@ G_BEGIN_DECLS
 
 typedef struct _DVDBlockSrc DVDBlockSrc;
 typedef struct _DVDBlockSrcClass DVDBlockSrcClass;
+typedef struct _DVDBlockSrcFile DVDBlockSrcFile;
+
+
+/* Maximum number of DVD files kept open at the same time. */
+#define DVDBLOCKSRC_FILE_POOL_SIZE 8
 
 
 typedef enum {
@@ -52,6 +57,15 @@ typedef enum {
 } DVDBlockSrcFlags;
 
 
+/* An open DVD file. */
+struct _DVDBlockSrcFile {
+  int title_num;
+  dvd_read_domain_t domain;
+  dvd_file_t *file;	/* File object, or NULL if the entry is free. */
+  guint last_used;	/* Value of 'file_use_count' when last used. */
+};
+
+
 struct _DVDBlockSrc {
   GstPushSrc element;
 
@@ -74,9 +88,79 @@ struct _DVDBlockSrc {
   dvd_reader_t *reader;	/* The current DVD reader object. */
   dvd_file_t *file;	/* The current DVD file object. */
 
+  DVDBlockSrcFile files[DVDBLOCKSRC_FILE_POOL_SIZE];
+  			/* Recently used DVD files, kept open to switch
+                           quickly between domains. */
+  guint file_use_count;	/* Incremented whenever a file is used. */
+
   GstPad *src;		/* The source pad. */
 
   GMutex *cancel_lock;	/* Lock to exclude the cancel VOBU operation. */
+
+  GstBuffer *last_header;
+  			/* Header of the last VOBU read, or NULL. */
+  int last_header_offset;
+  			/* Start offset of the last VOBU read. */
+
+  /* Following. */
+  int follow_end;	/* Start offset of the last VOBU that can be
+                           played following the next VOBU pointers
+                           without asking the application, or -1. */
+  GstClockTime segment_start;
+  GstClockTime segment_stop;
+  			/* Current segment, updated while following. */
+  int audio_stream;	/* Physical audio stream, or -1 for none. */
+
+  GMutex *io_lock;	/* Serializes the use of the reader and
+                           file objects. */
+
+  GstBuffer *vobu_buf;	/* Contents of the current VOBU, when read in
+                           advance, or NULL. */
+  int vobu_buf_start;	/* Start offset of 'vobu_buf' (in 2048 byte
+                           blocks from file start). */
+
+  /* Read-ahead. */
+  int read_ahead_depth;	/* Maximum number of VOBUs read in advance. */
+  GThread *read_ahead_thread;
+  GMutex *read_ahead_lock;
+  			/* Protects all read-ahead fields. */
+  GCond *read_ahead_cond;
+  			/* Signals any change in the read-ahead state. */
+  GQueue *read_ahead_queue;
+  			/* VOBUs already read in advance, in
+                           playback order. */
+  int read_ahead_title_num;
+  dvd_read_domain_t read_ahead_domain;
+  			/* Title and domain of the predicted VOBUs. */
+  int read_ahead_next;	/* Start offset of the next VOBU to read in
+                           advance, or -1. */
+  int read_ahead_busy;	/* Start offset of the VOBU being read in
+                           advance, or -1. */
+  guint read_ahead_generation;
+  			/* Incremented whenever predictions are
+                           discarded. */
+  gboolean read_ahead_quit;
+  			/* Tells the read-ahead thread to finish. */
+
+  /* VOBU cache. */
+  GMutex *cache_lock;	/* Protects all cache fields. */
+  GHashTable *cache_table;
+  			/* Cached VOBUs by title, domain and start
+                           offset. */
+  GQueue *cache_lru;	/* Cached VOBUs, most recently used first. */
+  int cache_max_size;	/* Maximum size of the cache in bytes. */
+  int cache_used;	/* Current size of the cache in bytes. */
+  guint cache_hits;	/* Number of VOBUs found in the cache. */
+  guint cache_misses;	/* Number of VOBUs not found in the cache. */
+
+  /* Buffer pool. */
+  GMutex *pool_lock;	/* Protects all pool fields. */
+  GQueue *pool;		/* Buffer memory available for reuse. */
+  gboolean pool_active;	/* FALSE if released buffers must be freed. */
+  guint buffers_allocated;
+  			/* Number of buffers allocated. */
+  guint buffers_recycled;
+  			/* Number of buffers taken from the pool. */
 };
 
 
@@ -86,6 +170,7 @@ struct _DVDBlockSrcClass {
   /* Signals */
   void (*vobu_read)		(DVDBlockSrc * src);
   void (*vobu_header)		(DVDBlockSrc * src, GstBuffer * header);
+  void (*follow_end)		(DVDBlockSrc * src, GstBuffer * header);
   gboolean (*event_signal)	(GstBaseSrc *src, GstEvent *event);
   gboolean (*do_seek)		(GstBaseSrc *src, GstSegment *segment);
 };
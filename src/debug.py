@@ -32,7 +32,8 @@ def debugConsole(player):
                    'info': player.info,
                    'machine': player.machine,
                    'pipeline': player.pipeline,
-                   'manager': player.manager})
+                   'manager': player.manager,
+                   'trace': player.manager.trace})
 
 def debugConsoleAsync(player):
     """Start a debug console in the controlling terminal.
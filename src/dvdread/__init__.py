@@ -26,3 +26,5 @@ if os.path.exists(libtool_dir):
 del sys, os, libtool_dir
 
 from _dvdread import *
+import infocache
+from infocache import openDVDInfo
@@ -19,6 +19,10 @@
 
 
 import time
+import weakref
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
 
 cdef extern from "Python.h":
     int PyObject_AsReadBuffer(object obj,
@@ -26,6 +30,11 @@ cdef extern from "Python.h":
                               int *buffer_len)
 
     object PyString_FromStringAndSize(char *v, int len)
+    char *PyString_AsString(object string)
+
+    ctypedef struct PyThreadState
+    PyThreadState *PyEval_SaveThread()
+    void PyEval_RestoreThread(PyThreadState *tstate)
 
 
 #
@@ -33,6 +42,9 @@ cdef extern from "Python.h":
 #
 
 cdef extern from "dvdread/dvd_reader.h":
+    ctypedef long ssize_t
+    ctypedef unsigned long size_t
+
     enum dvd_read_domain_t:
         DVD_READ_INFO_FILE,
         DVD_READ_INFO_BACKUP_FILE,
@@ -48,6 +60,19 @@ cdef extern from "dvdread/dvd_reader.h":
     dvd_reader_t *DVDOpen(char *path)
     void DVDClose(dvd_reader_t * dvd)
 
+    dvd_file_t *DVDOpenFile(dvd_reader_t *dvd, int titlenum,
+                            dvd_read_domain_t domain)
+    void DVDCloseFile(dvd_file_t *dvd_file)
+    int DVDReadBlocks(dvd_file_t *dvd_file, int offset, int block_count,
+                      unsigned char *data)
+    ssize_t DVDReadBytes(dvd_file_t *dvd_file, void *data, size_t byte_size)
+    ssize_t DVDFileSize(dvd_file_t *dvd_file)
+
+    int DVDUDFVolumeInfo(dvd_reader_t *dvd, char *volid,
+                         unsigned int volid_size,
+                         unsigned char *volsetid,
+                         unsigned int volsetid_size)
+
 include "ifo_types.pyx"
 
 cdef extern from "dvdread/ifo_print.h":
@@ -58,6 +83,139 @@ cdef extern from "dvdread/ifo_read.h":
     void ifoClose(ifo_handle_t *ifoFile)
 
 
+#
+# Blocking Operations
+#
+
+# The following functions call the libdvdread operations that may
+# block on the drive without holding the global interpreter lock, so
+# that other threads (in particular, the user interface) can run in
+# the meantime. Python objects must not be touched while the lock is
+# released.
+
+cdef dvd_reader_t *openReader(char *path):
+    cdef PyThreadState *state
+    cdef dvd_reader_t *reader
+
+    state = PyEval_SaveThread()
+    reader = DVDOpen(path)
+    PyEval_RestoreThread(state)
+
+    return reader
+
+cdef void closeReader(dvd_reader_t *reader):
+    cdef PyThreadState *state
+
+    state = PyEval_SaveThread()
+    DVDClose(reader)
+    PyEval_RestoreThread(state)
+
+cdef int getVolumeInfo(dvd_reader_t *reader, char *volId, int volIdSize,
+                       unsigned char *volSetId, int volSetIdSize):
+    cdef PyThreadState *state
+    cdef int res
+
+    state = PyEval_SaveThread()
+    res = DVDUDFVolumeInfo(reader, volId, volIdSize,
+                           volSetId, volSetIdSize)
+    PyEval_RestoreThread(state)
+
+    return res
+
+cdef dvd_file_t *openFile(dvd_reader_t *reader, int titleNr,
+                          dvd_read_domain_t domain):
+    cdef PyThreadState *state
+    cdef dvd_file_t *file
+
+    state = PyEval_SaveThread()
+    file = DVDOpenFile(reader, titleNr, domain)
+    PyEval_RestoreThread(state)
+
+    return file
+
+cdef void closeFile(dvd_file_t *file):
+    cdef PyThreadState *state
+
+    state = PyEval_SaveThread()
+    DVDCloseFile(file)
+    PyEval_RestoreThread(state)
+
+cdef int readBlocks(dvd_file_t *file, int offset, int count,
+                    unsigned char *data):
+    cdef PyThreadState *state
+    cdef int res
+
+    state = PyEval_SaveThread()
+    res = DVDReadBlocks(file, offset, count, data)
+    PyEval_RestoreThread(state)
+
+    return res
+
+cdef ssize_t readBytes(dvd_file_t *file, void *data, size_t size):
+    cdef PyThreadState *state
+    cdef ssize_t res
+
+    state = PyEval_SaveThread()
+    res = DVDReadBytes(file, data, size)
+    PyEval_RestoreThread(state)
+
+    return res
+
+cdef ifo_handle_t *openInfoFile(dvd_reader_t *reader, int titleSetNr):
+    cdef PyThreadState *state
+    cdef ifo_handle_t *handle
+
+    state = PyEval_SaveThread()
+    handle = ifoOpen(reader, titleSetNr)
+    PyEval_RestoreThread(state)
+
+    return handle
+
+cdef void closeInfoFile(ifo_handle_t *handle):
+    cdef PyThreadState *state
+
+    state = PyEval_SaveThread()
+    ifoClose(handle)
+    PyEval_RestoreThread(state)
+
+cdef void printInfo(dvd_reader_t *reader, int titleNr):
+    cdef PyThreadState *state
+
+    state = PyEval_SaveThread()
+    ifoPrint(reader, titleNr)
+    PyEval_RestoreThread(state)
+
+
+cdef object readInfoFileData(dvd_reader_t *reader, int titleNr):
+    # Return the contents of the information file of title set
+    # 'titleNr' as a string.
+    cdef dvd_file_t *file
+    cdef ssize_t size
+
+    file = openFile(reader, titleNr, DVD_READ_INFO_FILE)
+    if file == NULL:
+        raise IOError, 'Cannot open information file for title %d' % \
+              titleNr
+
+    # File sizes are given in blocks.
+    size = DVDFileSize(file)
+    if size < 0:
+        closeFile(file)
+        raise DVDReadError, \
+              'Cannot get size of information file for title %d' % \
+              titleNr
+    size = size * 2048
+
+    data = PyString_FromStringAndSize(NULL, size)
+    if readBytes(file, PyString_AsString(data), size) != size:
+        closeFile(file)
+        raise DVDReadError, \
+              'Cannot read information file for title %d' % titleNr
+    closeFile(file)
+
+    return data
+
+
 # The dvd_read_domain_t enumeration.
 DOMAIN_INFO_FILE = DVD_READ_INFO_FILE
 DOMAIN_INFO_BACKUP_FILE = DVD_READ_INFO_BACKUP_FILE
@@ -251,6 +409,22 @@ cdef class CommandSet:
 
         return wrapCommand(self.commands + (commandNr - 1))
 
+    def __richcmp__(CommandSet self, CommandSet other, op):
+        # Command sets are wrapped again every time they are
+        # requested. Two wrappers are equal if they refer to the same
+        # commands in the IFO.
+        res = (self.commands == other.commands and \
+               self.count == other.count)
+        if op == 2:
+            return res
+        elif op == 3:
+            return not res
+        else:
+            raise NotImplementedError
+
+    def __hash__(self):
+        return <long>self.commands ^ self.count
+
 cdef wrapCommandSet(vm_cmd_t *commands, int count):
     cdef CommandSet set
 
@@ -372,6 +546,12 @@ cdef class ProgramChain:
     cdef object clutArray	# A 16-position array with the color
                                 # lookup table.
 
+    cdef object rangeStarts	# Sector range table (see
+    cdef object rangeEnds	# buildRangeTable).
+    cdef object rangeCells
+
+    cdef object __weakref__
+
     def __new__(self):
         self.pointer = NULL
         self.chain = NULL
@@ -402,8 +582,13 @@ cdef class ProgramChain:
 
         self.clutArray = None
 
+        self.rangeStarts = None
+
     def __richcmp__(ProgramChain self, ProgramChain other, op):
-        res = (self.chain == other.chain)
+        # Wrappers are cached (see wrapProgramChain), so equal program
+        # chains are normally the same object. Separate search
+        # pointers may still refer to the same chain, though.
+        res = self is other or self.chain == other.chain
         if op == 2:
             return res
         elif op == 3:
@@ -471,15 +656,64 @@ cdef class ProgramChain:
             
             return self.container.getProgramChain(self.chain.goup_pgc_nr)
 
+    cdef buildRangeTable(self):
+        # Build a table of disjoint sector ranges, sorted by start
+        # sector, with the number of the cell each range belongs
+        # to. When cells overlap, sectors belong to the first cell
+        # containing them. All cells in an angle block are mapped to
+        # the first cell in the block, since the angle is chosen when
+        # linking to that cell.
+        cdef int i, j, first, last
+
+        # Split the sector space at all cell boundaries.
+        bounds = {}
+        for cell in self.cells:
+            bounds[cell.firstSector] = True
+            bounds[cell.lastSector + 1] = True
+        bounds = bounds.keys()
+        bounds.sort()
+
+        owners = [0] * len(bounds)
+        blockCellNr = 0
+        for cell in self.cells:
+            if cell.blockMode == CELL_BLOCK_MODE_NORMAL or \
+               cell.blockMode == CELL_BLOCK_MODE_ANGLE_FIRST or \
+               blockCellNr == 0:
+                blockCellNr = cell.cellNr
+
+            first = bisect_left(bounds, cell.firstSector)
+            last = bisect_left(bounds, cell.lastSector + 1)
+            for i from first <= i < last:
+                if owners[i] == 0:
+                    owners[i] = blockCellNr
+
+        # Merge adjacent pieces belonging to the same cell.
+        self.rangeStarts = []
+        self.rangeEnds = []
+        self.rangeCells = []
+        for i from 0 <= i < len(bounds) - 1:
+            if owners[i] == 0:
+                continue
+            j = len(self.rangeCells) - 1
+            if j >= 0 and self.rangeCells[j] == owners[i] and \
+               self.rangeEnds[j] == bounds[i] - 1:
+                self.rangeEnds[j] = bounds[i + 1] - 1
+            else:
+                self.rangeStarts.append(bounds[i])
+                self.rangeEnds.append(bounds[i + 1] - 1)
+                self.rangeCells.append(owners[i])
+
     def getCellFromSector(self, int sector):
         cdef int i
 
-        for i from 0 <= i < self.chain.nr_of_cells:
-            cell = self.getCell(i + 1)
-            if cell.containsSector(sector):
-                return cell
+        if self.rangeStarts is None:
+            self.buildRangeTable()
 
-        return None
+        i = bisect_right(self.rangeStarts, sector) - 1
+        if i < 0 or sector > self.rangeEnds[i]:
+            return None
+
+        return self.cells[self.rangeCells[i] - 1]
 
     property hasTimeMap:
         def __get__(self):
@@ -572,25 +806,39 @@ cdef class ProgramChain:
                 return wrapCommandSet(NULL, 0)
 
 
-cdef ProgramChain wrapProgramChain(object container, int programChainNr,
+cdef ProgramChain wrapProgramChain(DVDInfo dvd, object container,
+                                   int programChainNr,
                                    pgci_srp_t *chainPointer, pgc_t *chain,
                                    vts_tmap_t *time_map):
     cdef ProgramChain wrapper
 
+    if chainPointer != NULL:
+        key = ('programChain', <long>chainPointer)
+    else:
+        key = ('programChain', <long>chain)
+    wrapper = dvd.getWrapper(key)
+    if wrapper is not None:
+        return wrapper
+
     wrapper = ProgramChain()
     if chain == NULL:
         wrapper.init(container, programChainNr, chainPointer,
                      chainPointer.pgc, time_map)
     else:
         wrapper.init(container, programChainNr, chainPointer, chain, time_map)
+
+    dvd.putWrapper(key, wrapper)
     return wrapper
 
 
 cdef class LangUnit:
     cdef readonly container
+    cdef DVDInfo dvd
     
     cdef pgci_lu_t *unit
 
+    cdef object __weakref__
+
     def __new__(self):
         self.unit = NULL
 
@@ -615,8 +863,9 @@ cdef class LangUnit:
            programChainNr > self.unit.pgcit.nr_of_pgci_srp:
             raise IndexError, "program chain number out of range"
 
-        return wrapProgramChain(self, programChainNr, self.unit.pgcit. \
-                                pgci_srp + (programChainNr - 1), NULL, NULL)
+        return wrapProgramChain(self.dvd, self, programChainNr,
+                                self.unit.pgcit.pgci_srp + \
+                                (programChainNr - 1), NULL, NULL)
 
     def getMenuProgramChain(self, int menuType):
         cdef int i
@@ -630,13 +879,21 @@ cdef class LangUnit:
         return None
 
 
-cdef LangUnit wrapLangUnit(object container, pgci_lu_t *unit):
+cdef LangUnit wrapLangUnit(DVDInfo dvd, object container,
+                           pgci_lu_t *unit):
     cdef LangUnit wrapper
 
+    key = ('langUnit', <long>unit)
+    wrapper = dvd.getWrapper(key)
+    if wrapper is not None:
+        return wrapper
+
     wrapper = LangUnit()
     wrapper.container = container
+    wrapper.dvd = dvd
     wrapper.unit = unit
 
+    dvd.putWrapper(key, wrapper)
     return wrapper
 
 
@@ -646,6 +903,8 @@ cdef class Chapter:
 
     cdef ptt_info_t *chapter
 
+    cdef object __weakref__
+
     def __new__(self, VideoTitle title, int chapterNr):
         self.title = title
         self.chapterNr = chapterNr
@@ -678,6 +937,8 @@ cdef class VideoTitle:
 
     cdef readonly int titleNrInManager
 
+    cdef object __weakref__
+
     def __new__(self, VideoManager videoManager, int titleNrInManager):
         self.videoManager = videoManager
         self.titleNrInManager = titleNrInManager
@@ -702,7 +963,18 @@ cdef class VideoTitle:
             return self.title.nr_of_ptts
 
     def getChapter(self, int chapterNr):
-        return Chapter(self, chapterNr)
+        cdef DVDInfo dvd
+
+        # getWrapper and putWrapper are C methods. They can only be
+        # called through a typed reference.
+        dvd = self.videoManager.dvd
+
+        key = ('chapter', self.titleNrInManager, chapterNr)
+        chapter = dvd.getWrapper(key)
+        if chapter is None:
+            chapter = Chapter(self, chapterNr)
+            dvd.putWrapper(key, chapter)
+        return chapter
 
     property angleCount:
         def __get__(self):
@@ -876,22 +1148,15 @@ cdef class VideoTitleSet:
     cdef readonly int titleSetNr
 
     def __new__(self, DVDInfo dvd, int titleSetNr):
+        # The information file is opened by the video manager (see
+        # VideoManager.loadVideoTitleSet).
         self.dvd = dvd
         self.titleSetNr = titleSetNr
-
-        self.handle = ifoOpen(dvd.reader, titleSetNr)
-        retries = 0
-        while self.handle == NULL and retries < 3:
-            time.sleep(2)
-            self.handle = ifoOpen(dvd.reader, titleSetNr)
-            retries = retries + 1
-
-        if self.handle == NULL:
-            raise DVDReadError, \
-                  "Could not open video title set %d" % titleSetNr
+        self.handle = NULL
 
     def __dealloc__(self):
-        ifoClose(self.handle)
+        if self.handle != NULL:
+            closeInfoFile(self.handle)
 
     property videoManager:
         def __get__(self):
@@ -939,7 +1204,7 @@ cdef class VideoTitleSet:
             timeMap = self.handle.vts_tmapt.tmap + (programChainNr - 1)
         else:
             timeMap = NULL
-        return wrapProgramChain(self, programChainNr,
+        return wrapProgramChain(self.dvd, self, programChainNr,
                                 self.handle.vts_pgcit.pgci_srp + \
                                 (programChainNr - 1), NULL, timeMap)
 
@@ -964,7 +1229,7 @@ cdef class VideoTitleSet:
                langUnitNr > self.langUnitCount:
                 return IndexError, "language unit number out of range"
 
-            return wrapLangUnit(self, self.handle.pgci_ut.lu + \
+            return wrapLangUnit(self.dvd, self, self.handle.pgci_ut.lu + \
                                 (langUnitNr - 1))
 
         elif isinstance(langUnitId, str):
@@ -977,7 +1242,8 @@ cdef class VideoTitleSet:
             for i from 0 <= i < self.langUnitCount:
                 unit = self.handle.pgci_ut.lu + i
                 if unit.lang_code == code:
-                    return wrapLangUnit(self, self.handle.pgci_ut.lu + i)
+                    return wrapLangUnit(self.dvd, self,
+                                        self.handle.pgci_ut.lu + i)
 
             return None
 
@@ -1042,20 +1308,22 @@ cdef class VideoManager:
     cdef readonly DVDInfo dvd
     cdef ifo_handle_t *handle
 
-    cdef videoTitleSets
+    cdef videoTitleSets		# Loaded title sets or None.
 
     def __new__(self, DVDInfo dvd):
-        cdef int i
-
         self.dvd = dvd
-        self.handle = ifoOpen(dvd.reader, 0)
+        self.handle = openInfoFile(dvd.reader, 0)
+        if self.handle == NULL:
+            raise DVDReadError, "Could not open video manager"
 
-        self.videoTitleSets = []
-        for i from 1 <= i <= self.handle.vmgi_mat.vmg_nr_of_title_sets:
-            self.videoTitleSets.append(VideoTitleSet(self.dvd, i))
+        # Title sets are loaded on first access (see
+        # getVideoTitleSet).
+        self.videoTitleSets = \
+            [None] * self.handle.vmgi_mat.vmg_nr_of_title_sets
 
     def __dealloc__(self):
-        ifoClose(self.handle)
+        if self.handle != NULL:
+            closeInfoFile(self.handle)
 
     property titleSetNr:
         def __get__(self):
@@ -1080,26 +1348,109 @@ cdef class VideoManager:
 
     property firstPlay:
         def __get__(self):
-            return wrapProgramChain(self, 0, NULL, self.handle.first_play_pgc,
-                                    NULL)
+            return wrapProgramChain(self.dvd, self, 0, NULL,
+                                    self.handle.first_play_pgc, NULL)
 
     property videoTitleSetCount:
         def __get__(self):
             return self.handle.vmgi_mat.vmg_nr_of_title_sets
 
     def getVideoTitleSet(self, int titleSetNr):
+        return self.loadVideoTitleSet(titleSetNr, 3)
+
+    def prefetchTitleSets(self):
+        """Load all title sets not loaded yet.
+
+        Errors are ignored. They will be reported when the
+        corresponding title set is accessed."""
+        for titleSetNr in range(1, len(self.videoTitleSets) + 1):
+            try:
+                # Don't retry here, a failing title set would keep
+                # the drive busy for nothing.
+                self.loadVideoTitleSet(titleSetNr, 0)
+            except DVDReadError:
+                pass
+
+    cdef object loadVideoTitleSet(self, int titleSetNr, int maxRetries):
+        cdef VideoTitleSet titleSet
+        cdef ifo_handle_t *handle
+        cdef int stored
+        cdef int retries
+
         if titleSetNr < 1 or \
            titleSetNr > self.handle.vmgi_mat.vmg_nr_of_title_sets:
             raise IndexError, "video title set number out of range"
 
-        return self.videoTitleSets[titleSetNr - 1]
+        titleSet = self.videoTitleSets[titleSetNr - 1]
+        if titleSet is not None:
+            return titleSet
+
+        retries = 0
+        stored = 0
+        while 1:
+            data = None
+            self.dvd.readerLock.acquire()
+            try:
+                # Check again, the title set may have been loaded
+                # while waiting for the lock.
+                titleSet = self.videoTitleSets[titleSetNr - 1]
+                if titleSet is None:
+                    handle = openInfoFile(self.dvd.reader, titleSetNr)
+                    if handle == NULL and self.dvd.discPath is not None:
+                        # Missing or damaged in the cache directory.
+                        if self.dvd.discReader == NULL:
+                            self.dvd.discReader = \
+                                openReader(self.dvd.discPath)
+                        if self.dvd.discReader != NULL:
+                            if stored or self.dvd.storeInfoFile is None:
+                                # Parse it from the disc directly.
+                                handle = openInfoFile(self.dvd.discReader,
+                                                      titleSetNr)
+                            else:
+                                # Read the file only once, and parse
+                                # it from the stored copy.
+                                try:
+                                    data = readInfoFileData(
+                                        self.dvd.discReader, titleSetNr)
+                                except (IOError, DVDReadError):
+                                    pass
+
+                    if handle != NULL:
+                        titleSet = VideoTitleSet(self.dvd, titleSetNr)
+                        titleSet.handle = handle
+                        self.videoTitleSets[titleSetNr - 1] = titleSet
+            finally:
+                self.dvd.readerLock.release()
+
+            if titleSet is not None:
+                return titleSet
+
+            if data is not None:
+                # Possibly slow, done without the lock.
+                self.dvd.storeInfoFile(titleSetNr, data)
+                stored = 1
+                continue
+
+            if retries >= maxRetries:
+                raise DVDReadError, \
+                      "Could not open video title set %d" % titleSetNr
+
+            # Give the drive some time to recover. The lock is not
+            # held here, so that other threads can keep reading.
+            time.sleep(2)
+            retries = retries + 1
 
     property videoTitleCount:
         def __get__(self):
             return self.handle.tt_srpt.nr_of_srpts
 
     def getVideoTitle(self, int titleNr):
-        return VideoTitle(self, titleNr)
+        key = ('videoTitle', titleNr)
+        title = self.dvd.getWrapper(key)
+        if title is None:
+            title = VideoTitle(self, titleNr)
+            self.dvd.putWrapper(key, title)
+        return title
 
     property langUnitCount:
         def __get__(self):
@@ -1122,7 +1473,7 @@ cdef class VideoManager:
                langUnitNr > self.langUnitCount:
                 return IndexError, "language unit number out of range"
 
-            return wrapLangUnit(self, self.handle.pgci_ut.lu + \
+            return wrapLangUnit(self.dvd, self, self.handle.pgci_ut.lu + \
                                 (langUnitNr - 1))
 
         elif isinstance(langUnitId, str):
@@ -1135,7 +1486,8 @@ cdef class VideoManager:
             for i from 0 <= i < self.langUnitCount:
                 unit = self.handle.pgci_ut.lu + i
                 if unit.lang_code == code:
-                    return wrapLangUnit(self, self.handle.pgci_ut.lu + i)
+                    return wrapLangUnit(self.dvd, self,
+                                        self.handle.pgci_ut.lu + i)
 
             return None
 
@@ -1167,25 +1519,222 @@ cdef class VideoManager:
 
 cdef class DVDInfo:
     cdef dvd_reader_t *reader
+    cdef object readerLock	# Serializes the use of both readers.
+
+    cdef object discPath	# Disc for title sets missing in path, or None.
+    cdef dvd_reader_t *discReader	# Opened on first use.
+    cdef object storeInfoFile	# Stores files read from discPath.
 
     cdef vmg
 
-    def __new__(self, path):
-        self.reader = DVDOpen(path)
+    cdef object wrappers	# Canonical wrapper objects by key (weak).
+    cdef readonly int cacheHits
+    cdef readonly int cacheMisses
+
+    def __new__(self, path, prefetch=True, discPath=None,
+                storeInfoFile=None):
+        # If 'discPath' is given, 'path' is a directory holding copies
+        # of some of the information files of the disc in
+        # 'discPath'. Title sets that cannot be opened from 'path'
+        # are read from the disc. If 'storeInfoFile' is not None, it
+        # is called with the title set number and the contents of the
+        # information file, and is expected to store the file in
+        # 'path', from where it is then parsed.
+        self.discPath = discPath
+        self.discReader = NULL
+        self.storeInfoFile = storeInfoFile
+
+        # Wrapper objects are created on demand. In order to avoid
+        # creating them over and over again, the wrapper for a given
+        # structure is kept here as long as it is referenced from
+        # somewhere else.
+        self.wrappers = weakref.WeakValueDictionary()
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+        self.reader = openReader(path)
         if self.reader == NULL:
             raise IOError, 'Cannot open DVD in path %s' % path
+        self.readerLock = threading.Lock()
 
         self.vmg = VideoManager(self)
 
-        DVDClose(self.reader)
+        if prefetch:
+            # Load the title sets in the background. A single thread
+            # is used, because the reader cannot be shared and a
+            # drive cannot do parallel reads anyway.
+            thread = threading.Thread(None, self.vmg.prefetchTitleSets,
+                                      'Title set prefetch')
+            thread.setDaemon(True)
+            thread.start()
+
+    def __dealloc__(self):
+        if self.reader != NULL:
+            closeReader(self.reader)
+        if self.discReader != NULL:
+            closeReader(self.discReader)
 
     def ifoPrint(self, int title):
-        ifoPrint(self.reader, title)
+        self.readerLock.acquire()
+        try:
+            printInfo(self.reader, title)
+        finally:
+            self.readerLock.release()
 
     property videoManager:
         def __get__(self):
             return self.vmg
 
+    cdef object getWrapper(self, key):
+        # Return the cached wrapper object for 'key' or None if there
+        # is none.
+        wrapper = self.wrappers.get(key)
+        if wrapper is None:
+            self.cacheMisses = self.cacheMisses + 1
+        else:
+            self.cacheHits = self.cacheHits + 1
+        return wrapper
+
+    cdef object putWrapper(self, key, wrapper):
+        self.wrappers[key] = wrapper
+
+    property cacheSize:
+        # Number of wrapper objects currently cached.
+        def __get__(self):
+            return len(self.wrappers)
+
+
+def getDiscId(path):
+    """Return a string identifying the disc in `path`.
+
+    The string is made of the UDF volume identifiers (if available)
+    and the first block of the video manager information file, which
+    are cheap to read. Title set information files are not read."""
+    cdef dvd_reader_t *reader
+    cdef dvd_file_t *file
+    cdef char volId[33]
+    cdef unsigned char volSetId[128]
+    cdef char header[2048]
+    cdef ssize_t length
+
+    reader = openReader(path)
+    if reader == NULL:
+        raise IOError, 'Cannot open DVD in path %s' % path
+
+    try:
+        if getVolumeInfo(reader, volId, 33, volSetId, 128) == 0:
+            discId = volId + \
+                     PyString_FromStringAndSize(<char *>volSetId, 128)
+        else:
+            # Not an UDF file system, probably a directory.
+            discId = ''
+
+        file = openFile(reader, 0, DVD_READ_INFO_FILE)
+        if file == NULL:
+            raise DVDReadError, \
+                  'Cannot open video manager information file'
+        length = readBytes(file, header, 2048)
+        closeFile(file)
+        if length != 2048:
+            raise DVDReadError, \
+                  'Cannot read video manager information file'
+    finally:
+        closeReader(reader)
+
+    return discId + PyString_FromStringAndSize(header, 2048)
+
+
+#
+# VOB File Support
+#
+
+# Size of a DVD block in bytes.
+BLOCK_SIZE = 2048
+
+cdef class BlockReader:
+    """A reader for the blocks in the VOB files of a disc.
+
+    The reader keeps the last used file open, so that reading
+    consecutive blocks from the same domain and title set is
+    cheap. Reads don't hold the global interpreter lock, but a reader
+    can be safely shared between threads."""
+
+    cdef dvd_reader_t *reader
+    cdef dvd_file_t *file
+    cdef int domain
+    cdef int titleNr
+
+    cdef object lock		# Serializes the use of the reader.
+
+    def __new__(self, path):
+        self.file = NULL
+        self.domain = -1
+        self.titleNr = -1
+
+        self.lock = threading.Lock()
+
+        self.reader = openReader(path)
+        if self.reader == NULL:
+            raise IOError, 'Cannot open DVD in path %s' % path
+
+    def __dealloc__(self):
+        if self.file != NULL:
+            closeFile(self.file)
+        if self.reader != NULL:
+            closeReader(self.reader)
+
+    def read(self, int domain, int titleNr, int sectorNr, int count=1):
+        """Read `count` blocks starting at sector `sectorNr` of the
+        VOB file for `domain` in title set `titleNr`. The blocks are
+        returned as a string."""
+        self.lock.acquire()
+        try:
+            return self.readFromFile(domain, titleNr, sectorNr, count)
+        finally:
+            self.lock.release()
+
+    cdef object readFromFile(self, int domain, int titleNr, int sectorNr,
+                             int count):
+        cdef unsigned char *buffer
+
+        data = PyString_FromStringAndSize(NULL, count * BLOCK_SIZE)
+        buffer = <unsigned char *>PyString_AsString(data)
+        self.readIntoBuffer(domain, titleNr, sectorNr, count, buffer)
+
+        return data
+
+    cdef object readIntoBuffer(self, int domain, int titleNr, int sectorNr,
+                               int count, unsigned char *buffer):
+        if self.file == NULL or self.domain != domain or \
+           self.titleNr != titleNr:
+            if self.file != NULL:
+                closeFile(self.file)
+
+            self.file = openFile(self.reader, titleNr,
+                                 <dvd_read_domain_t>domain)
+            if self.file == NULL:
+                self.domain = -1
+                self.titleNr = -1
+                raise IOError, 'Cannot open title %d, domain %d' % \
+                      (titleNr, domain)
+
+            self.domain = domain
+            self.titleNr = titleNr
+
+        if readBlocks(self.file, sectorNr, count, buffer) != count:
+            raise DVDReadError, \
+                  'Cannot read blocks, title %d, domain %d, offset %d' % \
+                  (titleNr, domain, sectorNr)
+
+    def readInfoFile(self, int titleNr):
+        """Read the information (IFO) file of title set `titleNr` (0
+        for the video manager) and return its contents as a string."""
+        self.lock.acquire()
+        try:
+            return readInfoFileData(self.reader, titleNr)
+        finally:
+            self.lock.release()
+
 
 #
 # NAV Packet Support
@@ -1204,6 +1753,8 @@ cdef class Button:
     cdef readonly NavPacket nav
     cdef btni_t *btn
 
+    cdef object __weakref__
+
     property area:
         def __get__(self):
             return (self.btn.x_start, self.btn.y_start,
@@ -1269,22 +1820,56 @@ cdef getBidiPointer(unsigned long value):
     else:
         return ptr
 
+# Flags for the parts of a nav packet already decoded.
+cdef enum:
+    NAV_DECODED_PCI = 0x1
+    NAV_DECODED_DSI = 0x2
+
 cdef class NavPacket:
-    cdef pci_t pci
-    cdef dsi_t dsi
+    cdef object buffer		# Object holding the raw packet data.
+    cdef char *data		# Contents of 'buffer'.
+    cdef int decoded		# Decoded parts (NAV_DECODED_* flags).
+
+    cdef pci_t pci		# Only valid after calling getPCI.
+    cdef dsi_t dsi		# Only valid after calling getDSI.
+
+    cdef object buttons		# Button wrappers by position (weak),
+                                # created on demand.
 
     def __new__(self, buffer):
         cdef char *data
         cdef int length
 
+        self.buffer = None
+        self.data = NULL
+        self.decoded = 0
+        self.buttons = None
+
         if PyObject_AsReadBuffer(buffer, &data, &length):
             raise TypeError, 'buffer parameter not a buffer object'
 
         if length < 2048:
             raise ValueError, 'buffer size should be 2048 or more'
 
-        navRead_PCI(&self.pci, <unsigned char *>data + 0x2d);
-        navRead_DSI(&self.dsi, <unsigned char *>data + 0x407);
+        # Use the data in place. The buffer is referenced to keep it
+        # alive, and must not be modified or resized as long as the
+        # packet is in use. Pass a single block (e.g., a subbuffer)
+        # to avoid keeping a larger buffer alive. The PCI and DSI
+        # packets are decoded only when first used.
+        self.buffer = buffer
+        self.data = data
+
+    cdef pci_t *getPCI(self):
+        if not self.decoded & NAV_DECODED_PCI:
+            navRead_PCI(&self.pci, <unsigned char *>self.data + 0x2d)
+            self.decoded = self.decoded | NAV_DECODED_PCI
+        return &self.pci
+
+    cdef dsi_t *getDSI(self):
+        if not self.decoded & NAV_DECODED_DSI:
+            navRead_DSI(&self.dsi, <unsigned char *>self.data + 0x407)
+            self.decoded = self.decoded | NAV_DECODED_DSI
+        return &self.dsi
 
 
     #
@@ -1293,11 +1878,11 @@ cdef class NavPacket:
 
     property nextVobu:
         def __get__(self):
-            return getSimplePointer(self.dsi.vobu_sri.next_vobu)
+            return getSimplePointer(self.getDSI().vobu_sri.next_vobu)
 
     property prevVobu:
         def __get__(self):
-            return getSimplePointer(self.dsi.vobu_sri.prev_vobu)
+            return getSimplePointer(self.getDSI().vobu_sri.prev_vobu)
 
     def getForwardVobu(self, int intervalId):
         cdef uint32_t offset
@@ -1305,7 +1890,7 @@ cdef class NavPacket:
         if intervalId < 0 or intervalId > 18:
             raise IndexError, "forward VOBU interval id out of range"
 
-        offset = self.dsi.vobu_sri.fwda[intervalId]
+        offset = self.getDSI().vobu_sri.fwda[intervalId]
         if offset & 0x80000000:
             return offset & 0x3fffffff
         else:
@@ -1317,7 +1902,7 @@ cdef class NavPacket:
         if intervalId < 0 or intervalId > 18:
             raise IndexError, "backward VOBU interval id out of range"
 
-        offset = self.dsi.vobu_sri.bwda[intervalId]
+        offset = self.getDSI().vobu_sri.bwda[intervalId]
         if offset & 0x80000000:
             return offset & 0x3fffffff
         else:
@@ -1325,11 +1910,11 @@ cdef class NavPacket:
 
     property nextVideoVobu:
         def __get__(self):
-            return getSimplePointer(self.dsi.vobu_sri.next_video)
+            return getSimplePointer(self.getDSI().vobu_sri.next_video)
 
     property prevVideoVobu:
         def __get__(self):
-            return getSimplePointer(self.dsi.vobu_sri.prev_video)
+            return getSimplePointer(self.getDSI().vobu_sri.prev_video)
 
 
     #
@@ -1338,15 +1923,15 @@ cdef class NavPacket:
 
     property startTime:
         def __get__(self):
-            return self.pci.pci_gi.vobu_s_ptm
+            return self.getPCI().pci_gi.vobu_s_ptm
 
     property endTime:
         def __get__(self):
-            return self.pci.pci_gi.vobu_e_ptm
+            return self.getPCI().pci_gi.vobu_e_ptm
 
     property cellElapsedTime:
         def __get__(self):
-            return wrapTime(&(self.pci.pci_gi.e_eltm))
+            return wrapTime(&(self.getPCI().pci_gi.e_eltm))
 
 
     #
@@ -1355,15 +1940,18 @@ cdef class NavPacket:
 
     property buttonCount:
         def __get__(self):
-            return self.pci.hli.hl_gi.btn_ns
+            return self.getPCI().hli.hl_gi.btn_ns
 
     def getButton(self, int buttonNr, int subpictureType):
         cdef int groupCount
         cdef int mask
         cdef int group
         cdef int buttonPos
+        cdef pci_t *pci
 
-        if not 1 <= buttonNr <= self.pci.hli.hl_gi.btn_ns:
+        pci = self.getPCI()
+
+        if not 1 <= buttonNr <= pci.hli.hl_gi.btn_ns:
             raise IndexError, "button number out of range"
 
         # Calculate the mask.
@@ -1378,7 +1966,7 @@ cdef class NavPacket:
         else:
             raise IndexError, "subpicture type out of range"
 
-        groupCount = self.pci.hli.hl_gi.btngr_ns
+        groupCount = pci.hli.hl_gi.btngr_ns
         if not 1 <= groupCount <= 3:
             # This shouln't happen, but you never know.
             groupCount = 1
@@ -1388,25 +1976,25 @@ cdef class NavPacket:
 
             # Try finding a group that matches the mask exactly.
             if groupCount >= 1 and \
-               self.pci.hli.hl_gi.btngr1_dsp_ty & mask:
+               pci.hli.hl_gi.btngr1_dsp_ty & mask:
                 group = 0
             elif groupCount >= 2 and \
-                 self.pci.hli.hl_gi.btngr2_dsp_ty & mask:
+                 pci.hli.hl_gi.btngr2_dsp_ty & mask:
                 group = 1
             elif groupCount >= 3 and \
-                 self.pci.hli.hl_gi.btngr3_dsp_ty & mask:
+                 pci.hli.hl_gi.btngr3_dsp_ty & mask:
                 group = 3
 
         if mask == 0 or group == -1:
             # Look for a standard 4:3 group.
             if groupCount >= 1 and \
-               self.pci.hli.hl_gi.btngr1_dsp_ty == 0:
+               pci.hli.hl_gi.btngr1_dsp_ty == 0:
                 group = 0
             elif groupCount >= 2 and \
-                 self.pci.hli.hl_gi.btngr2_dsp_ty == 0:
+                 pci.hli.hl_gi.btngr2_dsp_ty == 0:
                 group = 1
             elif groupCount >= 3 and \
-                 self.pci.hli.hl_gi.btngr3_dsp_ty == 0:
+                 pci.hli.hl_gi.btngr3_dsp_ty == 0:
                 group = 3
 
         if group == -1:
@@ -1415,19 +2003,26 @@ cdef class NavPacket:
             group = 0
 
         buttonPos = (36 / groupCount) * group + buttonNr - 1
-        return wrapButton(self, &(self.pci.hli.btnit[buttonPos]))
+
+        if self.buttons is None:
+            self.buttons = weakref.WeakValueDictionary()
+        button = self.buttons.get(buttonPos)
+        if button is None:
+            button = wrapButton(self, &(pci.hli.btnit[buttonPos]))
+            self.buttons[buttonPos] = button
+        return button
 
     property highlightStatus:
         def __get__(self):
-            return self.pci.hli.hl_gi.hli_ss
+            return self.getPCI().hli.hl_gi.hli_ss
 
     property forcedSelect:
         def __get__(self):
-            return self.pci.hli.hl_gi.fosl_btnn
+            return self.getPCI().hli.hl_gi.fosl_btnn
 
     property forcedActivate:
         def __get__(self):
-            return self.pci.hli.hl_gi.foac_btnn
+            return self.getPCI().hli.hl_gi.foac_btnn
 
     #
     # Angles
@@ -1437,49 +2032,49 @@ cdef class NavPacket:
         if not 1 <= angleNr <= 9:
             raise IndexError, "Angle number out of range"
 
-        return getBidiPointer(self.pci. \
+        return getBidiPointer(self.getPCI(). \
                               nsml_agli.nsml_agl_dsta[angleNr - 1])
 
     property preInterleaved:
         def __get__(self):
-            return self.dsi.sml_pbi.category & 0x8000;
+            return self.getDSI().sml_pbi.category & 0x8000;
 
     property interleaved:
         def __get__(self):
-            return self.dsi.sml_pbi.category & 0x4000;
+            return self.getDSI().sml_pbi.category & 0x4000;
 
     property unitStart:
         def __get__(self):
-            return self.dsi.sml_pbi.category & 0x2000;
+            return self.getDSI().sml_pbi.category & 0x2000;
 
     property unitEnd:
         def __get__(self):
-            return self.dsi.sml_pbi.category & 0x1000;
+            return self.getDSI().sml_pbi.category & 0x1000;
 
     property seamlessEndInterleavedUnit:
         def __get__(self):
-            return self.dsi.sml_pbi.ilvu_ea
+            return self.getDSI().sml_pbi.ilvu_ea
 
     property seamlessNextInterleavedUnit:
         def __get__(self):
-            return self.dsi.sml_pbi.ilvu_sa
+            return self.getDSI().sml_pbi.ilvu_sa
 
     property seamlessInterlevedUnitSize:
         def __get__(self):
-            return self.dsi.sml_pbi.size
+            return self.getDSI().sml_pbi.size
 
     def getSeamlessNextInterleavedUnit(self, angleNr):
         if not 1 <= angleNr <= 9:
             raise IndexError, "Angle number out of range"
 
-        return getBidiPointer(self.dsi. \
+        return getBidiPointer(self.getDSI(). \
                               sml_agli.data[angleNr - 1].address)
 
     def getSeamlessNextInterleavedUnitSize(self, angleNr):
         if not 1 <= angleNr <= 9:
             raise IndexError, "Angle number out of range"
 
-        return self.dsi.sml_agli.data[angleNr - 1].size
+        return self.getDSI().sml_agli.data[angleNr - 1].size
 
 
     #
@@ -1490,10 +2085,142 @@ cdef class NavPacket:
         if streamNr < 1 or streamNr > 8:
             raise IndexError, "audio stream number out of range"
 
-        return self.dsi.synci.a_synca[streamNr - 1]
+        return self.getDSI().synci.a_synca[streamNr - 1]
 
     def getFirstSubpictureOffset(self, int streamNr):
         if streamNr < 1 or streamNr > 32:
             raise IndexError, "subpicture stream number out of range"
 
-        return self.dsi.synci.sp_synca[streamNr - 1]
+        return self.getDSI().synci.sp_synca[streamNr - 1]
+
+
+#
+# NAV Packet Tables
+#
+
+# Value of VOBU pointer columns in a `NavTable` when the pointer isn't
+# set.
+NAV_NO_VOBU = 0x3fffffff
+
+# Bits in the 'interleaveFlags' column of a `NavTable`.
+NAV_PRE_INTERLEAVED = 0x8000
+NAV_INTERLEAVED = 0x4000
+NAV_UNIT_START = 0x2000
+NAV_UNIT_END = 0x1000
+
+# Number of audio offsets stored per VOBU.
+NAV_AUDIO_STREAMS = 8
+
+class NavTable(object):
+    """The navigation packets of a range of VOBUs, stored as columns.
+
+    Every column is an `array.array` with one entry per VOBU (entry
+    `i` of all columns corresponds to the same VOBU), except for
+    'audioOffsets', that contains `NAV_AUDIO_STREAMS` consecutive
+    entries per VOBU. VOBU pointers are relative sector numbers, as
+    in `NavPacket`, with `NAV_NO_VOBU` in place of `None`. Cell
+    elapsed times are given in seconds."""
+
+    __slots__ = ('sector',
+                 'startTime',
+                 'endTime',
+                 'nextVobu',
+                 'prevVobu',
+                 'nextVideoVobu',
+                 'audioOffsets',
+                 'cellElapsedTime',
+                 'interleaveFlags')
+
+    def __init__(self):
+        self.sector = array('L')
+        self.startTime = array('L')
+        self.endTime = array('L')
+        self.nextVobu = array('L')
+        self.prevVobu = array('L')
+        self.nextVideoVobu = array('L')
+        self.audioOffsets = array('H')
+        self.cellElapsedTime = array('d')
+        self.interleaveFlags = array('H')
+
+    def __len__(self):
+        return len(self.sector)
+
+cdef double timeToSeconds(dvd_time_t *time):
+    cdef double seconds
+
+    seconds = (extractBCD(time.hour) * 60.0 + extractBCD(time.minute)) * \
+              60.0 + extractBCD(time.second)
+    if time.frame_u >> 6 == 0x3:
+        seconds = seconds + extractBCD(time.frame_u & 0x3f) / 30.0
+    elif time.frame_u >> 6 == 0x1:
+        seconds = seconds + extractBCD(time.frame_u & 0x3f) / 25.0
+
+    return seconds
+
+cdef int isNavBlock(unsigned char *block):
+    # A nav pack starts with a pack header, and has a system header
+    # followed by the PCI private stream 2 packet at offset 0x26.
+    return block[0] == 0 and block[1] == 0 and block[2] == 1 and \
+           block[3] == 0xba and block[0x26] == 0 and block[0x27] == 0 and \
+           block[0x28] == 1 and block[0x29] == 0xbf
+
+def readNavTable(BlockReader reader, int domain, int titleNr,
+                 int firstSector, int lastSector):
+    """Read the navigation packets of all VOBUs between sectors
+    'firstSector' and 'lastSector' (inclusive) of the VOB file for
+    'domain' in title set 'titleNr', and return them as a `NavTable`.
+
+    'firstSector' must be the first sector of a VOBU. The VOBUs are
+    visited in the order they are stored, using the VOBU end address
+    of every DSI packet, so that interleaved VOBUs of all angles are
+    included. Blocks are read with 'reader'. No `NavPacket` objects
+    are created."""
+    cdef unsigned char block[2048]
+    cdef pci_t pci
+    cdef dsi_t dsi
+    cdef int sectorNr
+    cdef int i
+
+    table = NavTable()
+
+    # Bound methods, to avoid looking them up for every VOBU.
+    appendSector = table.sector.append
+    appendStartTime = table.startTime.append
+    appendEndTime = table.endTime.append
+    appendNextVobu = table.nextVobu.append
+    appendPrevVobu = table.prevVobu.append
+    appendNextVideoVobu = table.nextVideoVobu.append
+    appendAudioOffset = table.audioOffsets.append
+    appendCellElapsedTime = table.cellElapsedTime.append
+    appendInterleaveFlags = table.interleaveFlags.append
+
+    sectorNr = firstSector
+    while sectorNr <= lastSector:
+        reader.lock.acquire()
+        try:
+            reader.readIntoBuffer(domain, titleNr, sectorNr, 1, block)
+        finally:
+            reader.lock.release()
+
+        if not isNavBlock(block):
+            raise DVDReadError, \
+                  'No navigation packet, title %d, domain %d, offset %d' % \
+                  (titleNr, domain, sectorNr)
+
+        navRead_PCI(&pci, block + 0x2d)
+        navRead_DSI(&dsi, block + 0x407)
+
+        appendSector(sectorNr)
+        appendStartTime(pci.pci_gi.vobu_s_ptm)
+        appendEndTime(pci.pci_gi.vobu_e_ptm)
+        appendNextVobu(dsi.vobu_sri.next_vobu & 0x3fffffff)
+        appendPrevVobu(dsi.vobu_sri.prev_vobu & 0x3fffffff)
+        appendNextVideoVobu(dsi.vobu_sri.next_video & 0x3fffffff)
+        for i from 0 <= i < NAV_AUDIO_STREAMS:
+            appendAudioOffset(dsi.synci.a_synca[i])
+        appendCellElapsedTime(timeToSeconds(&pci.pci_gi.e_eltm))
+        appendInterleaveFlags(dsi.sml_pbi.category & 0xf000)
+
+        sectorNr = sectorNr + dsi.dsi_gi.vobu_ea + 1
+
+    return table
@@ -0,0 +1,153 @@
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""A persistent cache of the information files of DVD discs.
+
+Reading and parsing the information (IFO) files of a disc can take a
+few seconds when the drive has to spin up. Information files are
+copied to a directory in the user's cache directory, named after a
+fingerprint of the disc, and the `DVDInfo` object for the disc is
+created from that directory. The video manager file is copied when
+the disc is first opened. Title set files are copied one at a time,
+the first time they are read from the disc, and are then parsed from
+the copy. A title set that cannot be opened from the cache is read
+from the disc again, and its cached copy is replaced."""
+
+import os
+import shutil
+import thread
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from _dvdread import DVDInfo, BlockReader, DVDReadError, getDiscId
+
+
+def getCacheBase():
+    """Return the user's cache directory for the player."""
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'seamless')
+
+def getCacheRoot():
+    """Return the default directory for cached information files."""
+    return os.path.join(getCacheBase(), 'ifo')
+
+def getFingerprint(location):
+    """Return the fingerprint of the disc at 'location' as a string
+    of hexadecimal digits."""
+    return md5(getDiscId(location)).hexdigest()
+
+def getInfoFileName(titleSetNr):
+    """Return the name of the information file for title set
+    'titleSetNr' (0 for the video manager)."""
+    if titleSetNr == 0:
+        return 'VIDEO_TS.IFO'
+    else:
+        return 'VTS_%02d_0.IFO' % titleSetNr
+
+def storeInfoFile(data, titleSetNr, videoDir):
+    """Store 'data' as the information file of title set
+    'titleSetNr' in directory 'videoDir'.
+
+    The file is written under a temporary name first, which is
+    renamed at the end, so that an interrupted copy never leaves an
+    incomplete file in the cache."""
+    fileName = os.path.join(videoDir, getInfoFileName(titleSetNr))
+    # Several threads may be storing the same file.
+    tmpName = '%s.%d.%d.tmp' % (fileName, os.getpid(), thread.get_ident())
+    try:
+        infoFile = open(tmpName, 'wb')
+        try:
+            infoFile.write(data)
+        finally:
+            infoFile.close()
+        os.rename(tmpName, fileName)
+    except:
+        if os.path.exists(tmpName):
+            os.remove(tmpName)
+        raise
+
+
+class CacheFiller(object):
+    """Store title set information files in a cache directory as
+    they are read from the disc.
+
+    Instances are passed to `DVDInfo` as the callable invoked with
+    the contents of every title set information file read from the
+    disc."""
+
+    __slots__ = ('videoDir',)
+
+    def __init__(self, videoDir):
+        self.videoDir = videoDir
+
+    def __call__(self, titleSetNr, data):
+        try:
+            storeInfoFile(data, titleSetNr, self.videoDir)
+        except (OSError, IOError):
+            # Don't keep a damaged copy around.
+            try:
+                os.remove(os.path.join(self.videoDir,
+                                       getInfoFileName(titleSetNr)))
+            except OSError:
+                pass
+
+
+def openDVDInfo(location, cacheRoot=None, fingerprint=None):
+    """Return a `DVDInfo` object for the disc at 'location'.
+
+    Information files are read from the cache in 'cacheRoot' (by
+    default, the directory returned by `getCacheRoot`) if available,
+    and stored there as they are read from the disc otherwise.
+    Failing to use the cache is never an error.
+
+    'fingerprint' is the fingerprint of the disc, as returned by
+    `getFingerprint`. It is computed if not given."""
+    if cacheRoot == None:
+        cacheRoot = getCacheRoot()
+
+    if fingerprint == None:
+        try:
+            fingerprint = getFingerprint(location)
+        except DVDReadError:
+            return DVDInfo(location)
+
+    cacheDir = os.path.join(cacheRoot, fingerprint)
+
+    videoDir = os.path.join(cacheDir, 'VIDEO_TS')
+    if not os.path.isfile(os.path.join(videoDir, getInfoFileName(0))):
+        try:
+            if not os.path.isdir(videoDir):
+                os.makedirs(videoDir)
+            storeInfoFile(BlockReader(location).readInfoFile(0), 0,
+                          videoDir)
+        except (OSError, IOError, DVDReadError):
+            return DVDInfo(location)
+
+    try:
+        return DVDInfo(cacheDir, discPath=location,
+                       storeInfoFile=CacheFiller(videoDir))
+    except (IOError, DVDReadError):
+        # Unusable cache entry. Get rid of it.
+        shutil.rmtree(cacheDir, True)
+
+    return DVDInfo(location)
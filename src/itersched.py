@@ -16,6 +16,12 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
 # USA
 
+import sys
+import time
+import marshal
+import StringIO
+import traceback
+
 class IterSchedError(Exception):
     pass
 
@@ -57,6 +63,9 @@ class NoOpInstance(YieldOp):
     def modifySched(self, sched):
         pass
 
+    def __str__(self):
+        return 'NoOp'
+
 NoOp = NoOpInstance()
     
 
@@ -70,6 +79,9 @@ class Call(YieldOp):
     def modifySched(self, sched):
         sched.call(self.called)
 
+    def __str__(self):
+        return 'Call(%s)' % describeItr(self.called)
+
 
 class Chain(YieldOp):
     __slots__ = ('chained')
@@ -80,6 +92,9 @@ class Chain(YieldOp):
 
     def modifySched(self, sched):
         sched.chain(self.chained)
+
+    def __str__(self):
+        return 'Chain(%s)' % describeItr(self.chained)
     
 
 class RestartInstance(YieldOp):
@@ -93,6 +108,12 @@ class RestartInstance(YieldOp):
     def modifySched(self, sched):
         sched.restart(self.methodName, *self.posArgs, **self.kwArgs)
 
+    def __str__(self):
+        args = [repr(arg) for arg in self.posArgs] + \
+               ['%s=%s' % (name, repr(arg))
+                for (name, arg) in self.kwArgs.items()]
+        return 'Restart.%s(%s)' % (self.methodName, ', '.join(args))
+
 class RestartFactory(object):
     __slots__ = ()
 
@@ -104,9 +125,11 @@ Restart = RestartFactory()
 
 
 class RestartableIterator(object):
-    __slots__ = ('instance', 'iter', 'next')
+    __slots__ = ('instance', 'iter', 'next',
+                 'methodName', 'posArgs', 'kwArgs')
 
-    def __init__(self, instance, iterator):
+    def __init__(self, instance, iterator, methodName=None,
+                 posArgs=(), kwArgs={}):
         if not hasattr(iterator, 'next'):
             raise NoIterError
 
@@ -114,6 +137,11 @@ class RestartableIterator(object):
         self.iter = iterator
         self.next = iterator.next
 
+        # The method call that produced the iterator.
+        self.methodName = methodName
+        self.posArgs = posArgs
+        self.kwArgs = kwArgs
+
     def __iter__(self):
         return self
 
@@ -121,7 +149,8 @@ def restartPoint(method):
     def wrapper(self, *posArgs, **kwArgs):
         try:
             return RestartableIterator(self,
-                                       method(self, *posArgs, **kwArgs))
+                                       method(self, *posArgs, **kwArgs),
+                                       method.func_name, posArgs, kwArgs)
         except NoIterError:
             raise NoIterError("Function or method '%s' (%s: %d) must "
                               "be a generator or return an iterator." % \
@@ -132,40 +161,371 @@ def restartPoint(method):
     return wrapper
 
 
+#
+# Yield Operation Dispatch
+#
+
+# Maps the classes of the objects yielded by scheduled iterators to
+# the function handling them in the scheduler. 'None' means that
+# objects of the class must be returned by the scheduler.
+opHandlers = {}
+
+def getOpHandler(cls):
+    """Return the handler for yielded objects of class 'cls', and
+    store it in the dispatch table."""
+    if issubclass(cls, YieldOp):
+        handler = cls.modifySched
+    else:
+        handler = None
+
+    opHandlers[cls] = handler
+    return handler
+
+
+#
+# Profiling
+#
+
+def getCodeKey(itr):
+    """Return a key identifying the code of iterator 'itr'.
+
+    For generators (possibly wrapped by other iterator objects), the
+    key is a '(fileName, lineNr, functionName)' tuple, as used by the
+    'pstats' module. For other iterators, it is based on the iterator
+    type."""
+    gen = getattr(itr.next, '__self__', itr)
+    code = getattr(gen, 'gi_code', None)
+    if code != None:
+        return (code.co_filename, code.co_firstlineno, code.co_name)
+    else:
+        return ('~', 0, '<%s>' % gen.__class__.__name__)
+
+def describeItr(itr):
+    """Return a short string describing iterator 'itr'."""
+    return '%s:%d(%s)' % getCodeKey(itr)
+
+def getTraceKey(op):
+    """Return a tuple describing scheduler operation 'op', to be
+    recorded in a trace buffer.
+
+    The tuple holds only strings and numbers, so that recording it
+    keeps neither the operation nor the iterators it refers to
+    alive."""
+    cls = op.__class__
+    if cls is Call:
+        return ('Call',) + getCodeKey(op.called)
+    elif cls is Chain:
+        return ('Chain',) + getCodeKey(op.chained)
+    elif cls is RestartInstance:
+        return ('Restart', op.methodName)
+    else:
+        return (cls.__name__,)
+
+class ProfileEntry(object):
+    """Profiling information for a single code object."""
+
+    __slots__ = ('resumptions',
+                 'time',	# Total time, in seconds.
+                 'ops',		# YieldOp type name -> count.
+                 'callers')	# Caller code key -> count.
+
+    def __init__(self):
+        self.resumptions = 0
+        self.time = 0.0
+        self.ops = {}
+        self.callers = {}
+
+class SchedulerProfile(object):
+    """Profiling information collected by a scheduler.
+
+    To profile a scheduler, set its 'profile' attribute to an instance
+    of this class. For every generator code object, the profile
+    records the number of times generators were resumed, the total
+    time they ran (not including generators called from them through
+    the scheduler), the types of the 'YieldOp' objects they yielded,
+    and the code objects that called or chained them."""
+
+    __slots__ = ('entries',)	# Code key -> ProfileEntry.
+
+    def __init__(self):
+        self.entries = {}
+
+    def getEntry(self, key):
+        try:
+            return self.entries[key]
+        except KeyError:
+            entry = ProfileEntry()
+            self.entries[key] = entry
+            return entry
+
+    def record(self, itr, elapsed, value):
+        """Record a resumption of iterator 'itr', that took 'elapsed'
+        seconds and produced 'value'."""
+        key = getCodeKey(itr)
+        entry = self.getEntry(key)
+        entry.resumptions += 1
+        entry.time += elapsed
+
+        if isinstance(value, YieldOp):
+            opName = value.__class__.__name__
+            entry.ops[opName] = entry.ops.get(opName, 0) + 1
+
+            if isinstance(value, Call):
+                called = value.called
+            elif isinstance(value, Chain):
+                called = value.chained
+            else:
+                return
+
+            callers = self.getEntry(getCodeKey(called)).callers
+            callers[key] = callers.get(key, 0) + 1
+
+    def report(self, out=sys.stdout, limit=None):
+        """Print a report to file 'out', listing code objects by
+        decreasing total time. If 'limit' isn't `None`, only that
+        many code objects are listed."""
+        entries = self.entries.items()
+        entries.sort(key=lambda item: item[1].time, reverse=True)
+        if limit != None:
+            entries = entries[:limit]
+
+        print >> out, '%10s %10s %10s  %s' % \
+              ('resumes', 'time', 'per resume', 'function')
+        for ((fileName, lineNr, funcName), entry) in entries:
+            print >> out, '%10d %10.6f %10.6f  %s:%d(%s)' % \
+                  (entry.resumptions, entry.time,
+                   entry.time / entry.resumptions,
+                   fileName, lineNr, funcName)
+            if entry.ops != {}:
+                ops = entry.ops.items()
+                ops.sort()
+                print >> out, '%34s%s' % \
+                      ('', ', '.join(['%s: %d' % op for op in ops]))
+
+    def getStats(self):
+        """Return the profile as a dictionary in the format used by
+        the 'pstats' module."""
+        stats = {}
+        for (key, entry) in self.entries.items():
+            stats[key] = (entry.resumptions, entry.resumptions,
+                          entry.time, entry.time, dict(entry.callers))
+        return stats
+
+    def dumpStats(self, fileName):
+        """Write the profile to file 'fileName'. The file can be
+        loaded with 'pstats.Stats'."""
+        statsFile = open(fileName, 'wb')
+        try:
+            marshal.dump(self.getStats(), statsFile)
+        finally:
+            statsFile.close()
+
+
+#
+# The Scheduler
+#
+
+def hasMethod(cls, name):
+    """Return `True` if and only if class 'cls' has a method called
+    'name'."""
+    return callable(getattr(cls, name, None))
+
+
 class Scheduler(object):
-    __slots__ = ('current', 'stack')
+    __slots__ = ('current', 'stack', 'generation', 'index',
+                 'indexedNames', 'synced', 'profile', 'trace')
 
     def __init__(self, rootIter):
         self.current = iter(rootIter)
         self.stack = []
 
+        # Incremented every time the contents of the stack
+        # change. Can be used to invalidate information cached from
+        # the stack.
+        self.generation = 0
+
+        # Maps method names to the (ascending) list of positions in
+        # the stack of the restartable iterators whose instance has a
+        # method with that name. Only names that were looked up at
+        # least once (restart targets and retrieved state) are
+        # indexed. In order to keep calls cheap, the index is brought
+        # up to date only when looking up a name.
+        self.index = {}
+
+        # Maps classes to a tuple with the indexed names of their
+        # methods.
+        self.indexedNames = {}
+
+        # The index is up to date for the stack positions below this
+        # one.
+        self.synced = 0
+
+        # A SchedulerProfile object, or None if profiling is off.
+        self.profile = None
+
+        # A trace buffer (see the tracebuf module) recording the
+        # scheduler operations, or None.
+        self.trace = None
+
+    def getIndexedNames(self, cls):
+        """Return a tuple with the indexed names of the methods of
+        class 'cls'."""
+        try:
+            return self.indexedNames[cls]
+        except KeyError:
+            names = tuple([name for name in self.index
+                           if hasMethod(cls, name)])
+            self.indexedNames[cls] = names
+            return names
+
+    def syncIndex(self):
+        """Bring the index up to date with the stack."""
+        stack = self.stack
+        synced = self.synced
+
+        # Forget positions that were popped.
+        for positions in self.index.itervalues():
+            while positions and positions[-1] >= synced:
+                positions.pop()
+
+        # Add the iterators stacked since the last time.
+        for pos in xrange(synced, len(stack)):
+            itr = stack[pos]
+            if isinstance(itr, RestartableIterator):
+                for name in self.getIndexedNames(itr.instance.__class__):
+                    self.index[name].append(pos)
+
+        self.synced = len(stack)
+
+    def getPositions(self, methodName):
+        """Return the ascending list of positions in the stack of the
+        restartable iterators whose instance has a method called
+        'methodName'.
+
+        The name is added to the index the first time it is looked
+        up."""
+        self.syncIndex()
+        try:
+            return self.index[methodName]
+        except KeyError:
+            positions = [i for (i, itr) in enumerate(self.stack)
+                         if isinstance(itr, RestartableIterator) and \
+                         hasMethod(itr.instance.__class__, methodName)]
+            self.index[methodName] = positions
+            self.indexedNames = {}
+            return positions
+
+    def popItr(self):
+        """Pop the topmost iterator from the stack and return it."""
+        itr = self.stack.pop()
+        if len(self.stack) < self.synced:
+            self.synced = len(self.stack)
+        return itr
+
+    def cutStack(self, size):
+        """Remove iterators from the top of the stack until only
+        'size' are left."""
+        del self.stack[size:]
+        if size < self.synced:
+            self.synced = size
+
     def next(self):
+        if self.profile != None:
+            return self.profiledNext()
+
+        handlers = opHandlers
+        trace = self.trace
         while True:
             try:
                 next = self.current.next()
 
+                cls = next.__class__
+                if cls is NoOpInstance:
+                    # Just keep running the current iterator.
+                    continue
+                elif cls is Call:
+                    if trace != None:
+                        trace.record('sched', getTraceKey(next))
+                    self.call(next.called)
+                    continue
+                elif cls is Chain and \
+                     not isinstance(next.chained, Scheduler):
+                    # Replace the current iterator. The stack stays
+                    # untouched.
+                    if trace != None:
+                        trace.record('sched', getTraceKey(next))
+                    self.generation += 1
+                    self.current = iter(next.chained)
+                    continue
+
+                try:
+                    handler = handlers[cls]
+                except KeyError:
+                    handler = getOpHandler(cls)
+
+                if handler == None:
+                    return next
+                if trace != None:
+                    trace.record('sched', getTraceKey(next))
+                handler(next, self)
+            except StopIteration:
+                stack = self.stack
+                if len(stack) > 0:
+                    # Same as popItr, inlined.
+                    self.current = stack.pop()
+                    if len(stack) < self.synced:
+                        self.synced = len(stack)
+                    self.generation += 1
+                else:
+                    raise StopIteration
+            except Exception, e:
+                if trace != None:
+                    trace.record('error', repr(e))
+                raise self.executionError(e)
+
+    def profiledNext(self):
+        """Implementation of 'next' used when profiling."""
+        profile, trace = self.profile, self.trace
+        while True:
+            itr = self.current
+            start = time.time()
+            try:
+                try:
+                    next = itr.next()
+                except StopIteration:
+                    profile.record(itr, time.time() - start, None)
+                    raise
+                profile.record(itr, time.time() - start, next)
+
                 if isinstance(next, YieldOp):
+                    if trace != None and next is not NoOp:
+                        trace.record('sched', getTraceKey(next))
                     next.modifySched(self)
                 else:
                     return next
             except StopIteration:
                 if len(self.stack) > 0:
-                    self.current = self.stack.pop()
+                    self.current = self.popItr()
+                    self.generation += 1
                 else:
                     raise StopIteration
             except Exception, e:
-                import StringIO
-                import traceback
+                if trace != None:
+                    trace.record('error', repr(e))
+                raise self.executionError(e)
 
-                s = StringIO.StringIO()
-                self.traceback(s)
-                raise ExecutionError(e, traceback.format_exc(),
-                                     s.getvalue())
+    def executionError(self, e):
+        """Return an ExecutionError for the exception 'e' being
+        handled."""
+        s = StringIO.StringIO()
+        self.traceback(s)
+        return ExecutionError(e, traceback.format_exc(), s.getvalue())
 
     def __iter__(self):
         return self
 
     def call(self, itr):
+        self.generation += 1
         self.stack.append(self.current)
         if isinstance(itr, Scheduler):
             # Other schedulers get absorbed automatically.
@@ -175,6 +535,7 @@ class Scheduler(object):
             self.current = iter(itr)
 
     def chain(self, itr):
+        self.generation += 1
         if isinstance(itr, Scheduler):
             # Other schedulers get absorbed automatically.
             self.stack.extend(itr.stack)
@@ -183,24 +544,27 @@ class Scheduler(object):
             self.current = iter(itr)
 
     def restart(self, methodName, *posArgs, **kwArgs):
-        # Go down the stack searching for an instance having a method
-        # with the specified name.
+        self.generation += 1
+
+        # Look in the index for the last stacked instance having a
+        # method with the specified name.
         self.stack.append(self.current)
-        for i in range(len(self.stack) - 1, -1, -1):
-            if isinstance(self.stack[i], RestartableIterator) and \
-               hasattr(self.stack[i].instance, methodName):
-                # Perform the actual restart.
-                self.current = getattr(self.stack[i].instance,
-                                       methodName)(*posArgs, **kwArgs)
+        positions = self.getPositions(methodName)
+        if positions:
+            i = positions[-1]
 
-                # Cut the stack to the appropriate size.
-                self.stack = self.stack[:i]
+            # Perform the actual restart.
+            self.current = getattr(self.stack[i].instance,
+                                   methodName)(*posArgs, **kwArgs)
 
-                return
+            # Cut the stack to the appropriate size.
+            self.cutStack(i)
+
+            return
 
         # If this line is reached, we didn't find the element to
         # restart.
-        current = self.stack.pop()
+        current = self.popItr()
         raise IterSchedError, \
               "Restart of method '%s' failed" % methodName
 
@@ -216,6 +580,20 @@ class Scheduler(object):
             if isinstance(itr, RestartableIterator):
                 yield itr.instance
 
+    def findRestartable(self, methodName):
+        """Return the last stacked restartable instance having a
+        method called 'methodName', or `None` if there's no such
+        instance."""
+        if isinstance(self.current, RestartableIterator) and \
+           hasMethod(self.current.instance.__class__, methodName):
+            return self.current.instance
+
+        positions = self.getPositions(methodName)
+        if positions:
+            return self.stack[positions[-1]].instance
+
+        return None
+
     def traceback(self, out):
         """Print a traceback of the scheduler to the file 'out'."""
         # If anyone knows of a nicer way to get to the generator type,
@@ -229,14 +607,22 @@ class Scheduler(object):
             else:
                 itr = item
 
-            if isinstance(itr, genType):
+            if isinstance(itr, genType) and itr.gi_frame != None:
                 print >> out, '  File "%s", line %d, in %s' % \
                       (itr.gi_frame.f_code.co_filename,
                        itr.gi_frame.f_lineno,
                        itr.gi_frame.f_code.co_name)
+            elif isinstance(itr, genType):
+                # The generator already finished (or raised an
+                # exception), only the code is left.
+                print >> out, '  File "%s", line %d, in %s (finished)' % \
+                      (itr.gi_code.co_filename,
+                       itr.gi_code.co_firstlineno,
+                       itr.gi_code.co_name)
             else:
-                print >> out, "  Object %s", str(itr)
+                print >> out, "  Object %s" % str(itr)
 
 __all__ = ('IterSchedError', 'NoIterError', 'ExecutionError',
            'NoOp', 'Call', 'Chain',
-           'Restart', 'restartPoint', 'Scheduler')
+           'Restart', 'RestartableIterator', 'restartPoint',
+           'SchedulerProfile', 'Scheduler')
@@ -0,0 +1,331 @@
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""Checkpoints of the DVD virtual machine state.
+
+The scheduler stack of a running machine contains live generators,
+which can't be saved. A checkpoint records instead the restart point
+method calls of the player objects in the stack, the attributes of
+those objects, the call operations in progress, and the contents of
+the registers. Disc structures (titles, program chains, cells, etc.)
+are recorded as references into the disc.
+
+A checkpoint is restored by creating a new machine and stacking fresh
+player objects in it, each one running the restart point method that
+continues its work from the point the checkpoint was taken. Playback
+continues by playing again the VOBU that was being played when the
+checkpoint was taken. Navigation packets aren't saved. The restored
+machine gets them again as soon as it replays the VOBU. Call
+operations restored from a checkpoint have no navigation packets
+either, and make the machine start over with a clean navigation state
+when they resume.
+
+Checkpoints can only be taken while the machine is playing a cell,
+i.e., not while it is running DVD commands. All data in a checkpoint
+can be saved with the `marshal` module."""
+
+import os
+import marshal
+from array import array
+
+import itersched
+from itersched import RestartableIterator
+
+import dvdread
+
+import machine
+import registers
+
+
+# Version number of the checkpoint format.
+CHECKPOINT_VERSION = 2
+
+class CheckpointError(machine.MachineException):
+    pass
+
+
+#
+# Disc References
+#
+
+def encodeRef(value, programChain):
+    """Return a marshallable reference to 'value'.
+
+    'programChain' is the program chain command sets are looked up
+    in."""
+    if value is None or \
+       isinstance(value, (bool, int, long, float, str, tuple)):
+        return ('value', value)
+    elif isinstance(value, dvdread.VideoManager) or \
+         isinstance(value, dvdread.VideoTitleSet):
+        return ('titleSet', value.titleSetNr)
+    elif isinstance(value, dvdread.VideoTitle):
+        return ('title', value.titleNrInManager)
+    elif isinstance(value, dvdread.LangUnit):
+        return ('langUnit', encodeRef(value.container, None),
+                value.langCode)
+    elif isinstance(value, dvdread.ProgramChain):
+        return ('programChain', encodeRef(value.container, None),
+                value.programChainNr)
+    elif isinstance(value, dvdread.Cell):
+        return ('cell', encodeRef(value.programChain, None),
+                value.cellNr)
+    elif isinstance(value, dvdread.CommandSet) and \
+         programChain is not None:
+        pgcRef = encodeRef(programChain, None)
+        if value == programChain.preCommands:
+            return ('commands', pgcRef, 'pre')
+        elif value == programChain.postCommands:
+            return ('commands', pgcRef, 'post')
+        elif value == programChain.cellCommands:
+            return ('commands', pgcRef, 'cell')
+
+    raise CheckpointError, "Cannot save object '%s'" % repr(value)
+
+def decodeRef(info, ref):
+    """Return the object referenced by 'ref' in the disc described by
+    'info'."""
+    kind = ref[0]
+    if kind == 'value':
+        return ref[1]
+    elif kind == 'titleSet':
+        if ref[1] == 0:
+            return info.videoManager
+        else:
+            return info.videoManager.getVideoTitleSet(ref[1])
+    elif kind == 'title':
+        return info.videoManager.getVideoTitle(ref[1])
+    elif kind == 'langUnit':
+        return decodeRef(info, ref[1]).getLangUnit(ref[2])
+    elif kind == 'programChain':
+        container = decodeRef(info, ref[1])
+        if isinstance(container, dvdread.VideoManager):
+            return container.firstPlay
+        else:
+            return container.getProgramChain(ref[2])
+    elif kind == 'cell':
+        return decodeRef(info, ref[1]).getCell(ref[2])
+    elif kind == 'commands':
+        programChain = decodeRef(info, ref[1])
+        return getattr(programChain, ref[2] + 'Commands')
+
+    raise CheckpointError, "Invalid reference '%s'" % repr(ref)
+
+
+#
+# Saving
+#
+
+# Player classes whose instances can be saved, by name.
+playerClasses = dict((cls.__name__, cls) for cls in
+                     (machine.DiscPlayer,
+                      machine.TitlePlayer,
+                      machine.LangUnitPlayer,
+                      machine.ProgramChainPlayer,
+                      machine.CommandBlockPlayer,
+                      machine.CellPlayer))
+
+# Player attributes that aren't saved.
+unsavedAttrs = ('machine', 'block')
+
+def saveFrame(itr, programChain):
+    """Return the checkpoint frame for the restartable iterator
+    'itr'."""
+    player = itr.instance
+    className = player.__class__.__name__
+    if className not in playerClasses:
+        raise CheckpointError, "Cannot save player '%s'" % className
+
+    posArgs = tuple([encodeRef(arg, programChain)
+                     for arg in itr.posArgs])
+    kwArgs = dict([(name, encodeRef(arg, programChain))
+                   for (name, arg) in itr.kwArgs.items()])
+    attrs = dict([(name, encodeRef(getattr(player, name), programChain))
+                  for name in player.__slots__
+                  if name not in unsavedAttrs])
+
+    return ('player', className, itr.methodName, posArgs, kwArgs, attrs)
+
+def save(vm):
+    """Return a checkpoint of the virtual machine 'vm'.
+
+    Iterators in the scheduler stack other than player restart
+    points and call operations are not saved. They belong either to
+    DVD commands, or to operations started by the playback engine."""
+    frames = []
+    programChain = None
+    for itr in vm.sched.stack + [vm.sched.current]:
+        if isinstance(itr, RestartableIterator):
+            frame = saveFrame(itr, programChain)
+            if isinstance(itr.instance, machine.ProgramChainPlayer):
+                programChain = itr.instance.programChain
+        elif isinstance(itr, machine.CallFrame):
+            frame = ('call', itr.rtn)
+        else:
+            continue
+
+        frames.append(frame)
+
+    # Check that the machine is at a point we know how to continue
+    # from.
+    if frames == [] or frames[-1][0] != 'player' or \
+       frames[-1][1] != 'CellPlayer':
+        raise CheckpointError, "Machine is not playing a cell"
+    for i in range(len(frames) - 1):
+        if frames[i][0] == 'player' and \
+           frames[i][1] == 'CommandBlockPlayer' and \
+           frames[i + 1][0] != 'call':
+            raise CheckpointError, "Machine is running commands"
+
+    return (CHECKPOINT_VERSION,
+            vm.registers.gprm.tolist(),
+            list(vm.registers.state),
+            frames)
+
+
+#
+# Restoring
+#
+
+def continueFrame(player, methodName, posArgs, kwArgs, child):
+    """Return a restartable iterator continuing the work of 'player'
+    after the iterator stacked above it (of kind 'child') finishes.
+
+    'methodName', 'posArgs' and 'kwArgs' describe the restart point
+    method the player was running when the checkpoint was taken."""
+    if isinstance(player, machine.CellPlayer):
+        if methodName == 'seekToSector':
+            return player.seekToSector(player.sectorNr)
+        else:
+            return player.playFromVobu(player.sectorNr)
+
+    elif isinstance(player, machine.CommandBlockPlayer):
+        if methodName == 'goto':
+            # Continue with the command following the call.
+            player.block = player.machine.compiler. \
+                           compileBlock(player.commands)
+            return player.goto(player.commandNr + 1)
+
+    elif isinstance(player, machine.ProgramChainPlayer):
+        if child == 'CellPlayer':
+            return player.finishCell()
+        elif methodName == 'playProgramChain':
+            # The 'pre' commands are only run when playing from the
+            # first cell.
+            return player.linkCell(1)
+        elif methodName == 'finishCell':
+            return player.linkFollowingCell()
+        elif methodName == 'linkTailProgramChain':
+            return player.linkFollowingProgramChain()
+        else:
+            raise CheckpointError, \
+                  "Cannot continue program chain player method '%s'" % \
+                  methodName
+
+    # Nothing left to do after the child finishes.
+    return RestartableIterator(player, iter(()), methodName,
+                               posArgs, kwArgs)
+
+def restore(info, checkpoint):
+    """Return a new virtual machine for the disc described by 'info',
+    in the state saved in 'checkpoint'.
+
+    The checkpoint must have been taken from a machine playing the
+    same disc."""
+    (version, gprm, state, frames) = checkpoint
+    if version != CHECKPOINT_VERSION:
+        raise CheckpointError, \
+              "Unsupported checkpoint version %d" % version
+
+    vm = machine.VirtualMachine(info)
+
+    itrs = []
+    for (i, frame) in enumerate(frames):
+        if i + 1 == len(frames):
+            child = None
+        elif frames[i + 1][0] == 'call':
+            child = 'call'
+        else:
+            child = frames[i + 1][1]
+
+        if frame[0] == 'call':
+            rtn = frame[1]
+            callFrame = machine.CallFrame(vm, None, rtn)
+            callFrame.currentNav = callFrame.buttonNav = None
+            callFrame.buttonIndexes = {}
+            itrs.append(callFrame)
+        else:
+            (className, methodName, posArgs, kwArgs, attrs) = frame[1:]
+            player = playerClasses[className](vm)
+            for (name, ref) in attrs.items():
+                setattr(player, name, decodeRef(info, ref))
+            posArgs = tuple([decodeRef(info, ref) for ref in posArgs])
+            kwArgs = dict([(name, decodeRef(info, ref))
+                           for (name, ref) in kwArgs.items()])
+            itrs.append(continueFrame(player, methodName, posArgs,
+                                      kwArgs, child))
+
+    sched = itersched.Scheduler(itrs[0])
+    for itr in itrs[1:]:
+        sched.call(itr)
+
+    # Bring the playback engine up to date before playing.
+    sched.call(vm.updateAll())
+
+    vm.setScheduler(sched)
+
+    vm.registers.restore(registers.Snapshot(array('H', gprm), state))
+
+    return vm
+
+
+#
+# Checkpoint Files
+#
+
+def dump(checkpoint, fileName):
+    """Write 'checkpoint' to the file 'fileName'.
+
+    The file is replaced atomically, so that a crash while writing
+    never leaves an incomplete checkpoint behind."""
+    dirName = os.path.dirname(fileName)
+    if dirName != '' and not os.path.isdir(dirName):
+        os.makedirs(dirName)
+
+    tmpName = '%s.%d.tmp' % (fileName, os.getpid())
+    checkpointFile = open(tmpName, 'wb')
+    try:
+        marshal.dump(checkpoint, checkpointFile)
+    finally:
+        checkpointFile.close()
+    os.rename(tmpName, fileName)
+
+def load(fileName):
+    """Read a checkpoint from the file 'fileName'."""
+    checkpointFile = open(fileName, 'rb')
+    try:
+        return marshal.load(checkpointFile)
+    finally:
+        checkpointFile.close()
+
+def getCheckpointFileName(fingerprint):
+    """Return the name of the checkpoint file, in the user's cache
+    directory, for the disc with fingerprint 'fingerprint' (see
+    `dvdread.infocache.getFingerprint`)."""
+    return os.path.join(dvdread.infocache.getCacheBase(), 'checkpoint',
+                        fingerprint)
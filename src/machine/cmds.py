@@ -39,6 +39,27 @@ class PipelineCmd(object):
     def __call__(self, pipeline):
         getattr(pipeline, self.methodName)(*self.args, **self.keywords)
 
+    def getTraceKey(self):
+        """Return a tuple describing this command, to be recorded in
+        a trace buffer.
+
+        Arguments that aren't numbers, strings or `None` are replaced
+        by their class name, so that the tuple never references
+        objects that may change or be kept alive by the trace."""
+        key = [self.__class__.__name__]
+        for arg in self.args:
+            if arg == None or isinstance(arg, (int, long, float, str)):
+                key.append(arg)
+            else:
+                key.append(arg.__class__.__name__)
+        return tuple(key)
+
+    def __str__(self):
+        args = [repr(arg) for arg in self.args] + \
+               ['%s=%s' % (name, repr(arg))
+                for (name, arg) in self.keywords.items()]
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(args))
+
 
 class DoNothing(PipelineCmd):
     """A do-nothing command object."""
@@ -65,6 +86,29 @@ class CancelVobu(PipelineCmd):
     methodName = 'cancelVobu'
 
 
+class FollowVobus(PipelineCmd):
+    """When constructed with parameter list `(lastSectorNr)`, let the
+    pipeline go on playing after the current VOBU by itself,
+    following the next VOBU pointers, as long as VOBUs start at or
+    before sector `lastSectorNr` and contain no highlight information.
+
+    Once the pipeline stops following, attributes `lastNav` and
+    `lastSectorNr` contain the navigation packet and sector number of
+    the last VOBU played this way. They remain `None` if no VOBU was
+    played."""
+    __slots__ = ('lastNav',
+                 'lastSectorNr')
+    methodName = 'followVobus'
+
+    def __init__(self, *args, **keywords):
+        super(FollowVobus, self).__init__(*args, **keywords)
+        self.lastNav = None
+        self.lastSectorNr = None
+
+    def __call__(self, pipeline):
+        pipeline.followVobus(self, *self.args, **self.keywords)
+
+
 # Since accepting the playback of a VOBU is the default, `acceptVobu`
 # is equivalent to doing nothing.
 class AcceptVobu(DoNothing):
@@ -0,0 +1,620 @@
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""A compiler for DVD virtual machine commands.
+
+The `decode.CommandDecoder` decodes a command again every time it is
+executed. The compiler in this module decodes a command only once,
+and produces a `CompiledCommand` object containing only the
+operations that must actually be performed at run time. Compiled
+commands behave exactly like their decoded counterparts. Commands the
+compiler doesn't know how to handle (including all malformed
+commands) are executed through the decoder."""
+
+import operator
+
+from itersched import *
+
+import decode
+
+
+class CompileError(Exception):
+    """Raised internally when a command must be left to the
+    decoder."""
+    pass
+
+
+class CompiledCommand(object):
+    """A compiled DVD virtual machine command.
+
+    A compiled command consists of three sequences of steps and an
+    optional condition. Each step is a callable returning an
+    `itersched` runnable iterator. When the command is run, the `pre`
+    steps are performed first. If the condition is `None` or returns a
+    true value, the `body` steps are performed afterwards. The `post`
+    steps are always performed at the end.
+
+    Calling a compiled command returns an `itersched` runnable
+    iterator that performs it.
+
+    Commands that only read and set registers can also be performed
+    synchronously, without going through the scheduler. The `sync`
+    attribute of such commands contains a function that performs the
+    command directly. For all other commands, the attribute is
+    `None`."""
+
+    __slots__ = ('cmd',
+                 'pre',
+                 'cond',
+                 'body',
+                 'post',
+                 'sync')
+
+    def __init__(self, cmd, pre=(), cond=None, body=(), post=()):
+        self.cmd = cmd
+        self.pre = tuple(pre)
+        self.cond = cond
+        self.body = tuple(body)
+        self.post = tuple(post)
+
+        self.sync = self.makeSync()
+
+    def makeSync(self):
+        """Return a function performing this command synchronously,
+        or `None` if any of the steps has no synchronous version."""
+        for step in self.pre + self.body + self.post:
+            if not hasattr(step, 'sync'):
+                return None
+
+        pre = [step.sync for step in self.pre]
+        cond = self.cond
+        body = [step.sync for step in self.body]
+        post = [step.sync for step in self.post]
+
+        if pre == [] and post == [] and len(body) == 1:
+            # The most common case: a single register operation.
+            (step,) = body
+            if cond == None:
+                return step
+
+            def sync():
+                if cond():
+                    step()
+            return sync
+
+        def sync():
+            for step in pre:
+                step()
+
+            if cond == None or cond():
+                for step in body:
+                    step()
+
+            for step in post:
+                step()
+        return sync
+
+    def __call__(self):
+        for step in self.pre:
+            yield Call(step())
+
+        if self.cond == None or self.cond():
+            for step in self.body:
+                yield Call(step())
+
+        for step in self.post:
+            yield Call(step())
+
+
+class CommandCompiler(object):
+    """A compiler for DVD virtual machine commands.
+
+    Compiled commands and command blocks are cached, so that compiling
+    the same command or block again is very cheap."""
+
+    __slots__ = ('machine',
+                 'decoder',
+                 'sync',
+                 'commands',
+                 'blocks')
+
+    def __init__(self, machine, sync=True):
+        """Creates a new CommandCompiler that produces code to run in
+        the specified virtual machine.
+
+        If `sync` is false, compiled commands will never be performed
+        synchronously (see `CompiledCommand`)."""
+        self.machine = machine
+        self.decoder = decode.CommandDecoder(machine)
+        self.sync = sync
+
+        # Compiled commands, indexed by the command tuple.
+        self.commands = {}
+
+        # Compiled command blocks, indexed by the `dvdread.CommandSet`
+        # object.
+        self.blocks = {}
+
+
+    #
+    # Main Entry Points
+    #
+
+    def compileCommand(self, cmd):
+        """Compile the single command `cmd` and return the
+        corresponding `CompiledCommand` object."""
+        try:
+            return self.commands[cmd]
+        except KeyError:
+            pass
+
+        compileFunc = self.compileFuncs[cmd[0] >> 4]
+        compiled = None
+        if compileFunc != None:
+            try:
+                compiled = compileFunc(self, cmd)
+            except CompileError:
+                pass
+
+        if compiled == None:
+            # Let the decoder deal with this command at run time.
+            compiled = CompiledCommand(cmd,
+                                       body=(lambda: self.decoder. \
+                                             performCommand(cmd),))
+
+        if not self.sync:
+            compiled.sync = None
+
+        self.commands[cmd] = compiled
+        return compiled
+
+    def compileBlock(self, commands):
+        """Compile a complete command block.
+
+        `commands` is a `dvdread.CommandSet` object, like the
+        `preCommands`, `postCommands` and `cellCommands` attributes of
+        a program chain. The return value is a tuple of
+        `CompiledCommand` objects. Position 0 in the tuple corresponds
+        to command number 1 in the block."""
+        try:
+            return self.blocks[commands]
+        except KeyError:
+            pass
+
+        block = tuple([self.compileCommand(commands.get(i))
+                       for i in range(1, commands.count + 1)])
+
+        self.blocks[commands] = block
+        return block
+
+
+    #
+    # Operands
+    #
+
+    def getRegister(self, regNr):
+        """Return the register object for `regNr`, using the same
+        encoding as `CommandDecoder.getRegister`."""
+        if regNr & 0x80:
+            if not 0 <= regNr & 0x7f <= 23:
+                raise CompileError
+            return self.machine.getSystemParameter(regNr & 0x7f)
+        else:
+            return self.getGeneralPurpose(regNr)
+
+    def getGeneralPurpose(self, regNr):
+        if not 0 <= regNr <= 15:
+            raise CompileError
+        return self.machine.getGeneralPurpose(regNr)
+
+    def makeStep(self, func, *operands):
+        """Return a step calling `func` with the values of
+        `operands`.
+
+        Operands can be integer constants or register objects. The
+        values of register operands are read when the step is
+        performed."""
+        if operands == ():
+            return func
+
+        if len(operands) == 1:
+            (op,) = operands
+            if isinstance(op, decode.Register):
+                return lambda: func(op.getValue())
+            else:
+                return lambda: func(op)
+
+        def value(op):
+            if isinstance(op, decode.Register):
+                return op.getValue()
+            else:
+                return op
+
+        return lambda: func(*[value(op) for op in operands])
+
+    def makeRegisterStep(self, dest, valueFunc):
+        """Return a step setting register `dest` to the value
+        returned by `valueFunc`.
+
+        Register steps can also be performed synchronously by calling
+        their `sync` attribute."""
+        step = lambda: dest.setValue(valueFunc())
+        step.sync = lambda: dest.setValueSync(valueFunc())
+        return step
+
+    def makeNopStep(self):
+        """Return a step performing the machine's `nop`
+        operation."""
+        step = lambda: self.machine.nop()
+        step.sync = lambda: None
+        return step
+
+    def makeSetStep(self, dest, operand):
+        """Return a step setting register `dest` to the value of
+        `operand`."""
+        if isinstance(operand, decode.Register):
+            return self.makeRegisterStep(dest, operand.getValue)
+        else:
+            return self.makeRegisterStep(dest, lambda: operand)
+
+
+    #
+    # Conditions
+    #
+
+    condOps = (
+        None,
+        operator.__and__,
+        operator.eq,
+        operator.ne,
+        operator.ge,
+        operator.gt,
+        operator.le,
+        operator.lt
+        )
+
+    def compileCondition(self, cmd):
+        """Return a function evaluating the condition in `cmd`, or
+        `None` if the command has no condition."""
+        condOp = self.condOps[(cmd[1] >> 4) & 0x7]
+        if condOp == None:
+            return None
+
+        (pos1, pos2, dbl) = decode.CommandDecoder.condOperands[cmd[0] >> 4]
+        if pos1 == 1:
+            op1 = self.getGeneralPurpose(cmd[1] & 0xf)
+        else:
+            op1 = self.getGeneralPurpose(cmd[pos1])
+
+        if cmd[1] & 0x80:
+            if not dbl:
+                raise CompileError
+            op2 = cmd[pos2] * 0x100 + cmd[pos2 + 1]
+            return lambda: condOp(op1.getValue(), op2)
+        else:
+            if dbl:
+                if cmd[pos2] != 0:
+                    raise CompileError
+                op2 = self.getRegister(cmd[pos2 + 1])
+            else:
+                op2 = self.getRegister(cmd[pos2])
+            return lambda: condOp(op1.getValue(), op2.getValue())
+
+
+    #
+    # Link Operations
+    #
+
+    simpleLinks = {
+        0x01: 'linkTopCell',
+        0x02: 'linkNextCell',
+        0x03: 'linkPrevCell',
+        0x05: 'linkTopProgram',
+        0x06: 'linkNextProgram',
+        0x07: 'linkPrevProgram',
+        0x09: 'linkTopProgramChain',
+        0x0a: 'linkNextProgramChain',
+        0x0b: 'linkPrevProgramChain',
+        0x0c: 'linkGoUpProgramChain',
+        0x0d: 'linkTailProgramChain',
+        0x10: 'resume'}
+
+    def compileButton(self, cmd):
+        button = cmd[6] >> 2
+        if button != 0:
+            return [self.makeStep(self.machine.selectButton, button)]
+        else:
+            return []
+
+    def compileLink(self, cmd):
+        """Return the list of steps performing the link operation in
+        `cmd`."""
+        if 0x8 <= cmd[0] >> 4 <= 0xd:
+            linkType = 1
+        else:
+            linkType = cmd[1] & 0xf
+
+        machine = self.machine
+        if linkType == 0x0:
+            return []
+        elif linkType == 0x1:
+            steps = self.compileButton(cmd)
+            methodName = self.simpleLinks.get(cmd[7])
+            if methodName != None:
+                steps.append(getattr(machine, methodName))
+            return steps
+        elif linkType == 0x4:
+            return [self.makeStep(machine.linkProgramChain,
+                                  cmd[6] * 0x100 + cmd[7])]
+        elif linkType == 0x5:
+            return self.compileButton(cmd) + \
+                   [self.makeStep(machine.linkChapter,
+                                  (cmd[6] & 0x3) * 0x100 + cmd[7])]
+        elif linkType == 0x6:
+            return self.compileButton(cmd) + \
+                   [self.makeStep(machine.linkProgram, cmd[7])]
+        elif linkType == 0x7:
+            return self.compileButton(cmd) + \
+                   [self.makeStep(machine.linkCell, cmd[7])]
+        else:
+            raise CompileError
+
+
+    #
+    # Arithmetic and Bit Operations
+    #
+
+    def compileArithOperation(self, cmd, regNr, source):
+        """Return the list of steps performing the arithmetic
+        operation in `cmd`. `source` is either a register object or
+        an integer constant."""
+        op = cmd[0] & 0xf
+        if op == 0:
+            return []
+
+        dest = self.getGeneralPurpose(regNr)
+        if op == 2:
+            # Register swap.
+            if not isinstance(source, decode.Register):
+                raise CompileError
+
+            def swap():
+                tmp = dest.getValue()
+                yield Call(dest.setValue(source.getValue()))
+                yield Call(source.setValue(tmp))
+
+            def swapSync():
+                tmp = dest.getValue()
+                dest.setValueSync(source.getValue())
+                source.setValueSync(tmp)
+
+            swap.sync = swapSync
+            return [swap]
+
+        opFunc = decode.CommandDecoder.arithOps[op]
+        if opFunc == None:
+            raise CompileError
+
+        if op == 1:
+            return [self.makeSetStep(dest, source)]
+        elif isinstance(source, decode.Register):
+            return [self.makeRegisterStep(dest,
+                                          lambda: opFunc(dest.getValue(),
+                                                         source.getValue()))]
+        else:
+            return [self.makeRegisterStep(dest,
+                                          lambda: opFunc(dest.getValue(),
+                                                         source))]
+
+
+    #
+    # Command Compile Functions
+    #
+
+    def compile0(self, cmd):
+        cond = self.compileCondition(cmd)
+
+        op = cmd[1] & 0xf
+        machine = self.machine
+        if op == 0:
+            body = [self.makeNopStep()]
+        elif op == 1:
+            body = [self.makeStep(machine.goto, cmd[7])]
+        elif op == 2:
+            body = [machine.brk]
+        elif op == 3:
+            raise CompileError
+        else:
+            body = []
+
+        return CompiledCommand(cmd, cond=cond, body=body)
+
+    def compile2(self, cmd):
+        return CompiledCommand(cmd, cond=self.compileCondition(cmd),
+                               body=self.compileLink(cmd))
+
+    def compile3(self, cmd):
+        cond = self.compileCondition(cmd)
+
+        op = cmd[1] & 0xf
+        machine = self.machine
+        if op == 1:
+            step = machine.exit
+        elif op == 2:
+            step = self.makeStep(machine.jumpToTitle, cmd[5])
+        elif op == 3:
+            step = self.makeStep(machine.jumpToTitleInSet, cmd[5])
+        elif op == 5:
+            step = self.makeStep(machine.jumpToChapterInSet, cmd[5],
+                                 cmd[2] * 0x100 + cmd[3])
+        elif op == 6:
+            subop = cmd[5] >> 4
+            if subop == 0x0:
+                step = machine.jumpToFirstPlay
+            elif subop == 0x4:
+                step = machine.jumpToTitleMenu
+            elif subop == 0x8:
+                step = self.makeStep(machine.jumpToMenu, cmd[4], cmd[3],
+                                     cmd[5] & 0xf)
+            elif subop == 0xc:
+                step = self.makeStep(machine.jumpToManagerProgramChain,
+                                     cmd[2] * 0x100 + cmd[3])
+            else:
+                raise CompileError
+        elif op == 8:
+            subop = cmd[5] >> 4
+            if subop == 0x0:
+                step = self.makeStep(machine.callFirstPlay, cmd[4])
+            elif subop == 0x4:
+                step = self.makeStep(machine.callTitleMenu, cmd[4])
+            elif subop == 0x8:
+                step = self.makeStep(machine.callMenu, cmd[5] & 0xf,
+                                     cmd[4])
+            elif subop == 0xc:
+                step = self.makeStep(machine.callManagerProgramChain,
+                                     cmd[2] * 0x100 + cmd[3], cmd[4])
+            else:
+                raise CompileError
+        else:
+            raise CompileError
+
+        return CompiledCommand(cmd, cond=cond, body=[step])
+
+    def compile45(self, cmd):
+        if not (cmd[1] & 0xf0 == 0 or cmd[1] & 0xf == 0):
+            raise CompileError
+
+        cond = self.compileCondition(cmd)
+
+        if (cmd[0] & 0xf0) == 0x40:
+            # Indirect access to the parameters.
+            getParm = self.getRegister
+        else:
+            # Direct access to the parameters.
+            getParm = lambda x: x
+
+        op = cmd[0] & 0xf
+        machine = self.machine
+        if op == 1:
+            body = []
+            if cmd[3] & 0x80:
+                body.append(self.makeStep(machine.setAudio,
+                                          getParm(cmd[3] & 0x7f)))
+            if cmd[4] & 0x80:
+                body.append(self.makeStep(machine.setSubpicture,
+                                          getParm(cmd[4] & 0x7f)))
+            if cmd[5] & 0x80:
+                body.append(self.makeStep(machine.setAngle,
+                                          getParm(cmd[5] & 0x7f)))
+        elif op == 2:
+            body = [self.makeStep(machine.setTimedJump,
+                                  cmd[4] * 0x100 + cmd[5],
+                                  getParm(cmd[3]))]
+        elif op == 3:
+            if cmd[5] & 0x80:
+                # Counter mode, leave it to the decoder.
+                raise CompileError
+            dest = self.getGeneralPurpose(cmd[5] & 0xf)
+            body = [self.makeSetStep(dest,
+                                     getParm(cmd[2] * 0x100 + cmd[3]))]
+        elif op == 4:
+            body = [self.makeStep(machine.setKaraokeMode,
+                                  getParm(cmd[4] * 0x100 + cmd[5]))]
+        elif op == 6:
+            body = [self.makeStep(machine.setSystemParam8,
+                                  getParm(cmd[4] * 0x100 + cmd[5]))]
+        else:
+            raise CompileError
+
+        return CompiledCommand(cmd, cond=cond,
+                               body=body + self.compileLink(cmd))
+
+    def compile6(self, cmd):
+        if not (cmd[1] & 0xf0 == 0 or cmd[1] & 0xf == 0):
+            raise CompileError
+
+        return CompiledCommand(cmd, cond=self.compileCondition(cmd),
+                               body=self.compileArithOperation( \
+            cmd, cmd[3], self.getRegister(cmd[5])) + \
+                               self.compileLink(cmd))
+
+    def compile7(self, cmd):
+        if not (cmd[1] & 0xf0 == 0 or cmd[1] & 0xf == 0):
+            raise CompileError
+
+        return CompiledCommand(cmd, cond=self.compileCondition(cmd),
+                               body=self.compileArithOperation( \
+            cmd, cmd[3], cmd[4] * 0x100 + cmd[5]) + \
+                               self.compileLink(cmd))
+
+    def compile8(self, cmd):
+        return CompiledCommand(cmd,
+                               pre=self.compileArithOperation( \
+            cmd, cmd[1] & 0xf, self.getRegister(cmd[3])),
+                               cond=self.compileCondition(cmd),
+                               body=self.compileLink(cmd))
+
+    def compile9(self, cmd):
+        return CompiledCommand(cmd,
+                               pre=self.compileArithOperation( \
+            cmd, cmd[1] & 0xf, cmd[2] * 0x100 + cmd[3]),
+                               cond=self.compileCondition(cmd),
+                               body=self.compileLink(cmd))
+
+    def compileA(self, cmd):
+        return CompiledCommand(cmd, cond=self.compileCondition(cmd),
+                               body=self.compileArithOperation( \
+            cmd, cmd[1] & 0xf, self.getRegister(cmd[2])) + \
+                               self.compileLink(cmd))
+
+    def compileB(self, cmd):
+        return CompiledCommand(cmd, cond=self.compileCondition(cmd),
+                               body=self.compileArithOperation( \
+            cmd, cmd[1] & 0xf, cmd[2] * 0x100 + cmd[3]) + \
+                               self.compileLink(cmd))
+
+    def compileC(self, cmd):
+        return CompiledCommand(cmd, cond=self.compileCondition(cmd),
+                               body=self.compileArithOperation( \
+            cmd, cmd[1] & 0xf, self.getRegister(cmd[2])),
+                               post=self.compileLink(cmd))
+
+    def compileD(self, cmd):
+        return CompiledCommand(cmd, cond=self.compileCondition(cmd),
+                               body=self.compileArithOperation( \
+            cmd, cmd[1] & 0xf, cmd[2] * 0x100 + cmd[3]),
+                               post=self.compileLink(cmd))
+
+
+    compileFuncs = (
+        compile0,
+        None,
+        compile2,
+        compile3,
+        compile45,
+        compile45,
+        compile6,
+        compile7,
+        compile8,
+        compile9,
+        compileA,
+        compileB,
+        compileC,
+        compileD,
+        None,
+        None)
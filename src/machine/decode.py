@@ -26,7 +26,10 @@ class Register(object):
     """A base class for all register types.
 
     Implementations of the machine interface must use this class as
-    base class for all objects returned as registers."""
+    base class for all objects returned as registers. Registers
+    implement the `getValue` and `setValue` methods. `setValue` is an
+    `itersched` runnable generator. The compiler additionally uses a
+    `setValueSync` method, that sets the value immediately."""
 
     __slots__ = ()
 
@@ -0,0 +1,424 @@
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""Run the DVD virtual machine without a playback pipeline.
+
+The `HeadlessDriver` class plays the role of the pipeline manager: it
+executes the command objects produced by the machine, and hands it a
+navigation packet for every VOBU it plays. Navigation packets are
+obtained from a nav source, which can read them directly from the
+disc (`DiscNavSource`) or from a previously recorded trace
+(`TraceNavSource`). Nothing in this module requires GStreamer."""
+
+import os
+import marshal
+import time
+
+import itersched
+import dvdread
+
+import cmds
+
+
+#
+# Navigation Packet Sources
+#
+
+class DiscNavSource(object):
+    """A nav source reading navigation packets from the VOB files of
+    a disc."""
+
+    __slots__ = ('reader',)
+
+    def __init__(self, location):
+        self.reader = dvdread.BlockReader(location)
+
+    def getBlock(self, domain, titleNr, sectorNr):
+        """Return the navigation block of the specified VOBU as a
+        string."""
+        return self.reader.read(domain, titleNr, sectorNr)
+
+    def getNav(self, domain, titleNr, sectorNr):
+        """Return the navigation packet of the specified VOBU."""
+        return dvdread.NavPacket(self.getBlock(domain, titleNr, sectorNr))
+
+
+# Version number of the trace file format.
+TRACE_VERSION = 2
+
+def readInfoFiles(location, info):
+    """Read the information files of the disc at 'location' and
+    return them as a dictionary of strings, indexed by title set
+    number (0 for the video manager).
+
+    'info' is the `dvdread.DVDInfo` object for the disc."""
+    reader = dvdread.BlockReader(location)
+    infoFiles = {}
+    for titleSetNr in range(info.videoManager.videoTitleSetCount + 1):
+        infoFiles[titleSetNr] = reader.readInfoFile(titleSetNr)
+    return infoFiles
+
+def writeInfoFiles(infoFiles, dirName):
+    """Write the information files in dictionary 'infoFiles' (as
+    returned by `readInfoFiles`) to directory 'dirName', in a layout
+    `dvdread.DVDInfo` can open."""
+    videoDir = os.path.join(dirName, 'VIDEO_TS')
+    if not os.path.isdir(videoDir):
+        os.makedirs(videoDir)
+
+    for (titleSetNr, data) in infoFiles.items():
+        fileName = dvdread.infocache.getInfoFileName(titleSetNr)
+        infoFile = open(os.path.join(videoDir, fileName), 'wb')
+        try:
+            infoFile.write(data)
+        finally:
+            infoFile.close()
+
+
+class TraceNavSource(object):
+    """A nav source reading navigation packets from a trace file.
+
+    Trace files are written by `RecordingNavSource`. They contain the
+    raw navigation blocks of all VOBUs played while recording, and
+    the information files of the disc, available in the `infoFiles`
+    attribute."""
+
+    __slots__ = ('blocks',
+                 'infoFiles')
+
+    def __init__(self, fileName):
+        traceFile = open(fileName, 'rb')
+        try:
+            data = marshal.load(traceFile)
+        finally:
+            traceFile.close()
+
+        if data[0] != TRACE_VERSION:
+            raise ValueError, "Unsupported trace version %d" % data[0]
+        (version, self.blocks, self.infoFiles) = data
+
+    def getBlock(self, domain, titleNr, sectorNr):
+        try:
+            return self.blocks[(domain, titleNr, sectorNr)]
+        except KeyError:
+            raise KeyError, "VOBU %d, title %d, domain %d not in trace" % \
+                  (sectorNr, titleNr, domain)
+
+    def getNav(self, domain, titleNr, sectorNr):
+        return dvdread.NavPacket(self.getBlock(domain, titleNr, sectorNr))
+
+
+class RecordingNavSource(object):
+    """A nav source that records the navigation blocks obtained from
+    another nav source, so that they can be saved as a trace.
+
+    'infoFiles' is a dictionary with the information files of the
+    disc, as returned by `readInfoFiles`. It is saved in the trace as
+    well."""
+
+    __slots__ = ('source',
+                 'blocks',
+                 'infoFiles')
+
+    def __init__(self, source, infoFiles):
+        self.source = source
+        self.blocks = {}
+        self.infoFiles = infoFiles
+
+    def getBlock(self, domain, titleNr, sectorNr):
+        block = self.source.getBlock(domain, titleNr, sectorNr)
+        self.blocks[(domain, titleNr, sectorNr)] = block
+        return block
+
+    def getNav(self, domain, titleNr, sectorNr):
+        return dvdread.NavPacket(self.getBlock(domain, titleNr, sectorNr))
+
+    def save(self, fileName):
+        """Save the recorded blocks as a trace file."""
+        traceFile = open(fileName, 'wb')
+        try:
+            marshal.dump((TRACE_VERSION, self.blocks, self.infoFiles),
+                         traceFile)
+        finally:
+            traceFile.close()
+
+
+#
+# The Driver
+#
+
+class EndInteractive(cmds.DoNothing):
+    """A do nothing command marking the end of an interactive
+    operation."""
+    __slots__ = ('count',)
+
+
+class HeadlessDriver(object):
+    """A driver running a virtual machine without a playback pipeline.
+
+    The driver implements the operations of the pipeline interface
+    used by the command objects in `machine.cmds`. Stream, highlight
+    and aspect ratio changes are only recorded in the driver's
+    attributes. Still frames are not waited for.
+
+    The driver also collects some performance statistics, see the
+    `getStats` method."""
+
+    __slots__ = ('machine',
+                 'navSource',
+                 'mainItr',
+
+                 'playing',	# (domain, titleNr, sectorNr) or None.
+                 'cancelled',
+                 'still',	# Duration of the last still frame.
+                 'waiting',	# True when in an unlimited still.
+
+                 'aspectRatio',
+                 'audio',
+                 'subpicture',
+                 'subpictureHide',
+                 'clut',
+                 'highlighted',	# (area, button, palette) or None.
+
+                 'interactiveCount',
+
+                 'cmdCount',
+                 'vobuCount',
+                 'maxDepth',
+                 'depthTotal',
+                 'elapsed',
+                 'navTime')
+
+    def __init__(self, machine, navSource):
+        self.machine = machine
+        self.navSource = navSource
+        self.mainItr = iter(machine)
+
+        self.playing = None
+        self.cancelled = False
+        self.still = None
+        self.waiting = False
+
+        self.aspectRatio = None
+        self.audio = -1
+        self.subpicture = -1
+        self.subpictureHide = False
+        self.clut = None
+        self.highlighted = None
+
+        self.interactiveCount = 0
+
+        self.resetStats()
+
+
+    #
+    # Statistics
+    #
+
+    def resetStats(self):
+        """Reset the performance statistics."""
+        self.cmdCount = 0
+        self.vobuCount = 0
+        self.maxDepth = 0
+        self.depthTotal = 0
+        self.elapsed = 0.0
+        self.navTime = 0.0
+
+    def getStats(self):
+        """Return a dictionary with the performance statistics
+        collected since the last reset.
+
+        The dictionary contains the number of commands and VOBUs
+        processed, the machine commands processed per second, the
+        maximum and average scheduler stack depth, and the average
+        time spent in the machine per VOBU, in seconds. Time spent
+        reading navigation packets is reported separately."""
+        machineTime = self.elapsed - self.navTime
+        stats = {'commands': self.cmdCount,
+                 'vobus': self.vobuCount,
+                 'machineTime': machineTime,
+                 'navTime': self.navTime,
+                 'maxDepth': self.maxDepth,
+                 'avgDepth': 0.0,
+                 'opsPerSecond': 0.0,
+                 'timePerVobu': 0.0}
+        if self.cmdCount > 0:
+            stats['avgDepth'] = float(self.depthTotal) / self.cmdCount
+        if machineTime > 0:
+            stats['opsPerSecond'] = self.cmdCount / machineTime
+        if self.vobuCount > 0:
+            stats['timePerVobu'] = machineTime / self.vobuCount
+        return stats
+
+
+    #
+    # Execution
+    #
+
+    def nextCmd(self):
+        """Get the next command from the machine and update the
+        statistics."""
+        cmd = self.mainItr.next()
+
+        self.cmdCount += 1
+        depth = len(self.machine.sched.stack)
+        self.depthTotal += depth
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+
+        return cmd
+
+    def runCmd(self, cmd):
+        """Execute a single command from the machine."""
+        cmd(self)
+        if isinstance(cmd, cmds.PlayVobu):
+            self.readVobu()
+
+    def readVobu(self):
+        """Hand the navigation packet for the current VOBU to the
+        machine and run the confirm/cancel operation."""
+        start = time.time()
+        nav = self.navSource.getNav(*self.playing)
+        self.navTime += time.time() - start
+
+        self.machine.setCurrentNav(nav)
+
+        self.cancelled = False
+        self.runCmd(self.nextCmd())
+        if self.cancelled:
+            return
+
+        self.vobuCount += 1
+
+        # There's no display buffer, so the packet is used for the
+        # buttons right away.
+        def buttonNavWrapper():
+            yield itersched.Call(self.machine.setButtonNav(nav))
+            yield EndInteractive()
+
+        self.machine.callIterator(buttonNavWrapper())
+        while True:
+            cmd = self.nextCmd()
+            if isinstance(cmd, EndInteractive):
+                break
+            self.runCmd(cmd)
+
+    def run(self, maxVobus=None, condition=None):
+        """Run the machine.
+
+        Execution stops when the machine stops, when it reaches an
+        unlimited still frame, after playing `maxVobus` VOBUs (if
+        not `None`), or when the callable `condition` (if not `None`)
+        returns a true value after a VOBU is played. Return `False`
+        if the machine stopped, `True` otherwise."""
+        start = time.time()
+        startVobus = self.vobuCount
+        self.waiting = False
+
+        try:
+            try:
+                while True:
+                    self.runCmd(self.nextCmd())
+
+                    if self.waiting:
+                        break
+                    if self.vobuCount > startVobus:
+                        if maxVobus != None and \
+                           self.vobuCount - startVobus >= maxVobus:
+                            break
+                        if condition != None and condition():
+                            break
+            except StopIteration:
+                return False
+        finally:
+            self.elapsed += time.time() - start
+
+        return True
+
+    def runInteractive(self, itr):
+        """Run `itr` as an interactive operation.
+
+        `itr` must be an `itersched` runnable iterator. Commands are
+        executed until the operation completes or new material is
+        played."""
+        start = time.time()
+
+        def interactiveWrapper(count):
+            yield itersched.Call(itr)
+
+            end = EndInteractive()
+            end.count = count
+            yield end
+
+        self.interactiveCount += 1
+        self.machine.callIterator(interactiveWrapper(self.interactiveCount))
+
+        self.waiting = False
+        try:
+            for cmd in iter(self.nextCmd, None):
+                if isinstance(cmd, EndInteractive) and \
+                   cmd.count == self.interactiveCount:
+                    break
+
+                self.runCmd(cmd)
+
+                if isinstance(cmd, cmds.PlayVobu) or \
+                   isinstance(cmd, cmds.StillFrame):
+                    break
+        finally:
+            self.elapsed += time.time() - start
+
+
+    #
+    # Pipeline Interface
+    #
+
+    def playVobu(self, domain, titleNr, sectorNr):
+        self.playing = (domain, titleNr, sectorNr)
+        self.still = None
+
+    def cancelVobu(self):
+        self.cancelled = True
+
+    def followVobus(self, cmd, lastSectorNr):
+        # Every VOBU goes through the machine.
+        pass
+
+    def setAspectRatio(self, aspectRatio):
+        self.aspectRatio = aspectRatio
+
+    def setAudio(self, phys):
+        self.audio = phys
+
+    def setSubpicture(self, phys, hide):
+        self.subpicture = phys
+        self.subpictureHide = hide
+
+    def setSubpictureClut(self, clut):
+        self.clut = clut
+
+    def highlight(self, area, button, palette):
+        self.highlighted = (area, button, palette)
+
+    def resetHighlight(self):
+        self.highlighted = None
+
+    def stillFrame(self, seconds):
+        self.still = seconds
+        if seconds == None:
+            self.waiting = True
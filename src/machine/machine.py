@@ -19,12 +19,15 @@
 """Main implementation of the DVD virtual machine."""
 
 import sys
+from bisect import bisect_right
 
 import itersched
 from itersched import NoOp, Call, Chain, Restart, restartPoint
 
 import dvdread
 import decode
+import compiler
+import registers
 import disassemble
 import cmds
 
@@ -53,21 +56,29 @@ class Register(decode.Register):
 
 
 class GeneralRegister(Register):
-    __slots__ = ('value',)
+    """A view of a general purpose register in a register file."""
 
-    def __init__(self):
-        self.value = 0
+    __slots__ = ('registers', 'regNr')
+
+    def __init__(self, registers, regNr):
+        self.registers = registers
+        self.regNr = regNr
 
     def getValue(self):
-        return self.value
+        return self.registers.gprm[self.regNr]
 
     def setValue(self, value):
         assert isinstance(value, int)
 
-        self.value = value & 0xffff
+        self.registers.setGeneral(self.regNr, value)
 
         yield NoOp
 
+    def setValueSync(self, value):
+        assert isinstance(value, int)
+
+        self.registers.setGeneral(self.regNr, value)
+
 
 class SystemRegister(Register):
     __slots__ = ('method',)
@@ -82,41 +93,209 @@ class SystemRegister(Register):
         raise MachineException, \
               'Attempt to directly assign a system register'
 
+    def setValueSync(self, value):
+        raise MachineException, \
+              'Attempt to directly assign a system register'
+
 
 def callOperation(method):
     def wrapper(self, *args):
-        yield Chain(self.wrapCallOperation(method, *args))
+        yield Chain(CallFrame(self, method(self, *args), args[-1]))
 
     return wrapper
 
+class CallFrame(object):
+    """The scheduler stack entry of a call operation.
+
+    A call frame saves the machine state at the point of the call,
+    runs the called iterator, and restores the state when the called
+    iterator finishes (i.e., when the DVD resumes). The actual work is
+    done by the machine's 'wrapCallOperation' method. If 'called' is
+    `None`, the frame resumes right away."""
+
+    __slots__ = ('machine',
+                 'rtn',		# Cell to return to, or 0.
+                 'currentNav',
+                 'buttonNav',
+                 'buttonIndexes',
+                 'next')
+
+    def __init__(self, machine, called, rtn):
+        self.machine = machine
+        self.rtn = rtn
+
+        # Save the necessary state.
+        self.currentNav, self.buttonNav = machine.currentNav, \
+                                          machine.buttonNav
+        self.buttonIndexes = machine.buttonIndexes
+
+        self.next = machine.wrapCallOperation(self, called).next
+
+    def __iter__(self):
+        return self
+
+def trackedUpdate(keyFunc):
+    """Decorator for the machine's update methods.
+
+    `keyFunc` is a method returning a value that summarizes all of the
+    machine state the update depends on. If this value didn't change
+    since the last time the update was run, the update is skipped and
+    counted in the machine's `updateStats` dictionary."""
+    def decorator(method):
+        name = method.__name__
+
+        def wrapper(self):
+            key = keyFunc(self)
+            if name in self.updateKeys and self.updateKeys[name] == key:
+                self.updateStats[name] += 1
+                return iter(())
+
+            self.updateKeys[name] = key
+            return method(self)
+
+        wrapper.__name__ = name
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    return decorator
+
+
+class PlaybackContext(object):
+    """A cache for the state retrieval methods of the player objects
+    in a scheduler.
+
+    State retrieval methods (like `currentProgramChain` or `inMenu`)
+    are looked up by name in the restartable instances stacked in the
+    scheduler. The context remembers the method found for every name
+    until the contents of the scheduler stack change."""
+
+    __slots__ = ('sched',
+                 'generation',	# Scheduler generation of the cache.
+                 'providers')	# Method name -> bound method or None.
+
+    def __init__(self, sched):
+        self.sched = sched
+        self.generation = None
+        self.providers = {}
+
+    def getProvider(self, methodName):
+        """Return the bound method with the specified name of the
+        last stacked instance having it, or `None` if no stacked
+        instance has such a method."""
+        if self.generation != self.sched.generation:
+            self.providers = {}
+            self.generation = self.sched.generation
+
+        try:
+            return self.providers[methodName]
+        except KeyError:
+            pass
+
+        provider = None
+        inst = self.sched.findRestartable(methodName)
+        if inst != None:
+            provider = getattr(inst, methodName)
+
+        self.providers[methodName] = provider
+        return provider
+
+    def getValue(self, methodName):
+        """Call the method with the specified name of the last
+        stacked instance having it and return its value. Return `None`
+        if no stacked instance has such a method."""
+        provider = self.getProvider(methodName)
+        if provider == None:
+            return None
+        return provider()
+
+
+class ButtonIndex(object):
+    """A geometry index for the menu buttons in a navigation packet.
+
+    The screen is divided into horizontal bands, in such a way that
+    the set of buttons crossing a band is the same for all lines in
+    the band. Finding the button at a given position requires only a
+    binary search for the band and a scan of the buttons in it."""
+
+    __slots__ = ('starts',	# Sorted list of band start lines.
+                 'bands')	# Tuples of (x1, x2, buttonNr) per band.
+
+    def __init__(self, nav, subpictureType):
+        """Create an index for the buttons in `nav`, using the button
+        areas for the specified subpicture type."""
+        areas = []
+        for i in xrange(1, nav.buttonCount + 1):
+            (x1, y1, x2, y2) = nav.getButton(i, subpictureType).area
+            areas.append((x1, y1, x2, y2, i))
+
+        edges = set()
+        for (x1, y1, x2, y2, i) in areas:
+            edges.add(y1)
+            edges.add(y2 + 1)
+        self.starts = sorted(edges)
+
+        # Buttons are kept in button number order, so that
+        # overlapping buttons are resolved as in a linear search.
+        self.bands = tuple([tuple([(x1, x2, i)
+                                   for (x1, y1, x2, y2, i) in areas
+                                   if y1 <= start <= y2])
+                            for start in self.starts])
+
+    def find(self, x, y):
+        """Return the number of the first button containing the
+        specified point, or `None` if there is no such button."""
+        band = bisect_right(self.starts, y) - 1
+        if band < 0:
+            return None
+
+        for (x1, x2, i) in self.bands[band]:
+            if x1 <= x <= x2:
+                return i
+
+        return None
+
+
 class VirtualMachine(object):
     __slots__ = ('info',
 
                  'sched',
+                 'context',
+                 'compiler',
 
-                 'audio',
-                 'subpicture',
-                 'angle',
-                 'regionCode',
-                 'prefMenuLang',
-                 'prefAudio',
-                 'prefSubpicture',
-                 'parentalCountry',
-                 'parentalLevel',
-                 'aspectRatio',
-                 'videoMode',
-
-                 'currentButton',
-
+                 'registers',
                  'generalRegisters',
                  'systemRegisters',
 
                  'currentNav',
-                 'buttonNav')
+                 'buttonNav',
+                 'buttonIndexes',
+
+                 'updateKeys',
+                 'updateStats',
+
+                 'timeIndex')
+
+    # Machine state kept in the register file.
+    audio = registers.stateProperty(registers.AUDIO)
+    subpicture = registers.stateProperty(registers.SUBPICTURE)
+    angle = registers.stateProperty(registers.ANGLE)
+    regionCode = registers.stateProperty(registers.REGION_CODE)
+    prefMenuLang = registers.stateProperty(registers.MENU_LANG)
+    prefAudio = registers.stateProperty(registers.PREF_AUDIO)
+    prefSubpicture = registers.stateProperty(registers.PREF_SUBPICTURE)
+    parentalCountry = registers.stateProperty(registers.PARENTAL_COUNTRY)
+    parentalLevel = registers.stateProperty(registers.PARENTAL_LEVEL)
+    aspectRatio = registers.stateProperty(registers.ASPECT_RATIO)
+    videoMode = registers.stateProperty(registers.VIDEO_MODE)
+    currentButton = registers.stateProperty(registers.BUTTON)
 
     def __init__(self, info):
         self.info = info
 
+        # Storage for the general purpose registers and the state
+        # system registers are computed from.
+        self.registers = registers.RegisterFile()
+
         # Current logical audio and subpicture streams and current
         # angle. The values follow the conventions of system registers
         # 1, 2, and 3, respectively.
@@ -159,14 +338,47 @@ class VirtualMachine(object):
         self.currentNav = None
         self.buttonNav = None
 
+        # Button geometry indexes for the button navigation packet,
+        # by subpicture type.
+        self.buttonIndexes = {}
+
+        # Dependency keys of the last run of every update method (see
+        # 'trackedUpdate'), and number of skipped updates.
+        self.updateKeys = {}
+        self.updateStats = {'updateAspectRatio': 0,
+                            'updateAudio': 0,
+                            'updateSubpicture': 0,
+                            'updateHighlight': 0}
+
+        # Command compiler. It caches compiled commands for the
+        # whole disc.
+        self.compiler = compiler.CommandCompiler(self)
+
+        # Exact time indexes for position seeking (a
+        # 'timeindex.TimeIndex' object), or None.
+        self.timeIndex = None
+
         # Initialize the scheduler. Playback starts by playing the
         # first play program chain.
-        self.sched = itersched.Scheduler(DiscPlayer(self). \
-                                         jumpToFirstPlay())
+        self.sched = None
+        self.context = None
+        self.setScheduler(itersched.Scheduler(DiscPlayer(self). \
+                                              jumpToFirstPlay()))
 
     def __iter__(self):
         return self.sched
 
+    def setScheduler(self, sched):
+        """Make 'sched' the scheduler running this machine.
+
+        This replaces the whole playback state of the machine, and
+        must only be done before iterating over the machine, or
+        when restoring a checkpoint."""
+        self.sched = sched
+
+        # Cache for the state retrieval methods.
+        self.context = PlaybackContext(sched)
+
     def callIterator(self, itr):
         """Put 'itr' on top of this object's iterator scheduler.
 
@@ -209,6 +421,12 @@ class VirtualMachine(object):
         oldButtonNav = self.buttonNav
         
         self.buttonNav = buttonNav
+        self.buttonIndexes = {}
+        if buttonNav.highlightStatus != dvdread.HLSTATUS_NONE:
+            for subpictureType in (dvdread.SUBPICTURE_PHYS_TYPE_WIDESCREEN,
+                                   dvdread.SUBPICTURE_PHYS_TYPE_4_3):
+                self.buttonIndexes[subpictureType] = \
+                    ButtonIndex(buttonNav, subpictureType)
 
         # Check for forced activate.
         if 1 <= self.buttonNav.forcedActivate <= self.buttonNav.buttonCount:
@@ -243,6 +461,7 @@ class VirtualMachine(object):
         """Clear any navigation packets stored in the machine."""
         self.currentNav = None
         self.buttonNav = None
+        self.buttonIndexes = {}
 
 
     #
@@ -459,35 +678,34 @@ class VirtualMachine(object):
         yield NoOp
 
     # Call and resume
-    def wrapCallOperation(self, method, *args):
+    def wrapCallOperation(self, frame, called):
         """Wrap a call operation.
 
         This method provides the entry and exit code that is shared by
         all four call operations. This wrapper is activated with the
-        '@callOperation' decorator."""
-        # Save the necessary state.
-        currentNav, buttonNav = self.currentNav, self.buttonNav
-
+        '@callOperation' decorator, which saves the state in the call
+        frame 'frame'."""
         # Perform the actual call operation.
-        yield Call(method(self, *args))
+        if called != None:
+            yield Call(called)
 
         # Restore the state.
-        self.currentNav, self.buttonNav = currentNav, buttonNav
-
-        # If a program chain is playing, update the color lookup
-        # table.
-        programChain = self.currentProgramChain()
-        if programChain != None:
-            yield cmds.SetSubpictureClut(programChain.clut)
+        if frame.currentNav == None:
+            # No navigation packets were saved (the frame was restored
+            # from a checkpoint). They will arrive again when playback
+            # continues. Until then, nothing in the playback engine
+            # can be assumed to be up to date.
+            self.clearNavState()
+            self.forgetUpdates()
+        else:
+            self.currentNav, self.buttonNav = frame.currentNav, \
+                                              frame.buttonNav
+            self.buttonIndexes = frame.buttonIndexes
 
-        yield Call(self.updateAspectRatio())
-        yield Call(self.updateAudio())
-        yield Call(self.updateSubpicture())
-        yield Call(self.updateHighlight())
+        yield Call(self.updateAll())
 
-        rtn = args[-1]
-        if rtn != 0:
-            yield Restart.linkCell(rtn)
+        if frame.rtn != 0:
+            yield Restart.linkCell(frame.rtn)
 
     @callOperation
     def callFirstPlay(self, rtn):
@@ -589,13 +807,14 @@ class VirtualMachine(object):
         """Seek to the specified time position.
 
         A time position is specified as playback time in seconds from
-        the beginning of the current program chain. In most cases, and
-        depending on the quality of the time map provided by the disc,
-        an error of 5 to 10 seconds can be expected while doing a time
-        based jump.
-
-        This operation will fail if no time map is available in the
-        current program chain."""
+        the beginning of the current program chain. If the machine's
+        time index has an index for the program chain, the seek is
+        exact. Otherwise, the time map provided by the disc is used,
+        and an error of 5 to 10 seconds can be expected, depending on
+        its quality.
+
+        This operation will fail if neither an index nor a time map
+        are available for the current program chain."""
         yield Restart.seekToPosition(timePosition)
 
 
@@ -606,10 +825,7 @@ class VirtualMachine(object):
     def getValue(self, methodName):
         """Look down the current execution stack for a method with the
         specified name, call it and return its value."""
-        for inst in self.sched.restartable():
-            if hasattr(inst, methodName):
-                return getattr(inst, methodName)()
-        return None
+        return self.context.getValue(methodName)
 
     def currentTitleSet(self):
         """Return the `VideoTitleSet` object currently being played,
@@ -647,15 +863,20 @@ class VirtualMachine(object):
         else:
             return self.getValue('currentVideoAttributes')
 
-    def getCurrentTime(self):
+    def getCurrentTime(self, nav=None):
         """Return the current playback time with respect to the start
-        of the program chain."""
+        of the program chain.
+
+        If 'nav' is not `None`, it is used as the navigation packet
+        being displayed instead of the button navigation packet."""
+        if nav == None:
+            nav = self.buttonNav
+
         cell = self.currentCell()
-        if cell == None or self.buttonNav == None:
+        if cell == None or nav == None:
             return None
 
-        return cell.startSeconds + \
-               self.buttonNav.cellElapsedTime.seconds
+        return cell.startSeconds + nav.cellElapsedTime.seconds
 
 
     def getLangUnit(self, container):
@@ -695,21 +916,22 @@ class VirtualMachine(object):
                                             dvdread. \
                                             SUBPICTURE_PHYS_TYPE_WIDESCREEN)
 
-    def getButtonByPos(self, x, y):
+    def getButtonByPos(self, x, y,
+                       subpictureType=dvdread. \
+                       SUBPICTURE_PHYS_TYPE_WIDESCREEN):
         """Return the index of the button containing the specified
         point, or None if there is no such button."""
         if self.buttonNav == None or \
            self.buttonNav.highlightStatus == dvdread.HLSTATUS_NONE:
             return None
 
-        for i in xrange(1, self.buttonNav.buttonCount + 1):
-            button = self.buttonNav.getButton(i, dvdread. \
-                                              SUBPICTURE_PHYS_TYPE_WIDESCREEN)
-            (x1, y1, x2, y2) = button.area
-            if x1 <= x <= x2 and y1 <= y <= y2:
-                return i
+        try:
+            index = self.buttonIndexes[subpictureType]
+        except KeyError:
+            index = ButtonIndex(self.buttonNav, subpictureType)
+            self.buttonIndexes[subpictureType] = index
 
-        return None
+        return index.find(x, y)
 
 
     #
@@ -763,6 +985,46 @@ class VirtualMachine(object):
     # Pipeline Management and Events
     #
 
+    def forgetUpdates(self):
+        """Forget the state the update methods were last run on.
+
+        The next run of every update method will send its command
+        again. The pipeline manager calls this method whenever it
+        resets its own state."""
+        self.updateKeys = {}
+
+    def aspectRatioKey(self):
+        return (self.currentTitleSet(), self.currentProgramChain(),
+                self.inMenu())
+
+    def audioKey(self):
+        return (self.currentProgramChain(), self.inMenu(), self.audio)
+
+    def subpictureKey(self):
+        return (self.currentTitleSet(), self.currentProgramChain(),
+                self.inMenu(), self.subpicture, self.aspectRatio)
+
+    def highlightKey(self):
+        if self.buttonNav == None:
+            return (None, self.currentButton)
+        return (self.buttonNav, self.buttonNav.highlightStatus,
+                self.currentButton)
+
+    def updateAll(self):
+        """Send all events necessary to bring the playback engine up
+        to date with the machine state."""
+        # If a program chain is playing, update the color lookup
+        # table.
+        programChain = self.currentProgramChain()
+        if programChain != None:
+            yield cmds.SetSubpictureClut(programChain.clut)
+
+        yield Call(self.updateAspectRatio())
+        yield Call(self.updateAudio())
+        yield Call(self.updateSubpicture())
+        yield Call(self.updateHighlight())
+
+    @trackedUpdate(aspectRatioKey)
     def updateAspectRatio(self):
         """Set the aspect ratio based on the current video attributes."""
         attrs = self.currentVideoAttributes()
@@ -775,6 +1037,7 @@ class VirtualMachine(object):
             yield cmds.SetAspectRatio(cmds.ASPECT_RATIO_16_9)
 
 
+    @trackedUpdate(audioKey)
     def updateAudio(self):
         """Send an audio event corresponding to the current logical
         audio stream."""
@@ -805,6 +1068,7 @@ class VirtualMachine(object):
 
         yield cmds.SetAudio(physical)
 
+    @trackedUpdate(subpictureKey)
     def updateSubpicture(self):
         """Send a subpicture event corresponding to the current
         logical subpicture stream."""
@@ -850,6 +1114,7 @@ class VirtualMachine(object):
 
         yield cmds.SetSubpicture(physical, hide)
 
+    @trackedUpdate(highlightKey)
     def updateHighlight(self):
         """Send a highlight event corresponding to the current
         highlighted area."""
@@ -999,7 +1264,7 @@ class VirtualMachine(object):
     def initializeRegisters(self):
         self.generalRegisters = []
         for i in range(16):
-            self.generalRegisters.append(GeneralRegister())
+            self.generalRegisters.append(GeneralRegister(self.registers, i))
 
         self.systemRegisters = []
         for i in range(24):
@@ -1295,9 +1560,17 @@ class ProgramChainPlayer(object):
         time from the beginning of the program chain) with VOBUs in
         the program chain. It can be used to jump to a particular time
         position. Normally, time maps have low accuracy. An error of 5
-        to 10 seconds is to be expected while locating a position."""
-        return self.programChain != None and \
-               self.programChain.hasTimeMap
+        to 10 seconds is to be expected while locating a position.
+
+        An exact index built by the machine's time index counts as a
+        time map."""
+        if self.programChain == None:
+            return False
+
+        timeIndex = self.machine.timeIndex
+        return self.programChain.hasTimeMap or \
+               (timeIndex != None and
+                timeIndex.isIndexed(self.programChain))
 
     @restartPoint
     def playProgramChain(self, programChain, cellNr=1):
@@ -1307,6 +1580,9 @@ class ProgramChainPlayer(object):
         self.programChain = programChain
         self.cell = None
 
+        if self.machine.timeIndex != None:
+            self.machine.timeIndex.request(programChain)
+
         # Update the color lookup table.
         yield cmds.SetSubpictureClut(self.programChain.clut)
 
@@ -1350,33 +1626,44 @@ class ProgramChainPlayer(object):
             yield Call(CellPlayer(self.machine).playCell(self.cell,
                                                          sectorNr))
 
-            # Play the corresponding cell commands.
-            if self.cell.commandNr != 0:
-                yield Call(CommandBlockPlayer(self.machine). \
-                           playBlock(self.programChain.cellCommands,
-                                     self.cell.commandNr))
-
-            if self.cell.blockMode == \
-               dvdread.CELL_BLOCK_MODE_ANGLE_FIRST or \
-               self.cell.blockMode == \
-               dvdread.CELL_BLOCK_MODE_ANGLE_MIDDLE:
-                # We just finished playing a cell in an angle
-                # group. Skip to the end.
-                cellNr += 1
-                nextMode = self.programChain.getCell(cellNr).blockMode
-                while nextMode != dvdread.CELL_BLOCK_MODE_ANGLE_LAST:
-                    cellNr += 1
-                    nextMode = self.programChain.getCell(cellNr).blockMode
-
-            # Progress to the next cell in sequence.
-            cellNr += 1
-
-        if cellNr > self.programChain.cellCount:
+            yield Chain(self.finishCell())
+        elif cellNr > self.programChain.cellCount:
             # No more cells. Play the "tail".
             yield Chain(self.linkTailProgramChain())
         else:
             yield Chain(self.linkCell(cellNr))
 
+    @restartPoint
+    def finishCell(self):
+        """Play the cell commands of the current cell and progress to
+        the next cell."""
+        if self.cell.commandNr != 0:
+            yield Call(CommandBlockPlayer(self.machine). \
+                       playBlock(self.programChain.cellCommands,
+                                 self.cell.commandNr))
+
+        yield Chain(self.linkFollowingCell())
+
+    @restartPoint
+    def linkFollowingCell(self):
+        """Link to the cell following the current one."""
+        cellNr = self.cell.cellNr
+
+        if self.cell.blockMode == \
+           dvdread.CELL_BLOCK_MODE_ANGLE_FIRST or \
+           self.cell.blockMode == \
+           dvdread.CELL_BLOCK_MODE_ANGLE_MIDDLE:
+            # We just finished playing a cell in an angle
+            # group. Skip to the end.
+            cellNr += 1
+            nextMode = self.programChain.getCell(cellNr).blockMode
+            while nextMode != dvdread.CELL_BLOCK_MODE_ANGLE_LAST:
+                cellNr += 1
+                nextMode = self.programChain.getCell(cellNr).blockMode
+
+        # Progress to the next cell in sequence.
+        yield Chain(self.linkCell(cellNr + 1))
+
     @restartPoint
     def linkTopCell(self):
         yield Chain(self.linkCell(self.cell.cellNr))
@@ -1433,7 +1720,12 @@ class ProgramChainPlayer(object):
         yield Call(CommandBlockPlayer(self.machine). \
                    playBlock(self.programChain.postCommands))
 
-        # If there's a next program chain, link to it.
+        yield Chain(self.linkFollowingProgramChain())
+
+    @restartPoint
+    def linkFollowingProgramChain(self):
+        """Link to the program chain following the current one, if
+        any."""
         next = self.programChain.nextProgramChain
         if next != None:
             yield Chain(self.playProgramChain(next))
@@ -1442,28 +1734,47 @@ class ProgramChainPlayer(object):
     def seekToPosition(self, timePosition):
         assert self.hasTimeMap()
 
-        sectorNr = self.programChain.getSectorFromTime(timePosition)
-        cell = self.programChain.getCellFromSector(sectorNr)
-        yield Chain(self.linkCell(cell.cellNr, sectorNr=sectorNr))
+        sectorNr = None
+        if self.machine.timeIndex != None:
+            sectorNr = self.machine.timeIndex. \
+                       getSector(self.programChain, timePosition)
+        if sectorNr == None and self.programChain.hasTimeMap:
+            sectorNr = self.programChain.getSectorFromTime(timePosition)
+
+        if sectorNr != None:
+            cell = self.programChain.getCellFromSector(sectorNr)
+            yield Chain(self.linkCell(cell.cellNr, sectorNr=sectorNr))
+        else:
+            # The time falls in an angle block not covered by the
+            # time index. Start at the beginning of the block.
+            cellNr = 1
+            for i in range(1, self.programChain.cellCount + 1):
+                cell = self.programChain.getCell(i)
+                if cell.startSeconds > timePosition:
+                    break
+                if cell.blockMode == dvdread.CELL_BLOCK_MODE_NORMAL or \
+                   cell.blockMode == dvdread.CELL_BLOCK_MODE_ANGLE_FIRST:
+                    cellNr = i
+            yield Chain(self.linkCell(cellNr))
 
 
 class CommandBlockPlayer(object):
     __slots__ = ('machine',
-                 'decoder',
                  'commands',
+                 'block',	# Compiled version of 'commands'.
                  'commandNr')
 
     def __init__(self, machine):
         self.machine = machine
 
-        self.decoder = decode.CommandDecoder(machine)
-
         self.commands = None
+        self.block = ()
         self.commandNr = 0
 
     @restartPoint
     def playBlock(self, commands, commandNr=1):
         self.commands = commands
+        self.block = self.machine.compiler.compileBlock(commands)
         yield Chain(self.goto(commandNr))
 
     @restartPoint
@@ -1472,10 +1783,11 @@ class CommandBlockPlayer(object):
 
         The command will use the cell commands block as context."""
         self.commands = cellCommands
+        self.block = self.machine.compiler.compileBlock(cellCommands)
 
         #print 'Button command:'
         #print disassemble.disassemble(buttonCmd)
-        yield Call(self.decoder.performCommand(buttonCmd))
+        yield Call(self.machine.compiler.compileCommand(buttonCmd)())
 
     @restartPoint
     def goto(self, commandNr):
@@ -1483,12 +1795,17 @@ class CommandBlockPlayer(object):
 
         self.commandNr = commandNr
 
-        while self.commandNr <= self.commands.count:
+        while self.commandNr <= len(self.block):
             # Actually perform the command.
             #print disassemble.disassemble(self.commands.get(self.commandNr),
             #                              pos=self.commandNr)
-            yield Call(self.decoder.performCommand( \
-                self.commands.get(self.commandNr)))
+            command = self.block[self.commandNr - 1]
+            if command.sync != None:
+                # Register only command, no need to go through the
+                # scheduler.
+                command.sync()
+            else:
+                yield Call(command())
 
             self.commandNr += 1
 
@@ -1615,6 +1932,19 @@ class CellPlayer(object):
 
             nav = self.machine.currentNav
 
+            if self.cell.blockMode == dvdread.CELL_BLOCK_MODE_NORMAL and \
+               nav.highlightStatus == dvdread.HLSTATUS_NONE and \
+               self.sectorNr < self.cell.lastVobuStartSector:
+                # The rest of the cell can be played by just following
+                # the next VOBU pointers. Let the pipeline do that
+                # until it finds something we must look at.
+                follow = cmds.FollowVobus(self.cell.lastVobuStartSector)
+                yield follow
+
+                if follow.lastNav != None:
+                    nav = follow.lastNav
+                    self.sectorNr = follow.lastSectorNr
+
             nextPtr = self.getNextPointer(nav)
             if nextPtr != None:
                 # Progress to the next VOBU.
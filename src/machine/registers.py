@@ -0,0 +1,120 @@
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""Register storage for the DVD virtual machine.
+
+The 16 general purpose registers (GPRMs) are stored in a 16-bit
+array. The machine state the system registers (SPRMs) are computed
+from is stored in a single state vector. Both can be saved and
+restored in constant time through copy-on-write snapshots."""
+
+from array import array
+
+
+# Positions in the state vector.
+AUDIO = 0		# Logical audio stream (SPRM 1).
+SUBPICTURE = 1		# Logical subpicture stream (SPRM 2).
+ANGLE = 2		# Angle (SPRM 3).
+BUTTON = 3		# Highlighted button (SPRM 8, without the shift).
+MENU_LANG = 4		# Preferred menu language (SPRM 0).
+PARENTAL_COUNTRY = 5	# Parental country (SPRM 12).
+PARENTAL_LEVEL = 6	# Parental level (SPRM 13).
+ASPECT_RATIO = 7	# Preferred display aspect ratio (SPRM 14, bits 10-11).
+VIDEO_MODE = 8		# Video mode (SPRM 14, bits 8-9).
+PREF_AUDIO = 9		# Preferred audio language (SPRM 16).
+PREF_SUBPICTURE = 10	# Preferred subpicture language (SPRM 18).
+REGION_CODE = 11	# Region code (SPRM 20).
+
+STATE_SIZE = 12
+
+
+class Snapshot(object):
+    """The saved contents of a register file. The `gprm` and `state`
+    attributes must be treated as read only."""
+
+    __slots__ = ('gprm', 'state')
+
+    def __init__(self, gprm, state):
+        self.gprm = gprm
+        self.state = state
+
+
+class RegisterFile(object):
+    """The register storage of a DVD virtual machine.
+
+    The `gprm` attribute is an array containing the values of the
+    general purpose registers. The `state` attribute is a list
+    containing the state the system registers are computed from,
+    indexed by the position constants in this module. Both must only
+    be modified through the `setGeneral` and `setState` methods, so
+    that snapshots aren't affected by later changes."""
+
+    __slots__ = ('gprm',
+                 'state',
+                 'shared')	# True if a snapshot references the data.
+
+    def __init__(self):
+        self.gprm = array('H', [0] * 16)
+        self.state = [None] * STATE_SIZE
+        self.shared = False
+
+    def unshare(self):
+        """Make private copies of the register data."""
+        self.gprm = array('H', self.gprm)
+        self.state = list(self.state)
+        self.shared = False
+
+    def setGeneral(self, regNr, value):
+        """Set general purpose register `regNr` to `value`."""
+        if self.shared:
+            self.unshare()
+        self.gprm[regNr] = value & 0xffff
+
+    def setState(self, pos, value):
+        """Set position `pos` of the state vector to `value`."""
+        if self.shared:
+            self.unshare()
+        self.state[pos] = value
+
+    def snapshot(self):
+        """Return a `Snapshot` object with the current contents of
+        the register file.
+
+        The register data is not copied, but only shared until the
+        next change."""
+        self.shared = True
+        return Snapshot(self.gprm, self.state)
+
+    def restore(self, snapshot):
+        """Restore the register file to the contents saved in
+        `snapshot`."""
+        self.gprm = snapshot.gprm
+        self.state = snapshot.state
+        self.shared = True
+
+
+def stateProperty(pos, doc=None):
+    """Return a property accessing position `pos` in the state vector
+    of the `registers` attribute of an object."""
+    def get(self):
+        return self.registers.state[pos]
+
+    def set(self, value):
+        self.registers.setState(pos, value)
+
+    return property(get, set, None, doc)
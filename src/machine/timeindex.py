@@ -0,0 +1,321 @@
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""Exact time indexes for the program chains of a disc.
+
+The time maps stored in a disc have a granularity of several seconds,
+and many program chains have no time map at all. A `TimeIndex`
+object builds exact indexes by reading the navigation packet of
+every VOBU in a program chain, following the next VOBU pointers in
+the DSI packets. Indexes are built in a background thread, and can
+be saved to a file, so that they are available right away when
+playing the same disc again."""
+
+import os
+import marshal
+import threading
+import Queue
+from array import array
+from bisect import bisect_right
+
+import dvdread
+
+
+# Version number of the index file format.
+INDEX_VERSION = 2
+
+
+def navTime(nav):
+    """Return the cell elapsed time in navigation packet 'nav', in
+    seconds."""
+    time = nav.cellElapsedTime
+    seconds = (time.hour * 60.0 + time.minute) * 60.0 + time.second
+    if time.frameRate != None:
+        seconds += float(time.frame) / time.frameRate
+    return seconds
+
+def getProgramChainKey(programChain):
+    """Return the key identifying 'programChain' in an index, or
+    `None` if the program chain cannot be indexed.
+
+    Only program chains in video title sets (i.e., not menus) are
+    indexed."""
+    container = programChain.container
+    if not isinstance(container, dvdread.VideoTitleSet):
+        return None
+    return (container.titleSetNr, programChain.programChainNr)
+
+
+class ProgramChainIndex(object):
+    """The time index of a single program chain.
+
+    The index contains the start times of the VOBUs in the program
+    chain (as playback time from the beginning of the program chain,
+    in seconds) in ascending order, and the corresponding sector
+    numbers. Time intervals that are not indexed (gaps) are kept
+    separately."""
+
+    __slots__ = ('times',
+                 'sectors',
+                 'gapStarts',
+                 'gapEnds')
+
+    def __init__(self):
+        self.times = array('d')
+        self.sectors = array('L')
+        self.gapStarts = array('d')
+        self.gapEnds = array('d')
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, seconds, sectorNr):
+        """Add the VOBU at 'sectorNr', starting at time 'seconds', to
+        the index.
+
+        VOBUs must be added in playback order. VOBUs going back in
+        time are ignored."""
+        if len(self.times) > 0 and seconds < self.times[-1]:
+            return
+        self.times.append(seconds)
+        self.sectors.append(sectorNr)
+
+    def appendGap(self, start, end):
+        """Mark the interval from time 'start' to time 'end' as not
+        indexed.
+
+        Gaps must be added in playback order."""
+        if len(self.gapStarts) > 0 and start < self.gapEnds[-1]:
+            # Overlaps the previous gap (e.g., another cell in the
+            # same angle block).
+            self.gapEnds[-1] = max(self.gapEnds[-1], end)
+            return
+        self.gapStarts.append(start)
+        self.gapEnds.append(end)
+
+    def getSector(self, seconds):
+        """Return the sector number of the VOBU playing at time
+        'seconds', or `None` if that time is not indexed."""
+        if len(self.times) == 0:
+            return None
+
+        pos = bisect_right(self.gapStarts, seconds) - 1
+        if pos >= 0 and seconds < self.gapEnds[pos]:
+            return None
+
+        pos = bisect_right(self.times, seconds) - 1
+        if pos < 0:
+            pos = 0
+        return self.sectors[pos]
+
+    def save(self):
+        """Return the contents of the index as marshallable data."""
+        return (self.times.tostring(), self.sectors.tostring(),
+                self.gapStarts.tostring(), self.gapEnds.tostring())
+
+    def restore(self, data):
+        """Set the contents of the index from data returned by
+        'save'."""
+        (times, sectors, gapStarts, gapEnds) = data
+        self.times = array('d', times)
+        self.sectors = array('L', sectors)
+        self.gapStarts = array('d', gapStarts)
+        self.gapEnds = array('d', gapEnds)
+
+
+def buildIndex(reader, programChain):
+    """Build and return a `ProgramChainIndex` for 'programChain', or
+    `None` if nothing in the program chain can be indexed.
+
+    Navigation packets are read with the `dvdread.BlockReader`
+    object 'reader'. Cells in angle blocks are interleaved, and can't
+    be followed using the next VOBU pointers. They are left as gaps
+    in the index."""
+    titleSetNr = programChain.container.titleSetNr
+    index = ProgramChainIndex()
+
+    for cellNr in range(1, programChain.cellCount + 1):
+        cell = programChain.getCell(cellNr)
+        if cell.blockMode != dvdread.CELL_BLOCK_MODE_NORMAL:
+            index.appendGap(cell.startSeconds,
+                            cell.startSeconds + cell.playbackTime.seconds)
+            continue
+
+        sectorNr = cell.firstSector
+        while sectorNr <= cell.lastVobuStartSector:
+            nav = dvdread.NavPacket(reader.read(dvdread.DOMAIN_TITLE,
+                                                titleSetNr, sectorNr))
+            index.append(cell.startSeconds + navTime(nav), sectorNr)
+
+            if nav.nextVobu == None or nav.nextVobu <= 0:
+                break
+            sectorNr += nav.nextVobu
+
+    if len(index) == 0:
+        return None
+    return index
+
+
+class TimeIndex(object):
+    """The time indexes for the program chains of a disc.
+
+    Indexes are requested with the `request` method, and built
+    asynchronously. Until the index for a program chain is available,
+    `getSector` returns `None` for it. Program chains made only of
+    angle blocks are never indexed."""
+
+    __slots__ = ('location',
+                 'fileName',	# Index file, or None.
+
+                 'indexes',	# Program chain indexes by key.
+                 'lock',	# Protects 'indexes' and 'pending'.
+                 'pending',	# Keys of the requested indexes.
+                 'requests',
+                 'thread')
+
+    def __init__(self, location, fileName=None):
+        self.location = location
+        self.fileName = fileName
+
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.requests = Queue.Queue()
+        self.thread = None
+
+        if fileName != None and os.path.exists(fileName):
+            try:
+                self.load()
+            except (IOError, EOFError, ValueError, TypeError):
+                # Unusable file. It will be overwritten.
+                self.indexes = {}
+
+    def getSector(self, programChain, seconds):
+        """Return the sector number of the VOBU playing at time
+        'seconds' (from the beginning of the program chain) in
+        'programChain', or `None` if the program chain isn't indexed
+        yet, or 'seconds' falls in a gap of its index."""
+        index = self.indexes.get(getProgramChainKey(programChain))
+        if index == None:
+            return None
+        return index.getSector(seconds)
+
+    def isIndexed(self, programChain):
+        """Return `True` if and only if the index for 'programChain'
+        is available."""
+        return getProgramChainKey(programChain) in self.indexes
+
+    def request(self, programChain):
+        """Request the index for 'programChain' to be built in the
+        background, if not already available."""
+        key = getProgramChainKey(programChain)
+        if key == None:
+            return
+
+        self.lock.acquire()
+        try:
+            if key in self.indexes or key in self.pending:
+                return
+            self.pending[key] = True
+
+            if self.thread == None:
+                self.thread = threading.Thread(None, self.run,
+                                               'Time indexer')
+                self.thread.setDaemon(True)
+                self.thread.start()
+        finally:
+            self.lock.release()
+
+        self.requests.put((key, programChain))
+
+    def run(self):
+        """Build the requested indexes. Runs in the indexer thread."""
+        reader = dvdread.BlockReader(self.location)
+        while True:
+            (key, programChain) = self.requests.get()
+            try:
+                index = buildIndex(reader, programChain)
+            except (IOError, dvdread.DVDReadError):
+                index = None
+
+            self.lock.acquire()
+            try:
+                del self.pending[key]
+                if index != None:
+                    self.indexes[key] = index
+            finally:
+                self.lock.release()
+
+            if index != None and self.fileName != None:
+                try:
+                    self.save()
+                except (IOError, OSError):
+                    pass
+
+
+    #
+    # Index Files
+    #
+
+    def save(self):
+        """Write all available indexes to the index file."""
+        self.lock.acquire()
+        try:
+            data = dict([(key, index.save())
+                         for (key, index) in self.indexes.items()])
+        finally:
+            self.lock.release()
+
+        dirName = os.path.dirname(self.fileName)
+        if not os.path.isdir(dirName):
+            os.makedirs(dirName)
+
+        # Write to a temporary file first, in order to never leave an
+        # incomplete index file behind.
+        tmpName = '%s.%d.tmp' % (self.fileName, os.getpid())
+        indexFile = open(tmpName, 'wb')
+        try:
+            marshal.dump((INDEX_VERSION, data), indexFile)
+        finally:
+            indexFile.close()
+        os.rename(tmpName, self.fileName)
+
+    def load(self):
+        """Read the indexes in the index file."""
+        indexFile = open(self.fileName, 'rb')
+        try:
+            (version, data) = marshal.load(indexFile)
+        finally:
+            indexFile.close()
+
+        if version != INDEX_VERSION:
+            raise ValueError, "Unsupported index version %d" % version
+
+        for (key, indexData) in data.items():
+            index = ProgramChainIndex()
+            index.restore(indexData)
+            if len(index) > 0:
+                self.indexes[key] = index
+
+
+def getIndexFileName(fingerprint):
+    """Return the name of the index file, in the user's cache
+    directory, for the disc with fingerprint 'fingerprint' (see
+    `dvdread.infocache.getFingerprint`)."""
+    return os.path.join(dvdread.infocache.getCacheBase(), 'timeindex',
+                        fingerprint)
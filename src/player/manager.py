@@ -25,10 +25,16 @@ import gst
 
 import itersched
 import tasklet
+import tracebuf
 
 import dvdread
 import events
 import machine
+from machine import checkpoint
+
+
+# Number of events kept in the manager's trace buffer.
+TRACE_SIZE = 2000
 
 
 def interactiveOp(method):
@@ -115,6 +121,14 @@ class Manager(object):
     the VOBU. To skip the VOBU, the machine can send the `cancelVobu`
     operation. Otherwise, it should send a `DoNothing` operation.
 
+    During linear playback, the machine can send a `FollowVobus`
+    operation after accepting a VOBU. The source element then plays
+    the following VOBUs by itself, without calling back into Python
+    for every one of them, until it reaches the end of the approved
+    range, or finds a VOBU with highlight information. It then
+    reports the last VOBU played through its follow-end signal and
+    asks for more work as usual.
+
     One important task of this class is to determine, in an automatic
     and reliable way, when a flush operation should be triggered. The
     problem is that a flush is only necessary when the machine
@@ -149,6 +163,7 @@ class Manager(object):
                  'interactiveMode',
 
                  'vobuReadReturn',
+                 'followCmd',
 
                  'segmentStart',
                  'segmentStop',
@@ -160,7 +175,9 @@ class Manager(object):
                  'stillCancelCond',
 
                  'navSequence',
-                 'navList')
+                 'navList',
+
+                 'trace')
 
 
     def __init__(self, machine, pipeline):
@@ -179,6 +196,7 @@ class Manager(object):
         # Connect our signal handlers to the source object.
         self.src.connect('vobu-read', self.vobuRead)
         self.src.connect('vobu-header', self.vobuHeader)
+        self.src.connect('follow-end', self.followEnd)
         self.src.connect('do-seek', self.doSeek)
 
         # Connect a handler to the pipeline's message bus, to tell
@@ -210,6 +228,10 @@ class Manager(object):
         # True when executing commands interactively.
         self.interactiveMode = False
 
+        # The `FollowVobus` command being executed by the source, or
+        # None.
+        self.followCmd = None
+
         # Start and stop times of the current segment. The current
         # segment covers the current VOBU and all preceeding VOBUs
         # contiguous in time.
@@ -242,6 +264,12 @@ class Manager(object):
         # corresponding nav packet.
         self.navList = []
 
+        # A trace of the recent machine commands, scheduler
+        # operations and flush transitions, that can be dumped when
+        # debugging.
+        self.trace = tracebuf.TraceBuffer(TRACE_SIZE)
+        self.machine.sched.trace = self.trace
+
     def sendEvent(self, event):
         """Send `event` down the pipeline."""
         if not self.srcPad.push_event(event):
@@ -278,6 +306,7 @@ class Manager(object):
             for cmd in self.mainItr:
                 # Execute the command.
                 gst.log("Running command %s" % str(cmd))
+                self.trace.record('cmd', cmd.getTraceKey())
                 cmd(self)
 
                 if self.vobuReadReturn:
@@ -285,6 +314,7 @@ class Manager(object):
         except:
             # We had an exception in the playback code.
             traceback.print_exc()
+            self.trace.dump(sys.stderr)
             sys.exit(1)
 
         gst.log("VOBU read end")
@@ -297,8 +327,10 @@ class Manager(object):
         # Release the lock set by the playVobu operation.
         self.lock.release()
 
-        # Create a nav packet object.
-        nav = dvdread.NavPacket(buf.data)
+        # Create a nav packet object. It wraps the buffer memory
+        # directly, without copying it. The buffer holds only the nav
+        # block.
+        nav = dvdread.NavPacket(buf)
 
         # Hand the packet to the machine.
         self.machine.setCurrentNav(nav)
@@ -349,6 +381,72 @@ class Manager(object):
             # animated background.
             self.sendEvent(events.stillFrame(start, stop))
 
+    @synchronized
+    def followEnd(self, src, buf):
+        """The signal handler for the source's follow-end signal."""
+        gst.log("follow end")
+
+        cmd = self.followCmd
+        self.followCmd = None
+        if cmd == None or self.cleaning:
+            # The machine is not waiting for this anymore.
+            return
+
+        nav = dvdread.NavPacket(buf)
+
+        # The source maintained the segment while following.
+        self.segmentStart = self.getTimeProperty('segment-start')
+        self.segmentStop = self.getTimeProperty('segment-stop')
+
+        cmd.lastNav = nav
+        cmd.lastSectorNr = src.get_property('vobu-offset')
+        self.machine.setCurrentNav(nav)
+
+    def getTimeProperty(self, name):
+        """Return the value of time property 'name' of the source
+        element, or `None` if not set."""
+        value = self.src.get_property(name)
+        if value == gst.CLOCK_TIME_NONE:
+            return None
+        return value
+
+    def setTimeProperty(self, name, value):
+        """Set time property 'name' of the source element to 'value',
+        which may be `None`."""
+        if value == None:
+            value = gst.CLOCK_TIME_NONE
+        self.src.set_property(name, value)
+
+    @synchronized
+    def getFollowedNav(self):
+        """Return the navigation packet of the last VOBU played by the
+        source while following VOBUs by itself, or `None` if the
+        source is not following."""
+        if self.followCmd == None:
+            return None
+
+        buf = self.src.get_property('last-header')
+        if buf == None:
+            return None
+        return dvdread.NavPacket(buf)
+
+
+    #
+    # Checkpoints
+    #
+
+    @synchronized
+    def takeCheckpoint(self):
+        """Return a checkpoint of the machine, or `None` if the
+        machine is not at a point where a checkpoint can be taken."""
+        if self.flushing:
+            return None
+
+        try:
+            return checkpoint.save(self.machine)
+        except checkpoint.CheckpointError:
+            return None
+
 
     #
     # Interactive Operation Support
@@ -360,6 +458,9 @@ class Manager(object):
         interactive operations stored in the pipeline."""
         __slots__ = ('count')
 
+        def getTraceKey(self):
+            return ('EndInteractive', self.count)
+
 
     def collectCmds(self):
         """Collect commands for the machine iterator until a PlayVobu,
@@ -418,6 +519,13 @@ class Manager(object):
             # request.
             return
 
+        # While the source follows VOBUs by itself, the machine
+        # doesn't see the navigation packets. Operations must work on
+        # the VOBU actually playing.
+        nav = self.getFollowedNav()
+        if nav != None:
+            self.machine.setCurrentNav(nav)
+
         def interactiveWrapper(count):
             """Call the iterator and send an `EndInteractive`
             operation at the end."""
@@ -428,6 +536,7 @@ class Manager(object):
             yield end
 
         gst.debug("run interactive")
+        self.trace.record('interact', self.interactiveCount + 1)
 
         self.interactiveCount += 1
 
@@ -444,6 +553,7 @@ class Manager(object):
             self.interactiveMode = True
             for cmd in cmds:
                 gst.log("Running command %s interactively" % str(cmd))
+                self.trace.record('cmd', cmd.getTraceKey())
                 cmd(self)
             self.interactiveMode = False
         else:
@@ -454,6 +564,7 @@ class Manager(object):
 
             # Don't allow interactive operations until the flush
             # completes.
+            self.trace.record('flush', 'requested')
             self.flushing = True
             self.cleaning = True
 
@@ -462,9 +573,14 @@ class Manager(object):
             self.button = None
             self.palette = None
 
+            # The machine must send its state again.
+            self.machine.forgetUpdates()
+
             self.segmentStart = None
             self.segmentStop = None
 
+            self.followCmd = None
+
             # If a still is being displayed, cancel it.
             while self.showingStill:
                 self.stillCancelCond.wait()
@@ -484,12 +600,14 @@ class Manager(object):
         gst.debug("flushing")
             
         origState = self.pipeline.getState()
+        self.trace.record('flush', 'start')
 
         if origState == gst.STATE_PLAYING:
             # Pause the pipeline.
             self.pipeline.setState(gst.STATE_PAUSED)
             yield tasklet.WaitForSignal(self.pipeline, 'state-paused')
             tasklet.get_event()
+            self.trace.record('flush', 'paused')
 
         self.pipeline.prepareFlush()
 
@@ -513,16 +631,21 @@ class Manager(object):
         self.pipeline.closeFlush()
             
         self.flushing = False
+        self.trace.record('flush', 'done')
         gst.debug("flush completed")
 
     @synchronized
     def doSeek(self, src, event):
         gst.debug("seek")
+        self.trace.record('seek')
 
         # Drop the cleaning flag thus letting the source play material
         # from the machine again.
         self.cleaning = False
 
+        # The source stopped following VOBUs.
+        self.followCmd = None
+
 
     #
     # Button Navigation Packet Handling
@@ -562,6 +685,7 @@ class Manager(object):
         self.machine.callIterator(interactiveWrapper())
         for cmd in self.machine:
             gst.log("Running command %s for button nav" % str(cmd))
+            self.trace.record('cmd', cmd.getTraceKey())
             cmd(self)
             if isinstance(cmd, self.EndInteractive):
                 break
@@ -579,6 +703,7 @@ class Manager(object):
         if self.lastDomain != domain:
             self.lastDomain = domain
             self.resetHighlight()
+            self.machine.forgetUpdates()
 
         self.src.set_property('domain', domain)
         self.src.set_property('title', titleNr)
@@ -600,6 +725,24 @@ class Manager(object):
 
         self.src.set_property('cancel-vobu', True)
 
+    def followVobus(self, cmd, lastSectorNr):
+        """Let the source element follow the next VOBU pointers by
+        itself, up to the VOBU starting at 'lastSectorNr'.
+
+        The results are stored in 'cmd' when the source stops
+        following."""
+        gst.log("follow VOBUs")
+
+        self.setTimeProperty('segment-start', self.segmentStart)
+        self.setTimeProperty('segment-stop', self.segmentStop)
+        self.src.set_property('audio-stream', self.audio)
+        self.src.set_property('follow-end', lastSectorNr)
+
+        self.followCmd = cmd
+
+        # The source will call vobuRead again when it's done.
+        self.vobuReadReturn = True
+
     def setAspectRatio(self, aspectRatio):
         """Set the display aspect ratio to `aspectRatio`."""
         gst.debug("set aspect ratio")
@@ -620,6 +763,7 @@ class Manager(object):
         if self.audio == phys:
             return
         self.audio = phys
+        self.src.set_property('audio-stream', self.audio)
 
         self.sendEvent(events.audio(self.audio))
 
@@ -721,6 +865,7 @@ class Manager(object):
             self.lock.acquire()
 
             if self.flushing:
+                self.trace.record('still', 'cancelled')
                 self.stillCancelCond.notify()
 
                 # The machine should not be called again until a flush
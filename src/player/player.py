@@ -25,6 +25,7 @@ import tasklet
 
 import dvdread
 import machine
+from machine import timeindex, checkpoint
 import manager
 from manager import interactiveOp
 import pipeline
@@ -32,6 +33,10 @@ import pipeline
 from itersched import NoOp, Call
 
 
+# Interval between machine checkpoints, in milliseconds.
+CHECKPOINT_INTERVAL = 10000
+
+
 class DVDPlayer(gobject.GObject):
     """Main interface to interactively control the DVD playback system
     and query its state."""
@@ -40,7 +45,10 @@ class DVDPlayer(gobject.GObject):
                  'machine',
                  'pipeline',
                  'manager',
-                 'src')
+                 'src',
+
+                 'checkpointFileName',
+                 'checkpointSourceId')
 
     __gsignals__ = {
         'stopped' : (gobject.SIGNAL_RUN_LAST,
@@ -52,13 +60,40 @@ class DVDPlayer(gobject.GObject):
     def __init__(self, options):
         super(DVDPlayer, self).__init__()
 
-        # Create an info object for the DVD.
-        self.info = dvdread.DVDInfo(options.location)
+        # Identify the disc. Reading the fingerprint takes a few
+        # reads from the drive, so it is done only once for all files
+        # kept for the disc in the user's cache directory.
+        try:
+            fingerprint = dvdread.infocache.getFingerprint(options.location)
+        except (IOError, dvdread.DVDReadError):
+            fingerprint = None
+
+        # Create an info object for the DVD. Information files are
+        # cached on disk.
+        self.info = dvdread.openDVDInfo(options.location,
+                                        fingerprint=fingerprint)
 
         # Create the machine, pipeline and manager objects. All
         # objects will be set into motion as soon as the source object
-        # in the pipeline is activated.
-        self.machine = machine.VirtualMachine(self.info)
+        # in the pipeline is activated. If possible, the machine
+        # continues from where the disc was left the last time.
+        self.checkpointFileName = None
+        if fingerprint != None:
+            self.checkpointFileName = \
+                checkpoint.getCheckpointFileName(fingerprint)
+        self.machine = None
+        if options.resume:
+            self.machine = self.restoreMachine()
+        if self.machine == None:
+            self.machine = machine.VirtualMachine(self.info)
+
+        # Build exact time indexes for position seeking.
+        indexFileName = None
+        if fingerprint != None:
+            indexFileName = timeindex.getIndexFileName(fingerprint)
+        self.machine.timeIndex = timeindex.TimeIndex(options.location,
+                                                     indexFileName)
+
         self.pipeline = pipeline.Pipeline(options)
         self.manager = manager.Manager(self.machine, self.pipeline)
 
@@ -70,6 +105,14 @@ class DVDPlayer(gobject.GObject):
         # Set the region.
         self.setRegion(int(options.region))
 
+        # Take checkpoints periodically, to be able to continue
+        # playback after a restart or a crash.
+        self.checkpointSourceId = None
+        if self.checkpointFileName != None:
+            self.checkpointSourceId = \
+                gobject.timeout_add(CHECKPOINT_INTERVAL,
+                                    self.saveCheckpoint)
+
     def getDVDInfo(self):
         return self.info
 
@@ -77,6 +120,40 @@ class DVDPlayer(gobject.GObject):
         return self.pipeline.getVideoSink()
 
 
+    #
+    # Checkpoints
+    #
+
+    def restoreMachine(self):
+        """Return a machine restored from the checkpoint file of the
+        disc, or `None` if there is no usable checkpoint."""
+        if self.checkpointFileName == None:
+            return None
+
+        try:
+            return checkpoint.restore(self.info,
+                                      checkpoint.load(self.checkpointFileName))
+        except (IOError, EOFError, ValueError, TypeError, KeyError,
+                IndexError, AttributeError, dvdread.DVDReadError,
+                checkpoint.CheckpointError):
+            # No checkpoint or an unusable one. Just start from the
+            # beginning.
+            return None
+
+    def saveCheckpoint(self):
+        """Write a checkpoint of the machine to the checkpoint file of
+        the disc, if one can be taken right now."""
+        data = self.manager.takeCheckpoint()
+        if data != None:
+            try:
+                checkpoint.dump(data, self.checkpointFileName)
+            except (IOError, OSError):
+                pass
+
+        # Keep the timeout active.
+        return True
+
+
     #
     # Player Configuration
     #
@@ -130,6 +207,12 @@ class DVDPlayer(gobject.GObject):
             yield tasklet.WaitForSignal(self.pipeline, 'state-playing')
             tasklet.get_event()
 
+        # Save the position for the next time.
+        if self.checkpointSourceId != None:
+            gobject.source_remove(self.checkpointSourceId)
+            self.checkpointSourceId = None
+            self.saveCheckpoint()
+
         self.stopMachine()
 
         # Wait for the pipeline to be paused.
@@ -178,18 +261,18 @@ class DVDPlayer(gobject.GObject):
     #
 
     def getCurrentTime(self):
-        return self.machine.getCurrentTime()
+        return self.machine.getCurrentTime(self.manager.getFollowedNav())
 
     def canPositionSeek(self):
         return self.machine.canPositionSeek()
 
     @interactiveOp
-    def seekToPosition(self, timePostion):
+    def seekToPosition(self, timePosition):
         yield Call(self.machine.seekToPosition(timePosition))
 
     @interactiveOp
     def seekToPositionRelative(self, seconds):
-        currentTime = self.machine.getCurrentTime()
+        currentTime = self.getCurrentTime()
         if currentTime != None:
             yield Call(self.machine. \
                        seekToPosition(currentTime + seconds))
@@ -144,6 +144,12 @@ def main():
                          help=_("set pixel aspect ratio to ASPECT "
                                 "(default 1/1)"),
                          default="1/1")    
+    optParser.add_option("--no-resume", dest="resume",
+                         action="store_false",
+                         help=_("start playing from the beginning of the "
+                                "disc, instead of from where it was "
+                                "left the last time"),
+                         default=True)
     optParser.add_option("--plugins", dest="plugins",
                          metavar="PLUGINS",
                          help=_("Enable Seamless plugins listed in "
@@ -185,6 +191,10 @@ def main():
         message.errorDialog(str(e), secMsg)
         return 1
 
+    # Dump the player's trace buffer on SIGUSR1. This helps
+    # diagnosing hangs.
+    playerObj.manager.trace.dumpOnSignal()
+
     appInstance = mainui.MainUserInterface(playerObj, options)
 
     # Get into the main loop.
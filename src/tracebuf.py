@@ -0,0 +1,98 @@
+# Seamless DVD Player
+# Copyright (C) 2004-2006 Martin Soto <martinsoto@users.sourceforge.net>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
+# USA
+
+"""A fixed size, in-memory trace of recent events.
+
+Recording an event only stores a reference to the event data
+together with a time stamp. Data is converted to text only when the
+trace is dumped, which makes it cheap enough to keep tracing always
+active."""
+
+import sys
+import time
+import signal
+
+
+class TraceBuffer(object):
+    """A ring buffer keeping the last 'size' events recorded.
+
+    Events are recorded as a kind (a short string) and a data object,
+    that will be converted to a string with 'str' when dumping. Data
+    objects shouldn't be modified after recording them. Record
+    immutable descriptions (strings, numbers, or tuples of them)
+    rather than live objects, which would show their state at dump
+    time, and would be kept alive by the buffer.
+
+    Events can be recorded from several threads. No locking is done,
+    so a concurrent recording may occasionally overwrite an event."""
+
+    __slots__ = ('entries',
+                 'size',
+                 'count')	# Total number of events recorded.
+
+    def __init__(self, size=1000):
+        self.entries = [None] * size
+        self.size = size
+        self.count = 0
+
+    def record(self, kind, data=None):
+        """Record an event of kind 'kind', with data object 'data'."""
+        self.entries[self.count % self.size] = (time.time(), kind, data)
+        self.count += 1
+
+    def clear(self):
+        """Remove all events from the buffer."""
+        self.entries = [None] * self.size
+        self.count = 0
+
+    def getEvents(self):
+        """Return a list of `(timeStamp, kind, data)` tuples with the
+        events in the buffer, oldest first."""
+        pos = self.count % self.size
+        return [entry for entry in self.entries[pos:] + self.entries[:pos]
+                if entry != None]
+
+    def dump(self, out=sys.stderr):
+        """Print the events in the buffer to file 'out'.
+
+        Time stamps are printed in seconds relative to the last
+        event."""
+        events = self.getEvents()
+        print >> out, "Trace buffer: last %d of %d events" % \
+              (len(events), self.count)
+        if events == []:
+            return
+
+        last = events[-1][0]
+        for (timeStamp, kind, data) in events:
+            if data is None:
+                print >> out, "%12.6f %-10s" % (timeStamp - last, kind)
+            else:
+                print >> out, "%12.6f %-10s %s" % (timeStamp - last, kind,
+                                                   str(data))
+
+    def dumpOnSignal(self, signum=signal.SIGUSR1, out=sys.stderr):
+        """Install a handler that dumps the buffer to file 'out'
+        whenever the process receives signal 'signum'.
+
+        Python signal handlers run in the main thread, so this must be
+        called from it."""
+        def handler(signum, frame):
+            self.dump(out)
+
+        signal.signal(signum, handler)